@@ -64,6 +64,36 @@ class AppBuilder:
 
   # --------------------------------------------------------------------------------
 
+  def install_ingest(self):
+
+    from .ingest.analyzer import configure_document_analyzer
+
+    configure_document_analyzer(self.app.config_obj)
+
+    return self
+
+  # --------------------------------------------------------------------------------
+
+  def install_search(self):
+
+    from .query.answer_cache import configure_answer_cache
+    from .query.classify import configure_intent_classifier
+    from .query.context import configure_context
+    from .query.matrix import configure_embedding_snapshot
+    from .query.routing import configure_route_budgets
+    from .query.vector_index import configure_vector_storage
+
+    configure_answer_cache(self.app.config_obj)
+    configure_intent_classifier(self.app.config_obj)
+    configure_context(self.app.config_obj)
+    configure_embedding_snapshot(self.app.config_obj)
+    configure_route_budgets(self.app.config_obj)
+    configure_vector_storage(self.app.config_obj)
+
+    return self
+
+  # --------------------------------------------------------------------------------
+
   def install_blueprint(self):
 
     from .blueprint import install_blueprint
@@ -99,6 +129,8 @@ def create_app():
     .configure_logging() \
     .configure_server() \
     .install_db() \
+    .install_ingest() \
+    .install_search() \
     .install_blueprint() \
     .install_cli() \
     .app
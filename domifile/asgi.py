@@ -0,0 +1,92 @@
+# domifile/asgi.py
+"""
+  ASGI server of the query API, on the async query path (query/aio.py):
+
+    uvicorn domifile.asgi:app
+
+  One process serves many questions at once, waiting on OpenAI and the database without a
+  thread per request.  Other routes remain with the Flask app.
+"""
+
+# Load env settings before importing anything.
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+
+def create_asgi_app():
+  from .app import create_app
+  from .blueprint import server_sent_event
+  from .db.aio import close_async_pool, configure_async_database, open_async_pool
+  from .query.aio import answer_question_async, stream_answer_async
+  from .query.classify import get_intent_classifier
+
+  # The Flask app configures logging, the synchronous database and search, which the async
+  # path shares (the answer cache, structured answers).
+  config = create_app().config_obj
+  configure_async_database(config)
+
+  @asynccontextmanager
+  async def lifespan(app):
+    await open_async_pool()
+    classifier = get_intent_classifier()
+    if classifier is not None:
+      await asyncio.to_thread(classifier.load)
+    yield
+    await close_async_pool()
+
+  app = FastAPI(lifespan=lifespan)
+
+  async def question_of(request):
+    try:
+      body = await request.json()
+    except ValueError:
+      body = None
+    if not body:
+      return None, JSONResponse({"error": "Missing JSON body"}, status_code=400)
+    question = body.get("question")
+    if not question:
+      return None, JSONResponse({"error": "Missing question"}, status_code=400)
+    return question, None
+
+  @app.post("/api/ask")
+  async def ask(request: Request):
+    question, error = await question_of(request)
+    if error:
+      return error
+    return await answer_question_async(question)
+
+  @app.post("/api/ask/stream")
+  async def ask_stream(request: Request):
+    question, error = await question_of(request)
+    if error:
+      return error
+
+    async def generate():
+      try:
+        async for event, data in stream_answer_async(question):
+          yield server_sent_event(event, data)
+      except Exception:
+        logger.exception("streamed answer failed")
+        yield server_sent_event("error", {"error": "An unexpected error occurred"})
+
+    return StreamingResponse(generate(),
+                             media_type="text/event-stream",
+                             headers={
+                                 "Cache-Control": "no-cache",
+                                 "X-Accel-Buffering": "no",
+                             })
+
+  return app
+
+
+app = create_asgi_app()
@@ -1,11 +1,16 @@
 # domifile/blueprint.py
 
-from flask import Blueprint, jsonify, request, g
+import json
+import logging
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+logger = logging.getLogger(__name__)
 
 
 def install_blueprint(app):
   #from auth.decorators import require_auth
-  from domifile.query import answer_question
+  from domifile.query import answer_question, stream_answer
 
   bp = Blueprint("domifile", __name__, url_prefix="/api")
 
@@ -43,6 +48,42 @@ def install_blueprint(app):
 
     return jsonify(answer)
 
+  # ------------------------------------------------------------
+  # POST /api/ask/stream
+  # ------------------------------------------------------------
+
+  @bp.route("/ask/stream", methods=["POST"])
+  def ask_stream():
+    """ As /ask, but as server-sent events; see query.stream_answer. """
+    body = request.get_json(silent=True)
+    if not body:
+      return jsonify(error="Missing JSON body"), 400
+
+    question = body.get("question")
+    if not question:
+      return jsonify(error="Missing question"), 400
+
+    def generate():
+      try:
+        for event, data in stream_answer(question):
+          yield server_sent_event(event, data)
+      except Exception:
+        # Headers are sent; report the failure in the stream.
+        logger.exception("streamed answer failed")
+        yield server_sent_event("error", {"error": "An unexpected error occurred"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Stop nginx from buffering the stream.
+        })
+
   # --------------------------------------------------------------------
 
   app.register_blueprint(bp)
+
+
+def server_sent_event(event, data):
+  return f"event: {event}\ndata: {json.dumps(data)}\n\n"
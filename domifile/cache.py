@@ -0,0 +1,249 @@
+# domifile/cache.py
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_LRU_SIZE = 4096
+RESPONSE_LRU_SIZE = 1024
+RESPONSE_LRU_TTL = 24 * 60 * 60  # seconds
+RESPONSE_DB_TTL = 30 * 24 * 60 * 60  # seconds
+# Expired responses are deleted from the database at most this often, per process.
+RESPONSE_DB_PURGE_INTERVAL = 60 * 60  # seconds
+
+
+class LRUCache:
+  """ Thread-safe, size-bounded LRU map, with optional time-to-live. """
+
+  def __init__(self, max_size, *, ttl=None):
+    self.max_size = max_size
+    self.ttl = ttl
+    self._items = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key, default=None):
+    with self._lock:
+      entry = self._items.get(key)
+      if entry is None:
+        return default
+      value, expires_at = entry
+      if expires_at is not None and expires_at < time.monotonic():
+        del self._items[key]
+        return default
+      self._items.move_to_end(key)
+      return value
+
+  def put(self, key, value):
+    expires_at = time.monotonic() + self.ttl if self.ttl else None
+    with self._lock:
+      self._items[key] = (value, expires_at)
+      self._items.move_to_end(key)
+      while len(self._items) > self.max_size:
+        self._items.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._items.clear()
+
+  def __len__(self):
+    return len(self._items)
+
+
+class CacheStats:
+  """ Thread-safe hit/miss counters, by tier. """
+
+  def __init__(self):
+    self._counts = Counter()
+    self._lock = threading.Lock()
+
+  def count(self, tier, hits, misses):
+    with self._lock:
+      self._counts[f"{tier}_hits"] += hits
+      self._counts[f"{tier}_misses"] += misses
+
+  def snapshot(self):
+    with self._lock:
+      return dict(self._counts)
+
+
+def text_hash(text):
+  """ Hash of text, insensitive to differences in whitespace. """
+  normalized = re.sub(r"\s+", " ", text).strip()
+  return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+  """
+    Two-tier cache of embeddings keyed by (model, normalized text hash):
+      * memory - an in-process LRU, for query-time embeddings
+      * db - the embedding_cache table, shared by all processes, for ingest
+  """
+
+  def __init__(self, max_size=EMBEDDING_LRU_SIZE):
+    self.memory = LRUCache(max_size)
+    self.stats = CacheStats()
+
+  def get_many(self, model, keys, *, persistent):
+    """ Look up embeddings by text hash.  Returns a dict of the keys found. """
+    found = {}
+    for key in keys:
+      embedding = self.memory.get((model, key))
+      if embedding is not None:
+        found[key] = embedding
+    self.stats.count("memory", len(found), len(keys) - len(found))
+
+    missing = [key for key in keys if key not in found]
+    if persistent and missing:
+      from_db = self._db_get_many(model, missing)
+      self.stats.count("db", len(from_db), len(missing) - len(from_db))
+      for key, embedding in from_db.items():
+        self.memory.put((model, key), embedding)
+      found.update(from_db)
+
+    return found
+
+  def put_many(self, model, embeddings_by_key, *, persistent):
+    for key, embedding in embeddings_by_key.items():
+      self.memory.put((model, key), embedding)
+    if persistent and embeddings_by_key:
+      self._db_put_many(model, embeddings_by_key)
+
+  @staticmethod
+  def _db_get_many(model, keys):
+    from sqlalchemy import select
+    from domifile.db import db_transaction
+    from domifile.models import EmbeddingCacheEntry
+
+    with db_transaction(EmbeddingCacheEntry) as db_session:
+      rows = db_session.execute(
+          select(EmbeddingCacheEntry.text_hash, EmbeddingCacheEntry.embedding).where(
+              EmbeddingCacheEntry.model == model, EmbeddingCacheEntry.text_hash.in_(keys))).all()
+      return {row.text_hash: list(row.embedding) for row in rows}
+
+  @staticmethod
+  def _db_put_many(model, embeddings_by_key):
+    from sqlalchemy.dialects.postgresql import insert
+    from domifile.db import db_transaction
+    from domifile.models import EmbeddingCacheEntry
+
+    # Concurrent workers may race to store the same text; the first one wins.
+    with db_transaction(EmbeddingCacheEntry) as db_session:
+      db_session.execute(
+          insert(EmbeddingCacheEntry).values([{
+              "model": model,
+              "text_hash": key,
+              "embedding": embedding,
+          } for key, embedding in embeddings_by_key.items()]).on_conflict_do_nothing())
+
+
+class ResponseCache:
+  """
+    Two-tier cache of LLM responses keyed by (model, caller-supplied version tag, prompt):
+      * memory - an in-process LRU whose entries expire
+      * db - the response_cache table, shared by all processes, whose entries expire after
+        db_ttl seconds.  Expired entries are purged periodically as responses are stored.
+    Changing the version tag invalidates a caller's entries.
+  """
+
+  def __init__(self, max_size=RESPONSE_LRU_SIZE, ttl=RESPONSE_LRU_TTL, db_ttl=RESPONSE_DB_TTL):
+    self.memory = LRUCache(max_size, ttl=ttl)
+    self.db_ttl = db_ttl
+    self.stats = CacheStats()
+    self._next_purge = 0
+    self._purge_lock = threading.Lock()
+
+  @staticmethod
+  def key_for(model, version, prompt):
+    return hashlib.sha256(f"{model}\0{version}\0{prompt}".encode("utf-8")).hexdigest()
+
+  def get(self, key, *, persistent):
+    response = self.memory.get(key)
+    self.stats.count("memory", int(response is not None), int(response is None))
+    if response is None and persistent:
+      response = self._db_get(key)
+      self.stats.count("db", int(response is not None), int(response is None))
+      if response is not None:
+        self.memory.put(key, response)
+    return response
+
+  def put(self, key, response, *, model, version, persistent):
+    self.memory.put(key, response)
+    if persistent:
+      self._db_put(key, response, model=model, version=version)
+      self._purge_periodically()
+
+  def _purge_periodically(self):
+    with self._purge_lock:
+      if time.monotonic() < self._next_purge:
+        return
+      self._next_purge = time.monotonic() + RESPONSE_DB_PURGE_INTERVAL
+    try:
+      purged = self.purge_expired()
+      logger.debug(f"response cache: {purged} expired responses purged")
+    except Exception:
+      logger.exception("response cache purge failed")
+
+  @staticmethod
+  def _db_get(key):
+    from domifile.db import db_transaction
+    from domifile.models import ResponseCacheEntry
+
+    with db_transaction(ResponseCacheEntry) as db_session:
+      entry = db_session.get(ResponseCacheEntry, key)
+      if entry is None or _is_expired(entry.expires_at):
+        return None
+      return entry.response
+
+  def _db_put(self, key, response, *, model, version):
+    from sqlalchemy.dialects.postgresql import insert
+    from domifile.db import db_transaction
+    from domifile.models import ResponseCacheEntry
+
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.db_ttl)
+    with db_transaction(ResponseCacheEntry) as db_session:
+      # An expired entry not yet purged is replaced.
+      db_session.execute(
+          insert(ResponseCacheEntry).values(
+              key=key,
+              model=model,
+              version=version,
+              response=response,
+              expires_at=expires_at,
+          ).on_conflict_do_update(index_elements=["key"],
+                                  set_=dict(response=response, expires_at=expires_at)))
+
+  @staticmethod
+  def purge_expired():
+    """ Delete expired stored responses.  Returns the count deleted. """
+    from sqlalchemy import delete
+    from domifile.db import db_transaction
+    from domifile.models import ResponseCacheEntry
+
+    with db_transaction(ResponseCacheEntry) as db_session:
+      return db_session.execute(
+          delete(ResponseCacheEntry).where(
+              ResponseCacheEntry.expires_at <= datetime.now(timezone.utc))).rowcount
+
+  @staticmethod
+  def purge(version):
+    """ Delete stored responses of a version.  Returns the count deleted. """
+    from sqlalchemy import delete
+    from domifile.db import db_transaction
+    from domifile.models import ResponseCacheEntry
+
+    with db_transaction(ResponseCacheEntry) as db_session:
+      return db_session.execute(
+          delete(ResponseCacheEntry).where(ResponseCacheEntry.version == version)).rowcount
+
+
+def _is_expired(expires_at):
+  return expires_at is not None and expires_at <= datetime.now(timezone.utc)
+
+
+embedding_cache = EmbeddingCache()
+response_cache = ResponseCache()
@@ -4,20 +4,45 @@ import sys
 
 
 class BaseConfig:
+  # Answers reused across similar questions until the next ingest; "0" to disable.
+  ANSWER_CACHE = os.getenv("ANSWER_CACHE", "1")
+  ANSWER_CACHE_SIMILARITY = os.getenv("ANSWER_CACHE_SIMILARITY")
+  # Most frequent questions answered ahead of time after each ingest.
+  ANSWER_CACHE_WARM_COUNT = os.getenv("ANSWER_CACHE_WARM_COUNT")
+  # Connections of the async query path (domifile/asgi.py), per process.
+  ASYNC_POOL_MAX_SIZE = os.getenv("ASYNC_POOL_MAX_SIZE")
   AUTH_URI = "http://localhost:5001"
+  # Tokens of retrieved text in the context of an answer; see query/context.py.
+  CONTEXT_TOKEN_BUDGET = os.getenv("CONTEXT_TOKEN_BUDGET")
   CORS_ALLOWED_ORIGINS = []
+  # Document analysis: "excerpt" (one call) or "full" (two calls); see ingest/analyzer.py.
+  DOC_ANALYZER_MODE = os.getenv("DOC_ANALYZER_MODE", "excerpt")
+  # Directory of the memory-mapped embedding snapshot; unset to search in Postgres only.
+  EMBEDDING_SNAPSHOT_DIR = os.getenv("EMBEDDING_SNAPSHOT_DIR")
+  EMBEDDING_SNAPSHOT_DTYPE = os.getenv("EMBEDDING_SNAPSHOT_DTYPE", "float32")
   GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
   GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
   PORT = 5001
+  # "local" routes questions by labeled prototypes, asking the LLM when unsure; or "llm".
+  INTENT_CLASSIFIER = os.getenv("INTENT_CLASSIFIER", "local")
+  INTENT_CONFIDENCE_MARGIN = os.getenv("INTENT_CONFIDENCE_MARGIN")
   OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
   OPENAI_API_DEBUG = False
   REDIS_URL = "redis://localhost:6379/0"
+  # Seconds allowed each stage of answering before it is given up on (see query/routing.py).
+  ROUTE_BUDGET_CLASSIFY = os.getenv("ROUTE_BUDGET_CLASSIFY")
+  ROUTE_BUDGET_HYBRID = os.getenv("ROUTE_BUDGET_HYBRID")
+  ROUTE_BUDGET_RAG = os.getenv("ROUTE_BUDGET_RAG")
+  ROUTE_BUDGET_STRUCTURED = os.getenv("ROUTE_BUDGET_STRUCTURED")
   SECRET_KEY = os.getenv("SECRET_KEY") or "default-secret"
   SERVE_STATIC = False
   SESSION_COOKIE_SECURE = True
   SQL_ECHO = os.getenv("SQL_ECHO") == "1"
   TESTING = False
   USE_CELERY = False
+  # Embedding index searched: full, half, truncated or binary (see query/vector_index.py).
+  VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full")
+  VECTOR_STORAGE_DIMENSIONS = os.getenv("VECTOR_STORAGE_DIMENSIONS")
   VERBOSE = os.getenv("VERBOSE") == "1"
 
 
@@ -1,3 +1,4 @@
 # domifile/db/__init__.py
 from .helpers import db_transaction
 from .registry import DatabaseRegistry
+from .corpus import bump_corpus_version, current_corpus_version
@@ -0,0 +1,80 @@
+# domifile/db/aio.py
+
+import logging
+import re
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+ASYNC_POOL_MIN_SIZE = 2
+ASYNC_POOL_MAX_SIZE = 20
+
+_conninfo = None
+_pool_sizes = (ASYNC_POOL_MIN_SIZE, ASYNC_POOL_MAX_SIZE)
+_pool = None
+
+
+def configure_async_database(config):
+  """ Set the database of the async pool, per config.DATABASE_URL and ASYNC_POOL_MAX_SIZE. """
+  global _conninfo, _pool_sizes
+  # psycopg takes the libpq URL; SQLAlchemy's names the driver.
+  _conninfo = re.sub(r"^postgresql\+\w+://", "postgresql://", config.DATABASE_URL)
+  max_size = getattr(config, "ASYNC_POOL_MAX_SIZE", None)
+  _pool_sizes = (ASYNC_POOL_MIN_SIZE, int(max_size) if max_size else ASYNC_POOL_MAX_SIZE)
+
+
+async def open_async_pool():
+  """ Open the pool, within the event loop that is to use it. """
+  global _pool
+  from psycopg_pool import AsyncConnectionPool
+
+  if _conninfo is None:
+    raise RuntimeError("The async database is not configured")
+  if _pool is None:
+    min_size, max_size = _pool_sizes
+    _pool = AsyncConnectionPool(_conninfo,
+                                min_size=min_size,
+                                max_size=max_size,
+                                open=False,
+                                configure=_configure_connection)
+    await _pool.open()
+  return _pool
+
+
+async def close_async_pool():
+  global _pool
+  if _pool is not None:
+    await _pool.close()
+    _pool = None
+
+
+async def _configure_connection(conn):
+  from pgvector.psycopg import register_vector_async
+  from psycopg.rows import namedtuple_row
+
+  await register_vector_async(conn)
+  conn.row_factory = namedtuple_row
+  await conn.commit()  # Leave the connection idle, as the pool requires.
+
+
+@asynccontextmanager
+async def async_transaction():
+  """
+    Connection from the pool, within a transaction that commits if the block exits cleanly and
+    rolls back otherwise.  Rows are named tuples; vectors are numpy arrays.
+  """
+  pool = _pool or await open_async_pool()
+  async with pool.connection() as conn:
+    async with conn.transaction():
+      yield conn
+
+
+async def fetch_all(conn, sql, params=None):
+  """ Run SQL written with :name parameters, as for sqlalchemy.text.  Returns all rows. """
+  cursor = await conn.execute(to_pyformat(sql), params or {})
+  return await cursor.fetchall()
+
+
+def to_pyformat(sql):
+  """ Rewrite :name parameters as psycopg's %(name)s, leaving ::type casts be. """
+  return re.sub(r"(?<![:\w]):([A-Za-z_]\w*)", r"%(\1)s", sql.replace("%", "%%"))
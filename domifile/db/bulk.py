@@ -0,0 +1,66 @@
+# domifile/db/bulk.py
+
+import logging
+import re
+
+from sqlalchemy import insert
+
+logger = logging.getLogger(__name__)
+
+
+def bulk_insert(db_session, model, rows):
+  """
+    Insert rows, a list of dicts with the same keys (column names), into the table of the given
+    model in a single round trip, within the session's transaction.
+
+    On psycopg connections the rows stream through a binary COPY, vectors included in pgvector's
+    binary format.  Otherwise they go through one batched executemany.  Either way the ORM is
+    bypassed: no objects are created and generated keys are not returned.
+  """
+  if not rows:
+    return
+  table = model.__table__
+  columns = list(rows[0].keys())
+  connection = db_session.connection()
+  if connection.dialect.driver == "psycopg":
+    _copy_rows(connection, table, columns, rows)
+  else:
+    db_session.execute(insert(table), rows)
+
+
+def _copy_rows(connection, table, columns, rows):
+  driver_connection = connection.connection.driver_connection
+  _register_vector_dumpers(connection.connection.info, driver_connection)
+
+  types = [_type_name(table.c[name].type, connection.dialect) for name in columns]
+  statement = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN (FORMAT BINARY)"
+  with driver_connection.cursor() as cursor:
+    with cursor.copy(statement) as copy:
+      copy.set_types(types)
+      for row in rows:
+        copy.write_row([row[name] for name in columns])
+  logger.debug(f"copied {len(rows)} rows into {table.name}")
+
+
+def _register_vector_dumpers(connection_info, driver_connection):
+  """
+    Teach a psycopg connection to write the vector type in binary, once per connection.  Only
+    dumpers are registered, so that reads through SQLAlchemy are unaffected.
+  """
+  if connection_info.get("vector_dumpers_registered"):
+    return
+  from psycopg.types import TypeInfo
+  from pgvector.psycopg.vector import VectorBinaryDumper
+
+  info = TypeInfo.fetch(driver_connection, "vector")
+  if info is None:
+    raise ValueError("vector type not found in the database")
+  info.register(driver_connection)
+  dumper = type("VectorOidBinaryDumper", (VectorBinaryDumper, ), {"oid": info.oid})
+  driver_connection.adapters.register_dumper(None, dumper)
+  connection_info["vector_dumpers_registered"] = True
+
+
+def _type_name(column_type, dialect):
+  # E.g. "VECTOR(1536)" -> "vector"
+  return re.sub(r"\(.*\)", "", column_type.compile(dialect=dialect)).strip().lower()
@@ -0,0 +1,23 @@
+# domifile/db/corpus.py
+
+from sqlalchemy import text
+
+
+def current_corpus_version(db_session):
+  """ Version of the ingested corpus, as of the session's transaction. """
+  return db_session.execute(
+      text("SELECT coalesce((SELECT version FROM corpus_state WHERE id = 1), 0)")).scalar_one()
+
+
+def bump_corpus_version(db_session):
+  """
+    Increment the corpus version when the session's transaction commits, invalidating answers
+    cached under the previous one.  To be called by every ingest transaction that changes
+    documents, just before it commits; the row lock taken is held only until then.
+  """
+  db_session.execute(
+      text("""
+    INSERT INTO corpus_state (id, version, updated_at) VALUES (1, 1, now())
+    ON CONFLICT (id) DO UPDATE
+    SET version = corpus_state.version + 1, updated_at = now()
+  """))
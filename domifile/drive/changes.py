@@ -0,0 +1,169 @@
+# domifile/drive/changes.py
+
+import logging
+
+from .types import DriveChange
+from .errors import DriveFileNotFoundError, http_error_handling
+
+logger = logging.getLogger(__name__)
+
+
+class _DriveChangesMixin:
+  """
+    Wrapper for Google Drive services related to the changes feed.
+  """
+
+  CHANGES_PAGE_SIZE = 1000
+
+  def get_start_page_token(self):
+    """ Fetch the token that marks the current end of the changes feed. """
+    with http_error_handling("Retrieving changes start page token"):
+      return self.drive_service.changes().getStartPageToken().execute()["startPageToken"]
+
+  def list_changes(self, page_token):
+    """
+      List all changes since the given page token.
+
+      Returns:
+        (list of DriveChange, the start page token for the next call)
+    """
+    changes = []
+    while True:
+      with http_error_handling(f"Listing changes from {page_token}"):
+        results = self.drive_service.changes().list(
+            pageToken=page_token,
+            pageSize=self.CHANGES_PAGE_SIZE,
+            includeRemoved=True,
+            fields=f"nextPageToken, newStartPageToken, changes({DriveChange.FIELDS_SPEC})",
+        ).execute()
+      changes.extend(DriveChange(c) for c in results.get("changes", []))
+      if "newStartPageToken" in results:
+        return changes, results["newStartPageToken"]
+      page_token = results["nextPageToken"]
+
+
+class FolderAncestry:
+  """
+    Cached map of folder ID -> parent folder ID, used to decide whether a file lies within a
+    hierarchy without walking the hierarchy.  It is expected to hold every folder of the
+    hierarchy; other folders are looked up on demand.  The map is serializable so that it may
+    be kept between syncs.
+  """
+
+  def __init__(self, drive_service, parents=None):
+    self.drive_service = drive_service
+    self.parents = dict(parents or {})
+
+  def to_dict(self):
+    return dict(self.parents)
+
+  def parent_of(self, folder_id):
+    if folder_id not in self.parents:
+      try:
+        self.parents[folder_id] = self.drive_service.get(folder_id).parent_id
+      except (DriveFileNotFoundError, PermissionError):
+        self.parents[folder_id] = None
+    return self.parents[folder_id]
+
+  def is_within(self, folder_id, root_id):
+    """ True if folder_id is root_id or one of its descendants. """
+    seen = set()
+    while folder_id and folder_id not in seen:
+      if folder_id == root_id:
+        return True
+      seen.add(folder_id)
+      folder_id = self.parent_of(folder_id)
+    return False
+
+  def update(self, folder):
+    """ Record a folder's current parent. """
+    self.parents[folder.id] = folder.parent_id
+
+  def forget(self, folder_id):
+    self.parents.pop(folder_id, None)
+
+  def descendants_of(self, folder_id):
+    """ folder_id and the cached folders within it. """
+    return [folder_id] + [
+        other_id for other_id in self.parents
+        if other_id != folder_id and self.is_within(other_id, folder_id)
+    ]
+
+
+class HierarchyChanges:
+  """
+    The effect of a batch of Drive changes on one hierarchy:
+      * ingest_files - files created or modified within the hierarchy
+      * remove_file_ids - files deleted, trashed or moved out of the hierarchy whose documents
+        lie within it.  The changes feed covers all of Drive, so files whose documents belong
+        to another hierarchy, or which have none, are left alone.
+      * ingest_folder_ids - folders moved into the hierarchy, to be ingested whole
+      * remove_folder_ids - folders moved out of the hierarchy, to be cleared whole
+      * gone_folder_ids - folders deleted or trashed from within the hierarchy, and the folders
+        within them.  Drive can no longer list their contents, so their documents are found by
+        parent folder.
+  """
+
+  def __init__(self, changes, *, root_id, ancestry, document_parents):
+    """ document_parents maps file ID to the parent folder ID recorded with its document. """
+    self.ancestry = ancestry
+    self.ingest_files = []
+    self.remove_file_ids = []
+    self.ingest_folder_ids = []
+    self.remove_folder_ids = []
+    self.gone_folder_ids = []
+
+    # A file may change several times; only its latest state matters.
+    latest = {}
+    for change in changes:
+      latest[change.file_id] = change
+
+    # Settle folder moves first, so that file placement is judged against the new tree.  A
+    # removal carries no file; a removed folder is recognized by the cache.
+    folder_changes = [
+        c for c in latest.values()
+        if (c.file.is_folder if c.file else c.file_id in ancestry.parents)
+    ]
+    folder_change_ids = {c.file_id for c in folder_changes}
+    # The cache knows every folder of the hierarchy, so an unknown folder was not within it.
+    was_within = {
+        c.file_id: c.file_id in ancestry.parents and ancestry.is_within(c.file_id, root_id)
+        for c in folder_changes if c.file_id != root_id
+    }
+    # Whether a document lies within is judged by the tree it was ingested into.
+    documents_within = {
+        file_id
+        for file_id, parent_id in document_parents.items()
+        if parent_id in ancestry.parents and ancestry.is_within(parent_id, root_id)
+    }
+    # The contents of gone folders are known only from the cache, before it forgets them.
+    for change in folder_changes:
+      if change.is_gone and was_within.get(change.file_id):
+        self.gone_folder_ids.extend(ancestry.descendants_of(change.file_id))
+    for change in folder_changes:
+      if not change.is_gone:
+        ancestry.update(change.file)
+    for folder_id in [c.file_id for c in folder_changes if c.is_gone] + self.gone_folder_ids:
+      ancestry.forget(folder_id)
+    for change in folder_changes:
+      if change.file_id == root_id:
+        continue
+      now_within = not change.is_gone and ancestry.is_within(change.file_id, root_id)
+      if now_within and not was_within[change.file_id]:
+        self.ingest_folder_ids.append(change.file_id)
+      elif was_within[change.file_id] and not now_within and not change.is_gone:
+        self.remove_folder_ids.append(change.file_id)
+
+    for change in latest.values():
+      if change.file_id in folder_change_ids:
+        continue
+      if not change.is_gone and ancestry.is_within(change.file.parent_id, root_id):
+        self.ingest_files.append(change.file)
+      elif change.file_id in documents_within:
+        # Gone, or moved out.
+        self.remove_file_ids.append(change.file_id)
+
+    logger.debug(f"changes: {len(latest)} files; ingest {len(self.ingest_files)}; "
+                 f"remove {len(self.remove_file_ids)}; "
+                 f"folders in {len(self.ingest_folder_ids)}, out {len(self.remove_folder_ids)}, "
+                 f"gone {len(self.gone_folder_ids)}")
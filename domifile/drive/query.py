@@ -19,6 +19,7 @@ class _DriveQueryMixin:
         The builder supports the following filters:
           .named("name")
           .children_of(folder_id)
+          .children_of_any([folder_id, ...])
           .only_folders()
           .excluding_folders()
 
@@ -28,6 +29,18 @@ class _DriveQueryMixin:
           Returns:
             list: A list of DriveFiles
 
+        Or, to stream results as each page arrives:
+          .iterate()
+
+          Returns:
+            A generator of DriveFiles
+
+        Or, page by page:
+          .pages()
+
+          Returns:
+            A generator of lists of DriveFiles
+
         Or, in case one or zero matches are expected:
           .first()
 
@@ -45,6 +58,9 @@ class _DriveQueryMixin:
 
     class QueryBuilder:
 
+      # The Drive API maximum.
+      PAGE_SIZE = 1000
+
       def __init__(self, drive_service):
         self.drive_service = drive_service
         self.query_parts = []
@@ -59,6 +75,11 @@ class _DriveQueryMixin:
         self.query_parts.append(f"'{parent_id}' in parents")
         return self
 
+      def children_of_any(self, parent_ids):
+        parents_query = " or ".join(f"'{parent_id}' in parents" for parent_id in parent_ids)
+        self.query_parts.append(f"({parents_query})")
+        return self
+
       def only_folders(self):
         self.query_parts.append(f"mimeType='{DriveFile.FOLDER_MIME_TYPE}'")
         return self
@@ -75,21 +96,39 @@ class _DriveQueryMixin:
         self.post_filters.append(lambda f: bool(f.get("properties", {}).get(prop_name)))
         return self
 
-      def _list(self):
+      def _pages(self, page_size=None):
         query_parts = list(self.query_parts)
         if not self.include_trashed:
           query_parts.append("trashed=false")
         query = " and ".join(query_parts)
-        # TODO: allow pagination
-        with http_error_handling("Listing files that match filters"):
-          results = self.drive_service.files().list(
-              q=query,
-              fields=f"files({DriveFile.FIELDS_SPEC})",
-          ).execute()
-        files = results.get("files", [])
-        for filt in self.post_filters:
-          files = filter(filt, files)
-        return files
+        page_token = None
+        while True:
+          with http_error_handling("Listing files that match filters"):
+            results = self.drive_service.files().list(
+                q=query,
+                pageSize=page_size or self.PAGE_SIZE,
+                pageToken=page_token,
+                fields=f"nextPageToken, files({DriveFile.FIELDS_SPEC})",
+            ).execute()
+          files = results.get("files", [])
+          for filt in self.post_filters:
+            files = filter(filt, files)
+          yield list(files)
+          page_token = results.get("nextPageToken")
+          if not page_token:
+            break
+
+      def _list(self):
+        return [f for page in self._pages() for f in page]
+
+      def pages(self, page_size=None):
+        for page in self._pages(page_size):
+          yield [DriveFile(f) for f in page]
+
+      def iterate(self, page_size=None):
+        for page in self._pages(page_size):
+          for f in page:
+            yield DriveFile(f)
 
       def list(self):
         files = self._list()
@@ -1,10 +1,12 @@
 # domifile/drive/service.py
 
+import threading
 from google.auth import default
 from google.auth.credentials import Credentials
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 
+from .changes import _DriveChangesMixin
 from .query import _DriveQueryMixin
 from .retrieve import _DriveRetrieveMixin
 
@@ -23,8 +25,10 @@ DRIVE_SERVICE_NAME = "drive"
 DRIVE_SERVICE_VERSION = "v3"
 DRIVE_SERVICE_SCOPE = "https://www.googleapis.com/auth/drive"
 
+_thread_local = threading.local()
 
-class DriveService(_DriveQueryMixin, _DriveRetrieveMixin):
+
+class DriveService(_DriveQueryMixin, _DriveRetrieveMixin, _DriveChangesMixin):
   """
     Google Drive API Connector
   """
@@ -38,6 +42,15 @@ class DriveService(_DriveQueryMixin, _DriveRetrieveMixin):
                                credentials=self.credentials,
                                cache_discovery=False)
 
+  @classmethod
+  def for_current_thread(cls):
+    """ The API client is not thread-safe.  Returns an instance private to the calling thread. """
+    drive_service = getattr(_thread_local, "drive_service", None)
+    if drive_service is None:
+      drive_service = cls()
+      _thread_local.drive_service = drive_service
+    return drive_service
+
   @staticmethod
   def get_credentials(*, scopes: list[str] | None = None) -> Credentials:
     creds, _ = default(scopes=scopes)
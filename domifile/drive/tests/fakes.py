@@ -0,0 +1,115 @@
+# drive/tests/fakes.py
+
+import re
+
+from domifile.drive.changes import _DriveChangesMixin
+from domifile.drive.query import _DriveQueryMixin
+from domifile.drive.retrieve import _DriveRetrieveMixin
+from domifile.drive.types import DriveFile
+
+MODIFIED_TIME = "2025-01-01T00:00:00Z"
+
+
+def folder(file_id, parent_id=None):
+  return {
+      "id": file_id,
+      "name": file_id,
+      "mimeType": DriveFile.FOLDER_MIME_TYPE,
+      "parents": [parent_id] if parent_id else [],
+      "modifiedTime": MODIFIED_TIME,
+  }
+
+
+def file(file_id, parent_id):
+  return {
+      "id": file_id,
+      "name": file_id,
+      "mimeType": "text/plain",
+      "parents": [parent_id],
+      "modifiedTime": MODIFIED_TIME,
+  }
+
+
+class _Request:
+
+  def __init__(self, result):
+    self.result = result
+
+  def execute(self):
+    return self.result
+
+
+class FakeDriveApi:
+  """ Just enough of the Drive v3 files() and changes() resources, with a small page size. """
+
+  def __init__(self, files, page_size=2):
+    self.by_id = {f["id"]: f for f in files}
+    self.page_size = page_size
+    self.list_calls = []
+    self.change_log = []
+    self.get_calls = []
+
+  # ---- Mutation ----
+
+  def put(self, metadata):
+    """ Create or modify a file, recording the change. """
+    self.by_id[metadata["id"]] = metadata
+    self.change_log.append({"fileId": metadata["id"], "removed": False, "file": metadata})
+
+  def trash(self, file_id):
+    self.put(dict(self.by_id[file_id], trashed=True))
+
+  def remove(self, file_id):
+    del self.by_id[file_id]
+    self.change_log.append({"fileId": file_id, "removed": True})
+
+  # ---- files() ----
+
+  def files(self):
+    return self
+
+  def get(self, fileId, fields):
+    self.get_calls.append(fileId)
+    return _Request(self.by_id[fileId])
+
+  def list(self, q, pageSize, pageToken, fields):
+    self.list_calls.append(q)
+    parent_ids = set(re.findall(r"'([^']+)' in parents", q))
+    matches = [
+        f for f in self.by_id.values() if set(f["parents"]) & parent_ids and not f.get("trashed")
+    ]
+    offset = int(pageToken or 0)
+    result = {"files": matches[offset:offset + self.page_size]}
+    if offset + self.page_size < len(matches):
+      result["nextPageToken"] = str(offset + self.page_size)
+    return _Request(result)
+
+  # ---- changes() ----
+
+  def changes(self):
+    return _FakeChangesResource(self)
+
+
+class _FakeChangesResource:
+
+  def __init__(self, api):
+    self.api = api
+
+  def getStartPageToken(self):
+    return _Request({"startPageToken": str(len(self.api.change_log))})
+
+  def list(self, pageToken, pageSize, includeRemoved, fields):
+    offset = int(pageToken)
+    end = min(offset + self.api.page_size, len(self.api.change_log))
+    result = {"changes": self.api.change_log[offset:end]}
+    if end < len(self.api.change_log):
+      result["nextPageToken"] = str(end)
+    else:
+      result["newStartPageToken"] = str(end)
+    return _Request(result)
+
+
+class FakeDriveService(_DriveQueryMixin, _DriveRetrieveMixin, _DriveChangesMixin):
+
+  def __init__(self, api):
+    self.drive_service = api
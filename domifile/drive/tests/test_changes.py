@@ -0,0 +1,146 @@
+# drive/tests/test_changes.py
+
+from domifile.drive.changes import FolderAncestry, HierarchyChanges
+from domifile.drive.tests.fakes import FakeDriveApi, FakeDriveService, file, folder
+
+# --------------------------------------------------------------
+# Fixtures
+# --------------------------------------------------------------
+
+TREE = [
+    folder("root"),
+    folder("sub", "root"),
+    file("a", "root"),
+    file("b", "sub"),
+    folder("elsewhere"),
+    folder("away", "elsewhere"),
+    file("c", "away"),
+]
+
+# What the first (full) sync would have recorded.
+KNOWN_FOLDERS = {"root": None, "sub": "root"}
+
+# Parent folders of stored documents: those of root, and "c", ingested under another root.
+DOCUMENT_PARENTS = {"a": "root", "b": "sub", "c": "away"}
+
+
+def sync(api, page_token, parents=None, document_parents=None):
+  drive_service = FakeDriveService(api)
+  changes, next_page_token = drive_service.list_changes(page_token)
+  ancestry = FolderAncestry(drive_service, parents or KNOWN_FOLDERS)
+  return HierarchyChanges(changes,
+                          root_id="root",
+                          ancestry=ancestry,
+                          document_parents=document_parents or DOCUMENT_PARENTS), next_page_token
+
+
+# --------------------------------------------------------------
+# Tests
+# --------------------------------------------------------------
+
+
+def test_list_changes_follows_pages():
+  api = FakeDriveApi(TREE, page_size=2)
+  drive_service = FakeDriveService(api)
+  token = drive_service.get_start_page_token()
+  for name in ["x", "y", "z"]:
+    api.put(file(name, "root"))
+  changes, next_token = drive_service.list_changes(token)
+  assert [c.file_id for c in changes] == ["x", "y", "z"]
+  assert drive_service.list_changes(next_token) == ([], next_token)
+
+
+def test_ancestry_uses_cache():
+  api = FakeDriveApi(TREE)
+  ancestry = FolderAncestry(FakeDriveService(api), KNOWN_FOLDERS)
+  assert ancestry.is_within("sub", "root")
+  assert not ancestry.is_within("away", "root")
+  assert api.get_calls == ["away", "elsewhere"]
+  assert not ancestry.is_within("away", "root")
+  assert api.get_calls == ["away", "elsewhere"]
+
+
+def test_created_and_modified_files_are_ingested():
+  api = FakeDriveApi(TREE)
+  token = FakeDriveService(api).get_start_page_token()
+  api.put(file("new", "sub"))
+  api.put(dict(api.by_id["a"], modifiedTime="2025-02-01T00:00:00Z"))
+  api.put(dict(api.by_id["c"], modifiedTime="2025-02-01T00:00:00Z"))
+  changes, _ = sync(api, token)
+  assert sorted(f.id for f in changes.ingest_files) == ["a", "new"]
+  # "c" is outside, and its document belongs to another root.
+  assert changes.remove_file_ids == []
+
+
+def test_trashed_removed_and_moved_out_files_are_removed():
+  api = FakeDriveApi(TREE)
+  token = FakeDriveService(api).get_start_page_token()
+  api.trash("a")
+  api.remove("b")
+  api.put(file("new", "sub"))
+  api.put(file("new", "away"))
+  changes, _ = sync(api, token)
+  assert changes.ingest_files == []
+  # "new" was never ingested, so has no document to remove.
+  assert sorted(changes.remove_file_ids) == ["a", "b"]
+
+
+def test_changes_outside_leave_other_roots_documents():
+  api = FakeDriveApi(TREE)
+  token = FakeDriveService(api).get_start_page_token()
+  api.trash("c")
+  api.put(file("b", "away"))
+  changes, _ = sync(api, token)
+  assert changes.remove_file_ids == ["b"]
+
+  # A document recorded under a folder since moved out was within when ingested.
+  api = FakeDriveApi(TREE + [file("d", "sub")])
+  token = FakeDriveService(api).get_start_page_token()
+  api.put(folder("sub", "elsewhere"))
+  api.put(file("d", "away"))
+  changes, _ = sync(api, token, document_parents={"d": "sub"})
+  assert changes.remove_file_ids == ["d"]
+
+
+def test_folder_moves():
+  api = FakeDriveApi(TREE)
+  token = FakeDriveService(api).get_start_page_token()
+  api.put(folder("away", "sub"))
+  api.put(folder("sub", "elsewhere"))
+  changes, _ = sync(api, token)
+  assert changes.ingest_folder_ids == []
+  assert changes.remove_folder_ids == ["sub"]
+
+  api = FakeDriveApi(TREE)
+  token = FakeDriveService(api).get_start_page_token()
+  api.put(folder("away", "sub"))
+  changes, _ = sync(api, token)
+  assert changes.ingest_folder_ids == ["away"]
+  assert changes.ancestry.is_within("away", "root")
+
+
+def test_gone_folders_clear_their_cached_descendants():
+  parents = {**KNOWN_FOLDERS, "deep": "sub"}
+  api = FakeDriveApi(TREE + [folder("deep", "sub"), file("d", "deep")])
+  token = FakeDriveService(api).get_start_page_token()
+  api.trash("sub")
+  changes, _ = sync(api, token, parents)
+  assert sorted(changes.gone_folder_ids) == ["deep", "sub"]
+  assert changes.remove_folder_ids == []
+  assert changes.ancestry.to_dict() == {"root": None}
+
+  api = FakeDriveApi(TREE + [folder("deep", "sub")])
+  token = FakeDriveService(api).get_start_page_token()
+  api.remove("deep")
+  api.remove("a")
+  changes, _ = sync(api, token, parents)
+  assert changes.gone_folder_ids == ["deep"]
+  assert changes.remove_file_ids == ["a"]
+
+
+def test_gone_folders_outside_are_ignored():
+  api = FakeDriveApi(TREE)
+  token = FakeDriveService(api).get_start_page_token()
+  api.trash("away")
+  changes, _ = sync(api, token)
+  assert changes.gone_folder_ids == []
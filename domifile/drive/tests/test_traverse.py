@@ -0,0 +1,92 @@
+# drive/tests/test_traverse.py
+
+from domifile.drive.traverse import DriveFileHierarchy, DriveFileVisitor
+from domifile.drive.tests.fakes import FakeDriveApi, FakeDriveService, file, folder
+
+# --------------------------------------------------------------
+# Fixtures
+# --------------------------------------------------------------
+
+TREE = [
+    folder("root"),
+    file("a", "root"),
+    file("b", "root"),
+    file("c", "root"),
+    folder("sub1", "root"),
+    folder("sub2", "root"),
+    file("d", "sub1"),
+    file("e", "sub2"),
+    folder("sub3", "sub2"),
+    file("f", "sub3"),
+]
+
+
+def hierarchy(api, **kwargs):
+  drive_service = FakeDriveService(api)
+  return DriveFileHierarchy(drive_service=drive_service,
+                            drive_service_factory=lambda: drive_service,
+                            **kwargs)
+
+
+# --------------------------------------------------------------
+# Tests
+# --------------------------------------------------------------
+
+
+def test_list_follows_page_tokens():
+  api = FakeDriveApi(TREE, page_size=2)
+  files = FakeDriveService(api).query().children_of("root").list()
+  assert sorted(f.id for f in files) == ["a", "b", "c", "sub1", "sub2"]
+  assert len(api.list_calls) == 3
+
+
+def test_iterate_files_yields_all_files():
+  api = FakeDriveApi(TREE)
+  files = hierarchy(api).iterate_files("root")
+  assert sorted(f.id for f in files) == ["a", "b", "c", "d", "e", "f"]
+
+
+def test_iterate_files_combines_parents():
+  api = FakeDriveApi(TREE, page_size=100)
+  list(hierarchy(api, max_listing_workers=1).iterate_files("root"))
+  # root; then sub1 and sub2 together; then sub3.
+  assert len(api.list_calls) == 3
+  assert "'sub1' in parents or 'sub2' in parents" in api.list_calls[1]
+
+
+def test_iterate_files_of_single_file():
+  api = FakeDriveApi(TREE)
+  assert [f.id for f in hierarchy(api).iterate_files("d")] == ["d"]
+
+
+def test_traverse_visits_depth_first():
+
+  class Visitor(DriveFileVisitor):
+
+    def __init__(self):
+      self.events = []
+
+    def open_drive_folder(self, folder):
+      self.events.append(f"+{folder.id}")
+
+    def visit_drive_file(self, file):
+      self.events.append(file.id)
+
+    def close_drive_folder(self, folder):
+      self.events.append(f"-{folder.id}")
+
+  visitor = Visitor()
+  api = FakeDriveApi(TREE)
+  DriveFileHierarchy(drive_service=FakeDriveService(api), visitor=visitor).traverse("root")
+  assert visitor.events == [
+      "+root", "a", "b", "c", "+sub1", "d", "-sub1", "+sub2", "e", "+sub3", "f", "-sub3", "-sub2",
+      "-root"
+  ]
+
+
+def test_iterate_files_visits_multiparent_files_once():
+  shared = dict(file("g", "sub1"), parents=["sub1", "sub3"])
+  shared_folder = dict(folder("sub4", "sub1"), parents=["sub1", "sub3"])
+  api = FakeDriveApi(TREE + [shared, shared_folder, file("h", "sub4")])
+  files = [f.id for f in hierarchy(api, max_parents_per_query=1).iterate_files("root")]
+  assert sorted(files) == ["a", "b", "c", "d", "e", "f", "g", "h"]
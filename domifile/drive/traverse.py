@@ -1,8 +1,14 @@
 # domifile/drive/traverse.py
 
+import queue
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from .service import DriveService
 
+# Breadth-first traversal defaults.
+MAX_LISTING_WORKERS = 4
+MAX_PARENTS_PER_QUERY = 20
+
 
 class DriveFileVisitor(ABC):
 
@@ -19,9 +25,19 @@ class DriveFileVisitor(ABC):
 
 class DriveFileHierarchy:
 
-  def __init__(self, *, drive_service: DriveService = None, visitor: DriveFileVisitor):
+  def __init__(self,
+               *,
+               drive_service: DriveService = None,
+               visitor: DriveFileVisitor = None,
+               drive_service_factory=None,
+               max_listing_workers=MAX_LISTING_WORKERS,
+               max_parents_per_query=MAX_PARENTS_PER_QUERY):
     self.drive_service = drive_service or DriveService()
     self.visitor = visitor
+    # Listing threads each need their own client.
+    self.drive_service_factory = drive_service_factory or DriveService.for_current_thread
+    self.max_listing_workers = max_listing_workers
+    self.max_parents_per_query = max_parents_per_query
 
   def traverse(self, root_file_id):
     drive_file = self.drive_service.get(root_file_id)
@@ -36,7 +52,7 @@ class DriveFileHierarchy:
   def _visit_drive_folder(self, drive_folder):
     self.visitor.open_drive_folder(drive_folder)
 
-    children = self.drive_service.query().children_of(drive_folder.id).list()
+    children = self.drive_service.query().children_of(drive_folder.id).iterate()
 
     for f in children:
       self._visit_drive_node(f)
@@ -45,3 +61,61 @@ class DriveFileHierarchy:
 
   def _visit_drive_file(self, drive_file):
     self.visitor.visit_drive_file(drive_file)
+
+  # --------------------------------------------------------------------------------
+
+  def iterate_files(self, root_file_id, *, on_folder=None):
+    """
+      Breadth-first generator of all non-folder files in the hierarchy.
+
+      Folders are listed concurrently, several parents to a query, and files are yielded as
+      each page of results arrives.  Order is not deterministic.  A file or folder with several
+      parents in the hierarchy is visited once.  If given, on_folder is called with each
+      folder, including the root.
+    """
+    root = self.drive_service.get(root_file_id)
+    if not root.is_folder:
+      yield root
+      return
+    if on_folder:
+      on_folder(root)
+
+    results = queue.Queue()
+    pending_folder_ids = [root.id]
+    seen_ids = {root.id}
+    outstanding = 0
+
+    with ThreadPoolExecutor(max_workers=self.max_listing_workers) as executor:
+      while pending_folder_ids or outstanding:
+        while pending_folder_ids and outstanding < self.max_listing_workers:
+          parent_ids = pending_folder_ids[:self.max_parents_per_query]
+          del pending_folder_ids[:self.max_parents_per_query]
+          executor.submit(self._list_children, parent_ids, results)
+          outstanding += 1
+
+        page, error = results.get()
+        if error:
+          raise error
+        if page is None:  # Listing is complete.
+          outstanding -= 1
+          continue
+        for drive_file in page:
+          if drive_file.id in seen_ids:
+            continue
+          seen_ids.add(drive_file.id)
+          if drive_file.is_folder:
+            pending_folder_ids.append(drive_file.id)
+            if on_folder:
+              on_folder(drive_file)
+          else:
+            yield drive_file
+
+  def _list_children(self, parent_ids, results):
+    """ Post pages of children of the given folders to results; post None when done. """
+    try:
+      query = self.drive_service_factory().query().children_of_any(parent_ids)
+      for page in query.pages():
+        results.put((page, None))
+      results.put((None, None))
+    except Exception as e:
+      results.put((None, e))
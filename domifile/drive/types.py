@@ -19,6 +19,8 @@ class DriveFile:
       "owners",
       "trashed",
       "modifiedTime",
+      "md5Checksum",
+      "size",
   )
   FIELDS_SPEC = ", ".join(FIELDS)
 
@@ -39,6 +41,9 @@ class DriveFile:
     self.trashed = f.get("trashed") or False
     self.owner = self._get_owner(f)
     self.modified_time = datetime.fromisoformat(f.get("modifiedTime").replace("Z", "+00:00"))
+    # Google-native files (Docs, Sheets) have neither checksum nor size.
+    self.md5_checksum = f.get("md5Checksum")
+    self.size = int(f["size"]) if f.get("size") else None
 
   @staticmethod
   def _get_owner(f):
@@ -53,3 +58,24 @@ class DriveFile:
   @property
   def is_folder(self):
     return self.mime_type == self.FOLDER_MIME_TYPE
+
+
+class DriveChange:
+  """ Wrapper for a Google Drive change resource. """
+
+  FIELDS = (
+      "fileId",
+      "removed",
+      f"file({DriveFile.FIELDS_SPEC})",
+  )
+  FIELDS_SPEC = ", ".join(FIELDS)
+
+  def __init__(self, change):
+    self.file_id = change.get("fileId")
+    # Removed means that the file is gone or no longer accessible.
+    self.removed = change.get("removed") or False
+    self.file = DriveFile(change["file"]) if change.get("file") else None
+
+  @property
+  def is_gone(self):
+    return self.removed or self.file is None or self.file.trashed
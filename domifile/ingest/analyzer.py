@@ -7,9 +7,31 @@ from datetime import datetime
 from domifile.models import Document
 from domifile.openai_adapter import create_response
 from .doctypes import DOC_TYPES, DOMAIN, DOC_TYPE_OTHER, DOC_TYPE_UNKNOWN
+from .excerpt import document_excerpt
 
 logger = logging.getLogger(__name__)
 
+# "full": the doc type, then the temporal profile, each from the full text (two calls).
+# "excerpt": both at once, from a bounded excerpt (see excerpt.py), as structured output.
+ANALYZER_MODES = ("full", "excerpt")
+DEFAULT_ANALYZER_MODE = "excerpt"
+
+_analyzer_mode = DEFAULT_ANALYZER_MODE
+
+
+def configure_document_analyzer(config):
+  """ Per config.DOC_ANALYZER_MODE; see ANALYZER_MODES. """
+  global _analyzer_mode
+  mode = getattr(config, "DOC_ANALYZER_MODE", None) or DEFAULT_ANALYZER_MODE
+  if mode not in ANALYZER_MODES:
+    raise ValueError(f"Unknown analyzer mode {mode!r}; expected one of {ANALYZER_MODES}")
+  _analyzer_mode = mode
+
+
+def doc_type_descriptions():
+  return "\n".join(f"type={key}: {value.get('description')}"
+                   for key, value in DOC_TYPES[DOMAIN].items())
+
 
 def build_doc_type_prompt(filename, document_text):
   return f"""
@@ -17,7 +39,7 @@ You are a document analyzer.  The document domain is {DOMAIN}.
 
 You are given a number of preset document types and their descriptions below.
 
-{ "\n".join(["type={}: {}".format(key, value.get("description")) for key, value in DOC_TYPES[DOMAIN].items()])}
+{doc_type_descriptions()}
 
 Rules:
 - Given the document text and the filename, identify the most likely type of the document, favoring the preset document types.
@@ -81,6 +103,67 @@ Document text:
 """
 
 
+def build_analysis_prompt(filename, excerpt):
+  return f"""
+You are a document analyzer.  The document domain is {DOMAIN}.
+
+You are given an excerpt of a document: its beginning, its end and passages between that mention dates, separated by "[...]".  Your task is to identify the type of the document and to form its "temporal profile".
+
+Preset document types and their descriptions:
+
+{doc_type_descriptions()}
+
+Document type rules:
+- Given the document excerpt and the filename, identify the most likely type of the document, favoring the preset document types.
+- Express a confidence level as a percentage.  Confidence reflects how strongly the document matches known structural patterns for that type (not guess probability).
+- Choose EXACTLY ONE doc_type.  Use confidence to break ties.
+- If best match is a preset type → use it.
+- If best match is not preset and confidence is >= 50% → use "{DOC_TYPE_OTHER} (<doc_type>)"
+- If no type reaches 50% confidence → use "{DOC_TYPE_UNKNOWN}", doc_type_confidence = null.
+
+Temporal profile rules:
+- document_date is the document's date of issue.  It must never be inferred.  If it does not explicitly appear in the document, it is null.
+- date_range_start and date_range_end bound the range of dates that the document covers, if applicable to the doc_type.  The end date is included in the range.
+- The date range may be inferred.  Give its confidence percentage as date_range_confidence.  If the confidence is less than 50, the date range fields are null.
+- Interpret dates in light of the doc_type.  For example, a bank statement has a date of issue and covers a period, usually one month; meeting minutes cover the date of the meeting; a safety notice has a date of issue and no covered range.
+- ALWAYS give dates in ISO format (YYYY-MM-DD).
+- You may take the document's filename as a hint to the date range but only if supported by the document contents.
+
+Filename: {filename}
+
+Document excerpt:
+{excerpt}
+"""
+
+
+def _nullable(json_type):
+  return {"type": [json_type, "null"]}
+
+
+# Output of build_analysis_prompt.  Structured outputs require every field.
+ANALYSIS_SCHEMA = {
+    "type":
+    "object",
+    "properties": {
+        "doc_type": {
+            "type": "string"
+        },
+        "doc_type_confidence": _nullable("number"),
+        "document_date": _nullable("string"),
+        "date_range_start": _nullable("string"),
+        "date_range_end": _nullable("string"),
+        "date_range_confidence": _nullable("number"),
+        "comments": _nullable("string"),
+    },
+    "required": [
+        "doc_type", "doc_type_confidence", "document_date", "date_range_start", "date_range_end",
+        "date_range_confidence", "comments"
+    ],
+    "additionalProperties":
+    False,
+}
+
+
 def parse_llm_json(text: str) -> dict:
   text = text.strip()
   # Remove ```json ... ``` or ``` ... ```
@@ -100,15 +183,29 @@ class DocumentAnalyzer:
       * Chunks are of the size and displacment specified in settings.
   """
 
-  def __init__(self, document):
+  # Bump when prompts or parsing change.  Also invalidates cached LLM responses.
+  VERSION = "1.1"
+
+  def __init__(self, document, mode=None):
     self.document = document
+    self.mode = mode or _analyzer_mode
 
   def analyze_document(self):
     """
       Drive the analysis of one document and place the results into the 
       Document model object.  The caller is responsible for managing the
-      database session
+      database session.  The version recorded names the mode.
     """
+    self.document.doc_type_analyzer_version = f"{self.VERSION}-{self.mode}"
+
+    if self.mode == "excerpt":
+      try:
+        self._analyze_excerpt()
+      except Exception:
+        self.document.doc_type = "unknown"
+        logger.exception("Unexpected error analyzing document excerpt")
+      return
+
     try:
       self._analyze_for_doc_type()
     except Exception:
@@ -128,13 +225,11 @@ class DocumentAnalyzer:
     prompt = build_doc_type_prompt(self.document.filename, self.document.text)
 
     # Run the AI
-    analysis = create_response(prompt)
+    analysis = create_response(prompt, cache_version=f"doc-type-{self.VERSION}")
     logger.debug(analysis)
 
     # Save results in Document object.
-    analysis = parse_llm_json(analysis)
-    self.document.doc_type = analysis.get("doc_type")
-    self.document.doc_type_confidence = analysis.get("doc_type_confidence")
+    self._save_doc_type(parse_llm_json(analysis))
 
   def _analyze_for_temporal_profile(self, doc_type):
     """ Step 2 of analysis: pick out dates """
@@ -143,14 +238,34 @@ class DocumentAnalyzer:
     prompt = build_temporal_prompt(self.document.filename, self.document.text, doc_type)
 
     # Run the AI
-    analysis = create_response(prompt)
+    analysis = create_response(prompt, cache_version=f"temporal-{self.VERSION}")
     logger.debug(analysis)
 
     # Save results in Document object.
-    analysis = parse_llm_json(analysis)
+    self._save_temporal_profile(parse_llm_json(analysis))
+
+  def _analyze_excerpt(self):
+    """ Both steps of analysis in one call, from an excerpt of the document """
+
+    prompt = build_analysis_prompt(self.document.filename, document_excerpt(self.document.text))
+
+    analysis = create_response(prompt,
+                               cache_version=f"analysis-{self.VERSION}",
+                               json_schema=("document_analysis", ANALYSIS_SCHEMA))
+    logger.debug(analysis)
+
+    analysis = json.loads(analysis)
+    self._save_doc_type(analysis)
+    self._save_temporal_profile(analysis)
+
+  def _save_doc_type(self, analysis):
+    self.document.doc_type = analysis.get("doc_type")
+    self.document.doc_type_confidence = analysis.get("doc_type_confidence")
+
+  def _save_temporal_profile(self, analysis):
     self.document.document_date = self._get_analysis_date(analysis, "document_date")
     self.document.date_range_start = self._get_analysis_date(analysis, "date_range_start")
-    self.document.date_range_end = self._get_analysis_date(analysis, "date_range_start")
+    self.document.date_range_end = self._get_analysis_date(analysis, "date_range_end")
 
   @staticmethod
   def _get_analysis_date(analysis, key):
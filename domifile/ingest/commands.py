@@ -4,6 +4,7 @@ from flask.cli import with_appcontext
 
 
 def install_ingest_commands(app):
+  from domifile.ingest import isolation, pipeline
   from domifile.ingest.helpers import DocumentFinder
   from domifile.ingest.service import IngestService
 
@@ -52,16 +53,46 @@ def install_ingest_commands(app):
 
   @click.command("ingest-drive")
   @click.argument("root_file_id")
+  @click.option("--serial", is_flag=True, help="Ingest one file at a time.")
+  @click.option("--incremental",
+                is_flag=True,
+                help="Process only files changed since the last incremental run.")
+  @click.option("--download-workers", type=int, default=pipeline.DEFAULT_DOWNLOAD_WORKERS)
+  @click.option("--extract-workers", type=int, default=pipeline.DEFAULT_EXTRACT_WORKERS)
+  @click.option("--analyze-workers", type=int, default=pipeline.DEFAULT_ANALYZE_WORKERS)
+  @click.option("--queue-size", type=int, default=pipeline.DEFAULT_QUEUE_SIZE)
+  @click.option("--extraction-timeout",
+                type=int,
+                default=isolation.DEFAULT_EXTRACTION_TIMEOUT,
+                help="Seconds allowed to extract text from one file.")
+  @click.option("--extraction-memory-mb",
+                type=int,
+                default=isolation.DEFAULT_EXTRACTION_MEMORY_LIMIT // (1024 * 1024),
+                help="Memory allowed to extract text from one file.")
   @with_appcontext
-  def ingest_drive_command(root_file_id):
+  def ingest_drive_command(root_file_id, serial, incremental, download_workers, extract_workers,
+                           analyze_workers, queue_size, extraction_timeout, extraction_memory_mb):
     """Traverse a Google Drive folder/file hierarchy and ingest all contents."""
     configure_logging()
 
     root_file_id = normalize_file_id(root_file_id)
 
-    output = IngestService().ingest_drive_hierarchy(root_file_id)
+    ingest_service = IngestService()
+    pipeline_options = {
+        "download_workers": download_workers,
+        "extract_workers": extract_workers,
+        "analyze_workers": analyze_workers,
+        "queue_size": queue_size,
+        "extraction_timeout": extraction_timeout,
+        "extraction_memory_limit": extraction_memory_mb * 1024 * 1024,
+    }
+    if serial:
+      output = ingest_service.ingest_drive_hierarchy_serially(root_file_id)
+    elif incremental:
+      output = ingest_service.sync_drive_hierarchy(root_file_id, **pipeline_options)
+    else:
+      output = ingest_service.ingest_drive_hierarchy(root_file_id, **pipeline_options)
     click.echo(json.dumps(output))
-    ingest_service.close()
 
   app.cli.add_command(ingest_drive_command)
 
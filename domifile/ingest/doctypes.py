@@ -1,4 +1,5 @@
 # domifile/ingest/doctypes.py
+import re
 
 PROPERTY_MANAGEMENT = "property_management"
 DOMAIN = PROPERTY_MANAGEMENT
@@ -278,3 +279,27 @@ DOC_TYPES = {
 
 DOC_TYPE_OTHER = "other"
 DOC_TYPE_UNKNOWN = "unknown"
+
+
+def doc_types_in_category(category, domain=DOMAIN):
+  """
+    Doc types that a question of the given category (e.g. "insurance") may concern: those named
+    for it, and those having it among the values of their category attribute.  Empty if the
+    category is unknown.
+  """
+  category = re.sub(r"[\s-]+", "_", (category or "").strip().lower())
+  if not category or category == DOC_TYPE_OTHER:
+    return []
+  doc_types = []
+  for doc_type, spec in DOC_TYPES[domain].items():
+    values = spec["attributes"].get("category", "")
+    named = _singular(category) in [_singular(word) for word in doc_type.split("_")]
+    if named or category in [value.strip() for value in values.split("|")]:
+      doc_types.append(doc_type)
+  return doc_types
+
+
+def _singular(word):
+  if word.endswith("ies"):
+    return word[:-3] + "y"
+  return word.removesuffix("s")
@@ -0,0 +1,51 @@
+# domifile/ingest/excerpt.py
+"""
+  Bounded excerpts of document text, for analyses that need not read the whole document.  The
+  type of a document shows at its start (letterhead, title, headings) and often its end
+  (signatures, totals); its dates cluster in a few places.
+"""
+import re
+
+EXCERPT_HEAD_CHARS = 4000
+EXCERPT_TAIL_CHARS = 1500
+# The middle is cut into windows, of which those mentioning the most dates are kept.
+EXCERPT_WINDOW_CHARS = 500
+EXCERPT_WINDOW_COUNT = 4
+
+EXCERPT_GAP = "\n[...]\n"
+
+_MONTH = r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?"
+DATE_PATTERN = re.compile(
+    r"\b(?:\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}"  # 3/14/2025, 14.03.25
+    r"|\d{4}-\d{2}-\d{2}"  # 2025-03-14
+    rf"|{_MONTH}\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}}"  # March 14, 2025
+    rf"|\d{{1,2}}\s+{_MONTH},?\s+\d{{4}}"  # 14 March 2025
+    rf"|{_MONTH}\s+\d{{4}})\b",  # March 2025
+    re.IGNORECASE)
+
+
+def document_excerpt(text,
+                     *,
+                     head=EXCERPT_HEAD_CHARS,
+                     tail=EXCERPT_TAIL_CHARS,
+                     window=EXCERPT_WINDOW_CHARS,
+                     window_count=EXCERPT_WINDOW_COUNT):
+  """
+    The start and end of text and its most date-dense windows between, in order, joined by
+    EXCERPT_GAP.  Text that fits is returned whole.
+  """
+  if len(text) <= head + tail + window * window_count:
+    return text
+
+  middle = text[head:len(text) - tail]
+  dates_per_window = {}
+  for match in DATE_PATTERN.finditer(middle):
+    slot = match.start() // window
+    dates_per_window[slot] = dates_per_window.get(slot, 0) + 1
+  densest = sorted(dates_per_window, key=lambda slot: (-dates_per_window[slot], slot))
+  slots = sorted(densest[:window_count])
+
+  parts = [text[:head]]
+  parts.extend(middle[slot * window:(slot + 1) * window] for slot in slots)
+  parts.append(text[-tail:])
+  return EXCERPT_GAP.join(parts)
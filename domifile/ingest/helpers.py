@@ -1,14 +1,21 @@
 # domifile/ingest/helpers.py
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, update
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from domifile.db.bulk import bulk_insert
 from domifile.models import Document, Chunk
-from domifile.openai_adapter import create_embedding
+from domifile.openai_adapter import create_embeddings, estimate_tokens
 from domifile.ingest.text import TextExtractor
 
 logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 300
+EMBEDDING_BATCH_SIZE = 256
+MAX_PENDING_EMBEDDING_BATCHES = 2
+
 
 class DocumentFinder:
 
@@ -41,6 +48,9 @@ class DocumentHelper:
     if not self.document.ingested_at:
       logger.debug("document ingest not completed")
       return False
+    if self.document.extraction_error:
+      logger.debug(f"text extraction failed: {self.document.extraction_error}")
+      return False
     db_mod_time = self.document.drive_modified_time
     gdrive_mod_time = self.drive_file.modified_time
     if db_mod_time != gdrive_mod_time:
@@ -51,14 +61,34 @@ class DocumentHelper:
       return False
     return True
 
-  def open_document_for_ingest(self, text, text_extractor_version):
-    if self.document is None:
-      self.document = Document(drive_file_id=self.drive_file.id)
-    self.document.text_extractor_version = text_extractor_version
+  def document_content_is_unchanged(self, content_hash):
+    """
+      True if the document was fully ingested from content with the given hash, so that only
+      its metadata may be stale.
+    """
+    if not self.document or not self.document.ingested_at or not content_hash:
+      return False
+    if self.document.extraction_error:
+      return False
+    if self.document.text_extractor_version != TextExtractor.VERSION:
+      return False
+    return self.document.content_hash == content_hash
+
+  def update_document_metadata(self):
     self.document.filename = self.drive_file.name
+    self.document.drive_parent_id = self.drive_file.parent_id
     self.document.mime_type = self.drive_file.mime_type
     self.document.drive_modified_time = self.drive_file.modified_time
+    self.document.file_size = self.drive_file.size
+
+  def open_document_for_ingest(self, text, text_extractor_version, content_hash=None):
+    if self.document is None:
+      self.document = Document(drive_file_id=self.drive_file.id)
+    self.document.text_extractor_version = text_extractor_version
+    self.update_document_metadata()
+    self.document.content_hash = content_hash or self.drive_file.md5_checksum
     self.document.text = text
+    self.document.extraction_error = None
     self.document.doc_type = None
     self.document.doc_type_confidence = None
     self.document.doc_type_analyzer_version = None
@@ -72,16 +102,85 @@ class DocumentHelper:
   def delete_all_chunks(self):
     self.db_session.execute(delete(Chunk).where(Chunk.document_id == self.document.id))
 
-  def create_chunks(self):
+  def update_chunk_profile(self):
+    """ Copy the document's type and dates to its chunks, for filtered search. """
+    self.db_session.execute(
+        update(Chunk).where(Chunk.document_id == self.document.id).values(
+            doc_type=self.document.doc_type,
+            document_date=self.document.document_date,
+            coverage_start=self.document.date_range_start,
+            coverage_end=self.document.date_range_end,
+        ))
 
-    def chunk_text(text, size=300, extra=30):
-      for i in range(0, len(text), size):
-        yield text[i:i + size]
-
-    for chunk_text_block in chunk_text(self.document.text):
-      chunk = Chunk(
-          document_id=self.document.id,
-          text=chunk_text_block,
-          embedding=create_embedding(chunk_text_block),
-      )
-      self.db_session.add(chunk)
+  def create_chunks(self):
+    self.create_chunks_from_pages([(None, self.document.text)])
+
+  def create_chunks_from_pages(self, pages):
+    """
+      Chunk and embed text as it arrives, page by page.  Batches of chunks are embedded on a
+      background thread while later pages are still being parsed, if pages is a generator; at
+      most MAX_PENDING_EMBEDDING_BATCHES batches are held at once.  Returns the full text, for
+      Document.text.
+    """
+    texts = []
+
+    def collect(pages):
+      for page_number, text in pages:
+        texts.append(text)
+        yield page_number, text
+
+    def embed(batch):
+      return batch, create_embeddings([text for _, text in batch])
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+      pending = deque()
+      batch = []
+      for page_number, chunk_text_block in chunk_pages(collect(pages), size=CHUNK_SIZE):
+        if not chunk_text_block.strip():
+          continue
+        batch.append((page_number, chunk_text_block))
+        if len(batch) >= EMBEDDING_BATCH_SIZE:
+          pending.append(executor.submit(embed, batch))
+          batch = []
+          while len(pending) > MAX_PENDING_EMBEDDING_BATCHES:
+            self._add_chunks(*pending.popleft().result())
+      if batch:
+        pending.append(executor.submit(embed, batch))
+      while pending:
+        self._add_chunks(*pending.popleft().result())
+
+    return "\n".join(texts)
+
+  def _add_chunks(self, batch, embeddings):
+    # Chunks are written in bulk rather than through the session, one batch per round trip.
+    bulk_insert(self.db_session, Chunk, [{
+        "document_id": self.document.id,
+        "text": chunk_text_block,
+        "embedding": embedding,
+        "page_number": page_number,
+        "token_count": estimate_tokens(chunk_text_block),
+    } for (page_number, chunk_text_block), embedding in zip(batch, embeddings)])
+
+
+def chunk_pages(pages, size=CHUNK_SIZE):
+  """
+    Generator of fixed-size (page number, chunk text) from a stream of (page number, text).
+    Chunks run across page boundaries and are numbered with the page they start on.
+  """
+  # Chunks are sliced at an offset; the buffer is trimmed only between pages, so that a long
+  # page is not copied once per chunk.
+  buffer = ""
+  offset = 0
+  buffer_page_number = None
+  for index, (page_number, text) in enumerate(pages):
+    buffer = buffer[offset:]
+    offset = 0
+    if not buffer.strip():
+      buffer_page_number = page_number
+    buffer += ("\n" if index else "") + text
+    while len(buffer) - offset >= size:
+      yield buffer_page_number, buffer[offset:offset + size]
+      offset += size
+      buffer_page_number = page_number
+  if offset < len(buffer):
+    yield buffer_page_number, buffer[offset:]
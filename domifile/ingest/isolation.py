@@ -0,0 +1,85 @@
+# domifile/ingest/isolation.py
+import logging
+import multiprocessing
+
+from domifile.ingest.text import TextExtractor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTRACTION_TIMEOUT = 300  # seconds
+DEFAULT_EXTRACTION_MEMORY_LIMIT = 2 * 1024 * 1024 * 1024  # bytes
+
+
+def _get_context():
+  # A fork server forks workers from a clean process that has preloaded the extractors and
+  # the Drive types passed to them; forking the threaded ingest process itself is unsafe.
+  if "forkserver" in multiprocessing.get_all_start_methods():
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["domifile.drive", "domifile.ingest.text"])
+    return context
+  return multiprocessing.get_context("spawn")
+
+
+def _extract_in_child(conn, drive_file, path, memory_limit):
+  """ Worker process body.  Sends (status, payload) back to the parent. """
+  try:
+    if memory_limit:
+      import resource
+      resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    pages = list(TextExtractor(None, drive_file).iter_pages_from_path(path))
+    conn.send(("ok", pages))
+  except TextExtractor.Error as e:
+    conn.send(("unsupported", str(e)))
+  except MemoryError:
+    conn.send(("failed", "memory limit exceeded"))
+  except Exception as e:
+    conn.send(("failed", f"{e.__class__.__name__}: {e}"))
+  finally:
+    conn.close()
+
+
+class IsolatedExtractor:
+  """
+    Runs text extraction in a child process, one file per process, so that CPU-bound parsing
+    runs outside the GIL and a pathological file can be killed.  The number of files
+    extracted at once is the number of threads calling extract_pages.
+  """
+
+  def __init__(self,
+               *,
+               timeout=DEFAULT_EXTRACTION_TIMEOUT,
+               memory_limit=DEFAULT_EXTRACTION_MEMORY_LIMIT):
+    self.timeout = timeout
+    self.memory_limit = memory_limit
+    self.context = _get_context()
+
+  def extract_pages(self, drive_file, path):
+    """
+      Returns a list of (page number, text).  Raises TextExtractor.Error if the type is not
+      supported, TextExtractor.Failed if the worker fails, overruns or is killed.
+    """
+    parent_conn, child_conn = self.context.Pipe(duplex=False)
+    process = self.context.Process(target=_extract_in_child,
+                                   args=(child_conn, drive_file, path, self.memory_limit),
+                                   name=f"extract-{drive_file.id}",
+                                   daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+      if not parent_conn.poll(self.timeout):
+        raise TextExtractor.Failed(f"timed out after {self.timeout}s")
+      status, payload = parent_conn.recv()
+    except EOFError:
+      process.join()
+      raise TextExtractor.Failed(f"worker exited with code {process.exitcode}")
+    finally:
+      parent_conn.close()
+      if process.is_alive():
+        process.kill()
+      process.join()
+
+    if status == "unsupported":
+      raise TextExtractor.Error(payload)
+    if status == "failed":
+      raise TextExtractor.Failed(payload)
+    return payload
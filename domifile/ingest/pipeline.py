@@ -0,0 +1,228 @@
+# domifile/ingest/pipeline.py
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from collections import Counter
+
+from domifile.cache import embedding_cache
+from domifile.drive import DriveService
+from domifile.drive.traverse import DriveFileHierarchy
+from domifile.ingest.isolation import (IsolatedExtractor, DEFAULT_EXTRACTION_TIMEOUT,
+                                       DEFAULT_EXTRACTION_MEMORY_LIMIT)
+from domifile.ingest.text import TextExtractor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_EXTRACT_WORKERS = os.cpu_count() or 2
+DEFAULT_ANALYZE_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 16
+
+
+class _Stage:
+  """
+    A pool of worker threads fed by a bounded queue.  The handler receives one work item and
+    hands it on by putting it to the next stage.  A full queue blocks the upstream producer,
+    which provides backpressure.
+  """
+
+  _DONE = object()
+
+  def __init__(self, name, handler, *, workers, queue_size):
+    self.name = name
+    self.handler = handler
+    self.queue = queue.Queue(maxsize=queue_size)
+    self.threads = [
+        threading.Thread(target=self._work, name=f"ingest-{name}-{i}", daemon=True)
+        for i in range(workers)
+    ]
+
+  def start(self):
+    for thread in self.threads:
+      thread.start()
+
+  def put(self, item):
+    self.queue.put(item)
+
+  def close(self):
+    """ Signal that no more items are coming and wait for the workers to drain the queue. """
+    for _ in self.threads:
+      self.queue.put(self._DONE)
+    for thread in self.threads:
+      thread.join()
+
+  def _work(self):
+    while True:
+      item = self.queue.get()
+      if item is self._DONE:
+        return
+      self.handler(item)
+
+
+class _WorkItem:
+  """ The state of one Drive file as it passes through the pipeline. """
+
+  def __init__(self, drive_file):
+    self.drive_file = drive_file
+    self.tmpdir = None
+    self.path = None
+    self.content_hash = None
+    # (page number, text) pairs.  The extraction process returns them all at once, so an item
+    # holds the whole text of its document until it is analyzed.
+    self.pages = None
+    self.extraction_error = None
+
+
+class IngestPipeline:
+  """
+    Concurrent ingest of a Drive hierarchy.  Traversal feeds a bounded queue, and separate
+    worker pools handle each stage:
+      * download - check for an up to date document; download the file (network)
+      * extract - extract text from the downloaded file (CPU), each file in its own worker
+        process, killed if it overruns its time or memory limit
+      * analyze - chunk, embed, analyze and commit (OpenAI, database)
+    Each stage has its own concurrency limit; bounded queues between stages keep a fast stage
+    from running too far ahead of a slow one.  Queues are bounded by count of files, so up to
+    queue_size extracted documents may wait for analysis at once, each held whole.  (Sequential
+    ingest, by IngestService.ingest_drive_file, streams pages into chunking instead.)
+  """
+
+  def __init__(self,
+               ingest_service,
+               *,
+               download_workers=DEFAULT_DOWNLOAD_WORKERS,
+               extract_workers=DEFAULT_EXTRACT_WORKERS,
+               analyze_workers=DEFAULT_ANALYZE_WORKERS,
+               queue_size=DEFAULT_QUEUE_SIZE,
+               extraction_timeout=DEFAULT_EXTRACTION_TIMEOUT,
+               extraction_memory_limit=DEFAULT_EXTRACTION_MEMORY_LIMIT):
+    self.ingest_service = ingest_service
+    self.extractor = IsolatedExtractor(timeout=extraction_timeout,
+                                       memory_limit=extraction_memory_limit)
+    self.stats = Counter()
+    # Files that failed (including extraction failures), to be retried.
+    self.failed_file_ids = set()
+    self._stats_lock = threading.Lock()
+
+    self.analyze_stage = _Stage("analyze",
+                                self._analyze,
+                                workers=analyze_workers,
+                                queue_size=queue_size)
+    self.extract_stage = _Stage("extract",
+                                self._extract,
+                                workers=extract_workers,
+                                queue_size=queue_size)
+    self.download_stage = _Stage("download",
+                                 self._download,
+                                 workers=download_workers,
+                                 queue_size=queue_size)
+    self.stages = [self.download_stage, self.extract_stage, self.analyze_stage]
+
+  def run(self, root_file_id, *, on_folder=None):
+    """ Ingest all files under root_file_id.  Returns counts of outcomes. """
+    hierarchy = DriveFileHierarchy(drive_service=self.ingest_service.drive_service)
+    return self.run_files(hierarchy.iterate_files(root_file_id, on_folder=on_folder))
+
+  def run_files(self, drive_files):
+    """
+      Ingest the given files.  Returns counts of outcomes and embedding cache metrics.  A file
+      given more than once is ingested once, so that no two workers store the same document.
+    """
+    for stage in self.stages:
+      stage.start()
+    try:
+      queued_ids = set()
+      for drive_file in drive_files:
+        if drive_file.id in queued_ids:
+          logger.debug(f"[FILE] {drive_file.name} ({drive_file.id}) → already queued")
+          continue
+        queued_ids.add(drive_file.id)
+        self.download_stage.put(_WorkItem(drive_file))
+    finally:
+      # Close stages in order, so that each one drains before its consumer is told to stop.
+      for stage in self.stages:
+        stage.close()
+
+    return {**self.stats, "embedding_cache": embedding_cache.stats.snapshot()}
+
+  # --------------------------------------------------------------------------------
+
+  def _count(self, outcome, failed_item=None):
+    with self._stats_lock:
+      self.stats[outcome] += 1
+      if failed_item is not None:
+        self.failed_file_ids.add(failed_item.drive_file.id)
+
+  def _fail(self, item, stage_name):
+    logger.exception(f"[{stage_name}] failed: {item.drive_file.name} ({item.drive_file.id})")
+    self._count("failed", item)
+    self._cleanup(item)
+
+  @staticmethod
+  def _cleanup(item):
+    if item.tmpdir:
+      shutil.rmtree(item.tmpdir, ignore_errors=True)
+      item.tmpdir = None
+
+  # --------------------------------------------------------------------------------
+
+  def _download(self, item):
+    try:
+      drive_file = item.drive_file
+      if not self.ingest_service.drive_file_needs_ingest(drive_file):
+        logger.debug(f"[FILE] {drive_file.name} ({drive_file.id}) → already up to date")
+        self._count("skipped")
+        return
+
+      logger.debug(f"[FILE] {drive_file.name} ({drive_file.id}) → downloading")
+      extractor = TextExtractor(DriveService.for_current_thread(), drive_file)
+      try:
+        item.tmpdir = tempfile.mkdtemp(prefix="domifile-")
+        item.path = extractor.download(item.tmpdir)
+        item.content_hash = TextExtractor.content_hash(item.path)
+      except TextExtractor.Error as e:  # Usually unsupported MIME type
+        logger.debug(f"  → {str(e)}")
+        item.pages = []
+
+      if self.ingest_service.drive_file_content_is_unchanged(drive_file, item.content_hash):
+        logger.debug(f"[FILE] {drive_file.name} ({drive_file.id}) → content unchanged")
+        self._count("unchanged")
+        self._cleanup(item)
+        return
+    except Exception:
+      self._fail(item, "download")
+      return
+    self.extract_stage.put(item)
+
+  def _extract(self, item):
+    try:
+      if item.pages is None:
+        item.pages = self.extractor.extract_pages(item.drive_file, item.path)
+    except TextExtractor.Error as e:  # Usually unsupported MIME type
+      logger.debug(f"  → {str(e)}")
+      item.pages = []
+    except TextExtractor.Failed as e:
+      logger.warning(f"[extract] failed: {item.drive_file.name} ({item.drive_file.id}): {e}")
+      self._count("extraction_failed", item)
+      item.pages = []
+      item.extraction_error = str(e)
+    except Exception:
+      self._fail(item, "extract")
+      return
+    finally:
+      self._cleanup(item)
+    self.analyze_stage.put(item)
+
+  def _analyze(self, item):
+    try:
+      self.ingest_service.store_drive_file_pages(item.drive_file,
+                                                 item.pages,
+                                                 content_hash=item.content_hash,
+                                                 extraction_error=item.extraction_error)
+    except Exception:
+      self._fail(item, "analyze")
+      return
+    self._count("ingested")
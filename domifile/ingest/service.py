@@ -1,15 +1,23 @@
 # domifile/ingest/service.py
 import logging
-from datetime import datetime
+import tempfile
+from datetime import datetime, timezone
+from sqlalchemy import or_, select
 
 from domifile.drive import DriveService
+from domifile.drive.changes import FolderAncestry, HierarchyChanges
+from domifile.drive.errors import DriveFileNotFoundError
 from domifile.drive.traverse import DriveFileHierarchy, DriveFileVisitor
 from domifile.ingest.text import TextExtractor
 from domifile.ingest.helpers import DocumentHelper, DocumentFinder
 from domifile.ingest.analyzer import DocumentAnalyzer
+from domifile.db.corpus import bump_corpus_version
 
 logger = logging.getLogger(__name__)
 
+# Syncs that retry a file that keeps failing, before it is left until it next changes.
+SYNC_RETRY_LIMIT = 3
+
 
 class IngestService:
   """ """
@@ -18,8 +26,171 @@ class IngestService:
     """ """
     self.drive_service = drive_service or DriveService()
 
-  def ingest_drive_hierarchy(self, root_file_id):
+  def ingest_drive_hierarchy(self, root_file_id, **pipeline_options):
     """ MAIN ENTRY POINT """
+    from domifile.ingest.pipeline import IngestPipeline
+
+    logger.debug(f"[Ingest start] {root_file_id}")
+    stats = IngestPipeline(self, **pipeline_options).run(root_file_id)
+    logger.debug(f"[Ingest complete] {root_file_id} {stats}")
+    self._refresh_after_ingest()
+    return stats
+
+  def sync_drive_hierarchy(self, root_file_id, **pipeline_options):
+    """
+      Incremental ingest.  The first sync of a root ingests the whole hierarchy; later syncs
+      process only the files that the Drive changes feed reports since the previous sync, and
+      retry the files that failed in the previous sync (up to SYNC_RETRY_LIMIT times).
+    """
+    from domifile.ingest.pipeline import IngestPipeline
+
+    # The sync state is read and written in transactions of its own, not held open throughout.
+    sync_state = self._load_sync_state(root_file_id)
+    pipeline = IngestPipeline(self, **pipeline_options)
+    if sync_state is None:
+      # Take the token before traversal, so that changes made during traversal are replayed.
+      page_token = self.drive_service.get_start_page_token()
+      ancestry = FolderAncestry(self.drive_service)
+      retry_file_ids = {}
+      logger.debug(f"[Sync start] {root_file_id} (full)")
+      stats = pipeline.run(root_file_id, on_folder=ancestry.update)
+    else:
+      logger.debug(f"[Sync start] {root_file_id} from {sync_state.start_page_token}")
+      changes, page_token = self.drive_service.list_changes(sync_state.start_page_token)
+      ancestry = FolderAncestry(self.drive_service, sync_state.folder_parents)
+      document_parents = self.drive_file_document_parents([c.file_id for c in changes])
+      hierarchy_changes = HierarchyChanges(changes,
+                                           root_id=root_file_id,
+                                           ancestry=ancestry,
+                                           document_parents=document_parents)
+      retry_file_ids = sync_state.retry_file_ids
+      retry_files = self._retry_files(retry_file_ids, root_file_id, ancestry)
+      stats = self._apply_hierarchy_changes(hierarchy_changes, pipeline, retry_files=retry_files)
+
+    # The feed moves on regardless of failures; failed files are retried by ID instead.
+    self._save_sync_state(root_file_id,
+                          start_page_token=page_token,
+                          retry_file_ids=self._next_retries(retry_file_ids,
+                                                            pipeline.failed_file_ids),
+                          folder_parents=ancestry.to_dict(),
+                          synced_at=datetime.now(timezone.utc))
+    logger.debug(f"[Sync complete] {root_file_id} {stats}")
+    self._refresh_after_ingest()
+    return stats
+
+  def _load_sync_state(self, root_file_id):
+    """ The DriveSyncState of a root, detached, or None if it has not been synced. """
+    from domifile.models import DriveSyncState
+
+    db_session = self._create_db_session()
+    try:
+      return db_session.get(DriveSyncState, root_file_id)
+    finally:
+      db_session.close()
+
+  def _save_sync_state(self, root_file_id, **values):
+    from domifile.models import DriveSyncState
+
+    db_session = self._create_db_session()
+    try:
+      sync_state = db_session.get(DriveSyncState, root_file_id)
+      if sync_state is None:
+        sync_state = DriveSyncState(root_file_id=root_file_id)
+        db_session.add(sync_state)
+      for name, value in values.items():
+        setattr(sync_state, name, value)
+      db_session.commit()
+    except Exception as e:
+      db_session.rollback()
+      raise
+    finally:
+      db_session.close()
+
+  def drive_file_document_parents(self, drive_file_ids):
+    """ Dict of Drive file ID to the parent folder ID recorded with its document, if any. """
+    from domifile.models import Document
+
+    if not drive_file_ids:
+      return {}
+    db_session = self._create_db_session()
+    try:
+      return dict(
+          db_session.execute(
+              select(Document.drive_file_id, Document.drive_parent_id).where(
+                  Document.drive_file_id.in_(drive_file_ids))).all())
+    finally:
+      db_session.close()
+
+  def _retry_files(self, retry_file_ids, root_file_id, ancestry):
+    """ Current metadata of files to retry that are still within the hierarchy. """
+    for file_id in retry_file_ids or {}:
+      try:
+        drive_file = self.drive_service.get(file_id)
+      except (DriveFileNotFoundError, PermissionError):
+        continue
+      if not drive_file.trashed and ancestry.is_within(drive_file.parent_id, root_file_id):
+        yield drive_file
+
+  @staticmethod
+  def _next_retries(retry_file_ids, failed_file_ids):
+    """ Failed attempts of files failed in this sync, without those over SYNC_RETRY_LIMIT. """
+    retries = {}
+    for file_id in failed_file_ids:
+      attempts = (retry_file_ids or {}).get(file_id, 0) + 1
+      if attempts > SYNC_RETRY_LIMIT:
+        logger.warning(f"{file_id} failed {attempts} times; not retrying until it changes")
+      else:
+        retries[file_id] = attempts
+    return retries
+
+  def _apply_hierarchy_changes(self, hierarchy_changes, pipeline, *, retry_files=()):
+    hierarchy = DriveFileHierarchy(drive_service=self.drive_service)
+
+    remove_file_ids = list(hierarchy_changes.remove_file_ids)
+    for folder_id in hierarchy_changes.remove_folder_ids:
+      remove_file_ids.extend(f.id for f in hierarchy.iterate_files(folder_id))
+    removed = self.remove_drive_file_documents(
+        remove_file_ids, parent_folder_ids=hierarchy_changes.gone_folder_ids)
+
+    def files_to_ingest():
+      yield from hierarchy_changes.ingest_files
+      yield from retry_files
+      for folder_id in hierarchy_changes.ingest_folder_ids:
+        yield from hierarchy.iterate_files(folder_id, on_folder=hierarchy_changes.ancestry.update)
+
+    stats = pipeline.run_files(files_to_ingest())
+    stats["removed"] = removed
+    return stats
+
+  def remove_drive_file_documents(self, drive_file_ids, *, parent_folder_ids=()):
+    """
+      Delete the documents, if any, of the given Drive files and of the files directly within
+      the given folders.  Returns the count deleted.
+    """
+    from domifile.models import Document
+
+    if not drive_file_ids and not parent_folder_ids:
+      return 0
+    db_session = self._create_db_session()
+    try:
+      documents = db_session.execute(
+          select(Document).where(
+              or_(Document.drive_file_id.in_(drive_file_ids),
+                  Document.drive_parent_id.in_(parent_folder_ids)))).scalars().all()
+      for document in documents:
+        db_session.delete(document)
+      if documents:
+        bump_corpus_version(db_session)
+      db_session.commit()
+      return len(documents)
+    except Exception as e:
+      db_session.rollback()
+      raise
+    finally:
+      db_session.close()
+
+  def ingest_drive_hierarchy_serially(self, root_file_id):
+    """ Ingest one file at a time.  Useful for debugging. """
 
     class _IngestVisitor(DriveFileVisitor):
 
@@ -39,8 +210,28 @@ class IngestService:
 
     logger.debug(f"[Ingest start] {root_file_id}")
     visitor = _IngestVisitor(self)
-    DriveFileHierarchy(visitor=visitor).traverse(root_file_id)
+    DriveFileHierarchy(drive_service=self.drive_service, visitor=visitor).traverse(root_file_id)
     logger.debug(f"[Ingest complete] {root_file_id}")
+    self._refresh_after_ingest()
+
+  @staticmethod
+  def _refresh_after_ingest():
+    """
+      Bring the in-process search snapshot, if configured, up to date with committed chunks,
+      then answer frequent questions ahead of time, if answers are cached.
+    """
+    from domifile.query import warm_answer_cache
+    from domifile.query.matrix import refresh_embedding_snapshot
+
+    try:
+      refresh_embedding_snapshot()
+    except Exception:
+      # Searches keep using the previous snapshot; the next refresh catches up.
+      logger.exception("embedding snapshot refresh failed")
+    try:
+      warm_answer_cache()
+    except Exception:
+      logger.exception("answer cache warming failed")
 
   @staticmethod
   def _create_db_session():
@@ -51,44 +242,112 @@ class IngestService:
 
   def ingest_drive_file(self, drive_file):
     """ Ingest one file.  May not be a folder. """
+
+    # If document is already ingested and up to date, skip.
+    if not self.drive_file_needs_ingest(drive_file):
+      logger.debug(f"  → already up to date")
+      return
+
+    # Load document text.
+    logger.debug(f"  → loading")
+    extractor = TextExtractor(self.drive_service, drive_file)
+    with tempfile.TemporaryDirectory() as tmpdir:
+      try:
+        path = extractor.download(tmpdir)
+        content_hash = TextExtractor.content_hash(path)
+      except TextExtractor.Error:  # Unsupported MIME type; extraction will say so.
+        path = content_hash = None
+
+      if self.drive_file_content_is_unchanged(drive_file, content_hash):
+        logger.debug(f"  → content unchanged")
+        return
+
+      # Pages stream from the extractor into chunking and embedding.
+      pages = self.iter_drive_file_pages(extractor, path)
+      self.store_drive_file_pages(drive_file, pages, content_hash=content_hash)
+
+  def drive_file_needs_ingest(self, drive_file):
+    """
+      Stage 1 of ingest: check for an existing, up to date document.  If only the file's
+      metadata has changed, as shown by its checksum, update the document's metadata.
+    """
+    return not self._refresh_unchanged_document(drive_file, drive_file.md5_checksum)
+
+  def drive_file_content_is_unchanged(self, drive_file, content_hash):
+    """
+      Stage 1b of ingest, for files without a Drive checksum: compare the hash of the
+      downloaded content.  If unchanged, update the document's metadata.
+    """
+    if drive_file.md5_checksum or not content_hash:
+      return False  # Already compared, or nothing to compare.
+    return self._refresh_unchanged_document(drive_file, content_hash)
+
+  def _refresh_unchanged_document(self, drive_file, content_hash):
     db_session = self._create_db_session()
     try:
-      # Query for existing document.
       document = DocumentFinder(db_session=db_session).document_for_drive_file(drive_file)
       document_helper = DocumentHelper(db_session=db_session,
                                        document=document,
                                        drive_file=drive_file)
-
-      # If document is already ingested and up to date, skip.
       if document_helper.document_is_up_to_date():
-        logger.debug(f"  → already up to date")
-        return
+        return True
+      if document_helper.document_content_is_unchanged(content_hash):
+        logger.debug(f"  → content unchanged; updating metadata")
+        document_helper.update_document_metadata()
+        bump_corpus_version(db_session)
+        db_session.commit()
+        return True
+      return False
+    finally:
+      db_session.close()
 
-      # Load document text.
-      logger.error(f"  → loading")
-      try:
-        text = TextExtractor(self.drive_service, drive_file).extract_text()
-        text = (text or "").strip()
-        logger.debug(f"  → \"{text[0:40]}{'...' if len(text) > 40 else ''}\"")
-      except TextExtractor.Error as e:  # Usually unsupported MIME type
-        text = ""
-        logger.debug(f"  → {str(e)}")
+  @staticmethod
+  def iter_drive_file_pages(extractor, path):
+    """ Stage 2 of ingest: generate (page number, text) of a downloaded file. """
+    try:
+      yield from extractor.iter_pages_from_path(path)
+    except TextExtractor.Error as e:  # Usually unsupported MIME type
+      logger.debug(f"  → {str(e)}")
+
+  def store_drive_file_pages(self,
+                             drive_file,
+                             pages,
+                             *,
+                             content_hash=None,
+                             extraction_error=None):
+    """
+      Stage 3 of ingest: chunk, embed, analyze and commit.  A document whose extraction failed
+      is committed without text, recording the error; it is retried on the next ingest or sync.
+    """
+    db_session = self._create_db_session()
+    try:
+      document = DocumentFinder(db_session=db_session).document_for_drive_file(drive_file)
+      document_helper = DocumentHelper(db_session=db_session,
+                                       document=document,
+                                       drive_file=drive_file)
 
       # Ensure document exists, clear ingested fields.
-      document = document_helper.open_document_for_ingest(text, TextExtractor.VERSION)
+      document = document_helper.open_document_for_ingest("",
+                                                          TextExtractor.VERSION,
+                                                          content_hash=content_hash)
+      document.extraction_error = extraction_error
       if document.id:  # Document already exists.
         document_helper.delete_all_chunks()
 
+      db_session.flush()  # Make document ID visible to session.
+      text = document_helper.create_chunks_from_pages(pages).strip()
+      document.text = text
+      logger.debug(f"  → \"{text[0:40]}{'...' if len(text) > 40 else ''}\"")
+
       if text:
-        db_session.flush()  # Make document ID visible to session.
-        document_helper.create_chunks()
-        db_session.flush()  # Make chunks visible to session.
         # Analyze document for type.
         doc_analyzer = DocumentAnalyzer(document)
         analysis = doc_analyzer.analyze_document()
+        document_helper.update_chunk_profile()
 
       # Finish.
       document.ingested_at = datetime.utcnow()
+      bump_corpus_version(db_session)
       db_session.commit()
       logger.debug(f"  → done.")
     except Exception as e:
@@ -112,6 +371,7 @@ class IngestService:
         document = DocumentFinder(db_session=self.db_session).document_for_drive_file(file)
         if document:
           self.db_session.delete(document)
+          bump_corpus_version(self.db_session)
           self.db_session.commit()
           self.count += 1
 
@@ -0,0 +1,49 @@
+# ingest/tests/conftest.py
+import os
+from types import SimpleNamespace
+
+import pytest
+
+# The OpenAI client is constructed on import; tests never call it.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from domifile.ingest.text import TextExtractor
+
+
+class FakeTextExtractor:
+  """ Downloads nothing; the content hash is the file ID. """
+
+  Error = TextExtractor.Error
+  Failed = TextExtractor.Failed
+
+  def __init__(self, drive_service, drive_file):
+    self.drive_file = drive_file
+
+  def download(self, tmpdir):
+    return f"{tmpdir}/{self.drive_file.id}"
+
+  @staticmethod
+  def content_hash(path):
+    return path.rsplit("/", 1)[-1]
+
+
+class FakeExtractor:
+  """ One page per file; a file named "bad-pdf" fails extraction. """
+
+  def __init__(self, **limits):
+    pass
+
+  def extract_pages(self, drive_file, path):
+    if drive_file.id == "bad-pdf":
+      raise TextExtractor.Failed("timed out")
+    return [(1, f"text of {drive_file.id}")]
+
+
+@pytest.fixture
+def fake_extraction(monkeypatch):
+  """ Run the ingest pipeline without Drive downloads or extraction processes. """
+  from domifile.ingest import pipeline
+
+  monkeypatch.setattr(pipeline, "TextExtractor", FakeTextExtractor)
+  monkeypatch.setattr(pipeline, "IsolatedExtractor", FakeExtractor)
+  monkeypatch.setattr(pipeline, "DriveService", SimpleNamespace(for_current_thread=lambda: None))
@@ -0,0 +1,46 @@
+# ingest/tests/test_analyzer.py
+
+import json
+from datetime import datetime
+
+from domifile.ingest import analyzer
+from domifile.ingest.excerpt import EXCERPT_GAP, document_excerpt
+from domifile.models import Document
+
+
+def test_excerpt_keeps_ends_and_date_dense_windows():
+  text = "A" * 100 + "x" * 1000 + "Paid 3/14/2025 and 4/1/2025. " + "y" * 1000 + "Z" * 50
+  excerpt = document_excerpt(text, head=100, tail=50, window=100, window_count=1)
+  parts = excerpt.split(EXCERPT_GAP)
+  assert parts[0] == "A" * 100
+  assert parts[-1] == "Z" * 50
+  assert len(parts) == 3
+  assert parts[1].startswith("Paid 3/14/2025 and 4/1/2025.")
+  assert document_excerpt("short") == "short"
+
+
+def test_excerpt_mode_analyzes_in_one_call(monkeypatch):
+  calls = []
+
+  def create_response(prompt, **options):
+    calls.append(options)
+    return json.dumps({
+        "doc_type": "bank_statement",
+        "doc_type_confidence": 90,
+        "document_date": "2025-02-03",
+        "date_range_start": "2025-01-01",
+        "date_range_end": "2025-01-31",
+        "date_range_confidence": 80,
+        "comments": None,
+    })
+
+  monkeypatch.setattr(analyzer, "create_response", create_response)
+  document = Document(filename="statement.pdf", text="Statement " * 5000)
+  analyzer.DocumentAnalyzer(document, mode="excerpt").analyze_document()
+
+  assert len(calls) == 1
+  assert calls[0]["json_schema"] == ("document_analysis", analyzer.ANALYSIS_SCHEMA)
+  assert document.doc_type == "bank_statement"
+  assert document.date_range_start == datetime(2025, 1, 1)
+  assert document.date_range_end == datetime(2025, 1, 31)
+  assert document.doc_type_analyzer_version == f"{analyzer.DocumentAnalyzer.VERSION}-excerpt"
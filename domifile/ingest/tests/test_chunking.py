@@ -0,0 +1,67 @@
+# ingest/tests/test_chunking.py
+
+import pytest
+
+from domifile.ingest import helpers
+from domifile.ingest.helpers import DocumentHelper, chunk_pages
+
+
+class DummyDocument:
+  id = 7
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+  calls = []
+
+  def create_embeddings(inputs):
+    calls.append(len(inputs))
+    return [[float(len(text))] for text in inputs]
+
+  monkeypatch.setattr(helpers, "create_embeddings", create_embeddings)
+  return calls
+
+
+@pytest.fixture
+def inserts(monkeypatch):
+  calls = []
+
+  def bulk_insert(db_session, model, rows):
+    calls.append(rows)
+
+  monkeypatch.setattr(helpers, "bulk_insert", bulk_insert)
+  return calls
+
+
+def test_chunk_pages_matches_fixed_size_slicing():
+  pages = [(1, "a" * 250), (2, "b" * 250), (3, "c" * 10)]
+  chunks = list(chunk_pages(pages, size=100))
+  assert "".join(text for _, text in chunks) == "\n".join(text for _, text in pages)
+  assert [len(text) for _, text in chunks] == [100] * 5 + [12]
+  assert [page_number for page_number, _ in chunks] == [1, 1, 1, 2, 2, 2]
+
+
+def test_chunk_pages_slices_long_page():
+  text = "".join(chr(ord("a") + n % 26) for n in range(10_050))
+  chunks = list(chunk_pages([(7, text), (8, "tail")], size=100))
+  assert [chunk for _, chunk in chunks[:-1]] == [text[i:i + 100] for i in range(0, 10_000, 100)]
+  assert chunks[-1] == (7, text[10_000:] + "\ntail")
+
+
+def test_create_chunks_from_pages_streams_in_batches(monkeypatch, fake_embeddings, inserts):
+  monkeypatch.setattr(helpers, "CHUNK_SIZE", 10)
+  monkeypatch.setattr(helpers, "EMBEDDING_BATCH_SIZE", 3)
+  helper = DocumentHelper(db_session=None, document=DummyDocument(), drive_file=None)
+
+  pages = ((n, f"page {n:03} " * 2) for n in range(1, 6))
+  text = helper.create_chunks_from_pages(pages)
+
+  assert text.startswith("page 001 page 001 \npage 002")
+  assert fake_embeddings == [3, 3, 3, 1]
+  assert [len(rows) for rows in inserts] == [3, 3, 3, 1]
+  rows = [row for rows in inserts for row in rows]
+  assert [row["document_id"] for row in rows] == [7] * 10
+  assert "".join(row["text"] for row in rows) == text
+  assert rows[0]["page_number"] == 1
+  assert rows[-1]["page_number"] == 5
+  assert [row["token_count"] for row in rows] == [len(row["text"]) // 3 + 1 for row in rows]
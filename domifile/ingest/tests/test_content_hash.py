@@ -0,0 +1,118 @@
+# ingest/tests/test_content_hash.py
+
+import hashlib
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from domifile.drive.types import DriveFile
+from domifile.ingest import service as service_module
+from domifile.ingest.service import IngestService
+from domifile.ingest.text import TextExtractor
+from domifile.models import Document
+
+GOOGLE_DOC = "application/vnd.google-apps.document"
+INGESTED_CONTENT = b"Minutes of the annual meeting"
+
+
+class FakeDrive:
+  """ Serves one file's content, exported or not. """
+
+  def __init__(self, content):
+    self.content = content
+    self.downloads = []
+
+  def download_file(self, drive_file, *, tmpdir, export_mime_type=None):
+    self.downloads.append(export_mime_type)
+    path = os.path.join(tmpdir, drive_file.id)
+    with open(path, "wb") as f:
+      f.write(self.content)
+    return path
+
+
+class FakeSession:
+
+  def commit(self):
+    pass
+
+  def close(self):
+    pass
+
+
+class HashingService(IngestService):
+
+  def __init__(self, content, document):
+    super().__init__(drive_service=FakeDrive(content))
+    self.document = document
+    self.stored = []
+
+  def _create_db_session(self):
+    return FakeSession()
+
+  def store_drive_file_pages(self, drive_file, pages, *, content_hash):
+    self.stored.append((drive_file.id, list(pages), content_hash))
+
+
+@pytest.fixture
+def document(monkeypatch):
+  document = Document(drive_file_id="f",
+                      content_hash=hashlib.md5(INGESTED_CONTENT).hexdigest(),
+                      text_extractor_version=TextExtractor.VERSION,
+                      drive_modified_time=datetime(2025, 1, 1, tzinfo=timezone.utc),
+                      ingested_at=datetime(2025, 1, 1))
+
+  class FakeFinder:
+
+    def __init__(self, db_session):
+      pass
+
+    def document_for_drive_file(self, drive_file):
+      return document
+
+  monkeypatch.setattr(service_module, "DocumentFinder", FakeFinder)
+  monkeypatch.setattr(service_module, "bump_corpus_version", lambda db_session: None)
+  return document
+
+
+def drive_file(mime_type, md5_checksum=None):
+  # Modified since the document was ingested.
+  metadata = {
+      "id": "f",
+      "name": "minutes",
+      "mimeType": mime_type,
+      "parents": ["root"],
+      "modifiedTime": "2025-02-01T00:00:00Z",
+  }
+  if md5_checksum:  # Google-native files have none.
+    metadata["md5Checksum"] = md5_checksum
+  return DriveFile(metadata)
+
+
+def test_unchanged_export_skips_reingest(document):
+  service = HashingService(INGESTED_CONTENT, document)
+  service.ingest_drive_file(drive_file(GOOGLE_DOC))
+  assert service.drive_service.downloads == ["text/plain"]
+  assert service.stored == []
+  # Only the metadata is brought up to date.
+  assert document.drive_modified_time == datetime(2025, 2, 1, tzinfo=timezone.utc)
+
+
+def test_changed_export_reingests(document):
+  service = HashingService(b"Minutes, amended", document)
+  service.ingest_drive_file(drive_file(GOOGLE_DOC))
+  assert service.stored == [("f", [(None, "Minutes, amended")],
+                             hashlib.md5(b"Minutes, amended").hexdigest())]
+
+
+def test_unchanged_checksum_skips_download(document):
+  service = HashingService(INGESTED_CONTENT, document)
+  service.ingest_drive_file(drive_file("text/plain", document.content_hash))
+  assert service.drive_service.downloads == []
+  assert service.stored == []
+
+
+def test_changed_checksum_reingests(document):
+  service = HashingService(b"New text", document)
+  service.ingest_drive_file(drive_file("text/plain", hashlib.md5(b"New text").hexdigest()))
+  assert [file_id for file_id, _, _ in service.stored] == ["f"]
@@ -0,0 +1,48 @@
+# ingest/tests/test_isolation.py
+
+import pytest
+
+from domifile.drive.types import DriveFile
+from domifile.ingest.isolation import IsolatedExtractor
+from domifile.ingest.text import TextExtractor
+
+
+def drive_file(mime_type):
+  return DriveFile({
+      "id": "f1",
+      "name": "f1",
+      "mimeType": mime_type,
+      "modifiedTime": "2024-01-01T00:00:00Z",
+  })
+
+
+@pytest.fixture
+def extractor():
+  return IsolatedExtractor(timeout=30)
+
+
+def test_extracts_pages_in_worker(extractor, tmp_path):
+  path = tmp_path / "f1.txt"
+  path.write_text("hello")
+  assert extractor.extract_pages(drive_file("text/plain"), str(path)) == [(None, "hello")]
+
+
+def test_unsupported_type_raises_error(extractor, tmp_path):
+  path = tmp_path / "f1.png"
+  path.write_bytes(b"")
+  with pytest.raises(TextExtractor.Error):
+    extractor.extract_pages(drive_file("image/png"), str(path))
+
+
+def test_corrupt_file_raises_failed(extractor, tmp_path):
+  path = tmp_path / "f1.pdf"
+  path.write_bytes(b"not a pdf")
+  with pytest.raises(TextExtractor.Failed):
+    extractor.extract_pages(drive_file("application/pdf"), str(path))
+
+
+def test_overrun_raises_failed(tmp_path):
+  path = tmp_path / "f1.txt"
+  path.write_text("hello")
+  with pytest.raises(TextExtractor.Failed, match="timed out"):
+    IsolatedExtractor(timeout=0).extract_pages(drive_file("text/plain"), str(path))
@@ -0,0 +1,84 @@
+# ingest/tests/test_pipeline.py
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from domifile.ingest.pipeline import IngestPipeline
+
+pytestmark = pytest.mark.usefixtures("fake_extraction")
+
+
+class FakeIngestService:
+
+  def __init__(self, failing_ids=()):
+    self.failing_ids = set(failing_ids)
+    self.stored = []
+
+  def drive_file_needs_ingest(self, drive_file):
+    return True
+
+  def drive_file_content_is_unchanged(self, drive_file, content_hash):
+    return False
+
+  def store_drive_file_pages(self, drive_file, pages, *, content_hash, extraction_error):
+    if drive_file.id in self.failing_ids:
+      raise RuntimeError("database is down")
+    self.stored.append((drive_file.id, list(pages), extraction_error))
+
+
+def drive_files(*file_ids):
+  return [SimpleNamespace(id=file_id, name=file_id) for file_id in file_ids]
+
+
+def run_pipeline(service, files, **workers):
+  ingest_pipeline = IngestPipeline(service, **workers)
+  return ingest_pipeline, ingest_pipeline.run_files(files)
+
+
+def test_single_workers_preserve_order():
+  service = FakeIngestService()
+  _, stats = run_pipeline(service,
+                          drive_files("a", "b", "c", "d"),
+                          download_workers=1,
+                          extract_workers=1,
+                          analyze_workers=1)
+  assert [file_id for file_id, _, _ in service.stored] == ["a", "b", "c", "d"]
+  assert service.stored[0][1] == [(1, "text of a")]
+  assert stats["ingested"] == 4
+
+
+def test_failures_are_counted_and_do_not_stop_others():
+  service = FakeIngestService(failing_ids=["b"])
+  _, stats = run_pipeline(service, drive_files("a", "b", "bad-pdf", "c"))
+  assert sorted(file_id for file_id, _, _ in service.stored) == ["a", "bad-pdf", "c"]
+  assert ("bad-pdf", [], "timed out") in service.stored
+  assert stats["failed"] == 1
+  assert stats["extraction_failed"] == 1
+  assert stats["ingested"] == 3
+
+
+def test_duplicate_files_are_ingested_once():
+  service = FakeIngestService()
+  _, stats = run_pipeline(service, drive_files("a", "b", "a", "b", "a"), analyze_workers=4)
+  assert sorted(file_id for file_id, _, _ in service.stored) == ["a", "b"]
+  assert stats["ingested"] == 2
+
+
+def test_workers_stop_when_listing_fails():
+
+  def listing():
+    yield from drive_files("a", "b")
+    raise RuntimeError("listing failed")
+
+  service = FakeIngestService()
+  ingest_pipeline = IngestPipeline(service)
+  with pytest.raises(RuntimeError, match="listing failed"):
+    ingest_pipeline.run_files(listing())
+
+  # Files queued before the failure are still finished, and no worker is left running.
+  assert sorted(file_id for file_id, _, _ in service.stored) == ["a", "b"]
+  for stage in ingest_pipeline.stages:
+    assert not any(thread.is_alive() for thread in stage.threads)
+  assert not [t for t in threading.enumerate() if t.name.startswith("ingest-")]
@@ -0,0 +1,125 @@
+# ingest/tests/test_sync.py
+
+from types import SimpleNamespace
+
+import pytest
+
+from domifile.drive import traverse
+from domifile.drive.tests.fakes import FakeDriveApi, FakeDriveService, file, folder
+from domifile.ingest import service as service_module
+from domifile.ingest.service import IngestService
+
+pytestmark = pytest.mark.usefixtures("fake_extraction")
+
+TREE = [folder("root"), file("a", "root"), file("b", "root")]
+
+
+class FakeSession:
+
+  def __init__(self):
+    self.rows = {}
+    self.opened = 0
+
+  def get(self, model, key):
+    return self.rows.get(key)
+
+  def add(self, row):
+    self.rows[row.root_file_id] = row
+
+  def commit(self):
+    pass
+
+  def rollback(self):
+    pass
+
+  def close(self):
+    self.opened -= 1
+
+
+class SyncingService(IngestService):
+  """ Sync against a fake Drive, storing file IDs instead of documents. """
+
+  def __init__(self, api, failing_ids=()):
+    super().__init__(drive_service=FakeDriveService(api))
+    self.failing_ids = set(failing_ids)
+    self.stored = []
+    self.sessions_open_while_storing = []
+    self.session = FakeSession()
+
+  def _create_db_session(self):
+    self.session.opened += 1
+    return self.session
+
+  def drive_file_document_parents(self, drive_file_ids):
+    return {}
+
+  def drive_file_needs_ingest(self, drive_file):
+    return True
+
+  def drive_file_content_is_unchanged(self, drive_file, content_hash):
+    return False
+
+  def store_drive_file_pages(self, drive_file, pages, **options):
+    self.sessions_open_while_storing.append(self.session.opened)
+    if drive_file.id in self.failing_ids:
+      raise RuntimeError("database is down")
+    self.stored.append(drive_file.id)
+
+  def remove_drive_file_documents(self, drive_file_ids, **options):
+    return 0
+
+  @staticmethod
+  def _refresh_after_ingest():
+    pass
+
+
+@pytest.fixture
+def api(monkeypatch):
+  api = FakeDriveApi(TREE)
+  monkeypatch.setattr(traverse, "DriveService",
+                      SimpleNamespace(for_current_thread=lambda: FakeDriveService(api)))
+  return api
+
+
+def test_failed_file_is_retried_by_next_sync(api):
+  service = SyncingService(api, failing_ids=["b"])
+  stats = service.sync_drive_hierarchy("root")
+  assert stats["failed"] == 1
+  assert service.stored == ["a"]
+  assert service.session.rows["root"].retry_file_ids == {"b": 1}
+
+  # Drive reports no changes, but the failed file is tried again.
+  service.failing_ids.clear()
+  service.stored.clear()
+  service.sync_drive_hierarchy("root")
+  assert service.stored == ["b"]
+  assert service.session.rows["root"].retry_file_ids == {}
+
+
+def test_retries_stop_at_limit(api):
+  service = SyncingService(api, failing_ids=["b"])
+  for attempts in range(1, service_module.SYNC_RETRY_LIMIT + 1):
+    service.sync_drive_hierarchy("root")
+    assert service.session.rows["root"].retry_file_ids == {"b": attempts}
+  service.sync_drive_hierarchy("root")
+  assert service.session.rows["root"].retry_file_ids == {}
+
+
+def test_retry_skips_files_since_trashed(api):
+  service = SyncingService(api, failing_ids=["b"])
+  service.sync_drive_hierarchy("root")
+  api.trash("b")
+  service.failing_ids.clear()
+  service.sync_drive_hierarchy("root")
+  assert "b" not in service.stored
+  assert service.session.rows["root"].retry_file_ids == {}
+
+
+def test_sync_state_is_not_held_open_during_ingest(api):
+  service = SyncingService(api)
+  service.sync_drive_hierarchy("root")
+  api.put(dict(api.by_id["a"], modifiedTime="2025-02-01T00:00:00Z"))
+  service.sync_drive_hierarchy("root")
+  assert sorted(service.stored) == ["a", "a", "b"]
+  assert set(service.sessions_open_while_storing) == {0}
+  assert service.session.opened == 0
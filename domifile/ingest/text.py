@@ -2,8 +2,11 @@
 
 import csv
 import docx
+import hashlib
 import tempfile
+from pdfminer.high_level import extract_pages as pdf_extract_pages
 from pdfminer.high_level import extract_text as pdf_extract_text
+from pdfminer.layout import LTTextContainer
 
 
 class TextExtractor:
@@ -13,6 +16,10 @@ class TextExtractor:
   class Error(Exception):
     pass
 
+  class Failed(Exception):
+    """ Extraction of a supported file could not be completed. """
+    pass
+
   def __init__(self, drive_service, drive_file):
     self.drive_service = drive_service
     self.drive_file = drive_file
@@ -20,17 +27,50 @@ class TextExtractor:
   def extract_text(self) -> str:
     """ Main entry point  """
 
+    with tempfile.TemporaryDirectory() as tmpdir:
+      path = self.download(tmpdir)
+      return self.extract_text_from_path(path)
+
+  def download(self, tmpdir) -> str:
+    """ Download (or export) the file into tmpdir.  Returns the local path. """
+
     mime_type = self.drive_file.mime_type
+    if not self._get_extract_func(mime_type):
+      raise self.Error(f"Unsupported mime type: {mime_type}")
+
     export_mime_type = self._get_export_mime_type(mime_type)
+    return self.drive_service.download_file(self.drive_file,
+                                            tmpdir=tmpdir,
+                                            export_mime_type=export_mime_type)
+
+  def extract_text_from_path(self, path) -> str:
+    """ Extract text from a previously downloaded file. """
+
+    mime_type = self.drive_file.mime_type
     extract_func = self._get_extract_func(mime_type)
     if not extract_func:
       raise self.Error(f"Unsupported mime type: {mime_type}")
+    return extract_func(path)
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-      path = self.drive_service.download_file(self.drive_file,
-                                              tmpdir=tmpdir,
-                                              export_mime_type=export_mime_type)
-      return extract_func(path)
+  def iter_pages_from_path(self, path):
+    """
+      Generator of (page number, text) of a previously downloaded file.  PDFs are parsed one
+      page at a time; other types yield their whole text as a single page numbered None.
+    """
+
+    if self.drive_file.mime_type == "application/pdf":
+      yield from self._iter_pdf_pages(path)
+    else:
+      yield None, self.extract_text_from_path(path)
+
+  @staticmethod
+  def content_hash(path) -> str:
+    """ MD5 of a downloaded file, comparable with the Drive md5Checksum. """
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+      for block in iter(lambda: f.read(1 << 20), b""):
+        md5.update(block)
+    return md5.hexdigest()
 
   @classmethod
   def _get_export_mime_type(cls, mime_type: str) -> str:
@@ -64,6 +104,15 @@ class TextExtractor:
   def _extract_pdf(path: str) -> str:
     return pdf_extract_text(path)
 
+  @staticmethod
+  def _iter_pdf_pages(path: str):
+    # extract_pages parses lazily, so only one page's layout is held at a time.
+    for page_layout in pdf_extract_pages(path):
+      texts = [
+          element.get_text() for element in page_layout if isinstance(element, LTTextContainer)
+      ]
+      yield page_layout.pageid, "".join(texts)
+
   @staticmethod
   def _extract_docx(path: str) -> str:
     doc = docx.Document(path)
@@ -4,11 +4,12 @@ from datetime import datetime
 from sqlalchemy import select, delete
 
 from ..db import db_transaction
+from ..db.bulk import bulk_insert
 from ..drive import DriveService
 from .extractor import TextExtractor
 from ..models import Document, Chunk
 from .chunker import chunk_text
-from ..openai_adapter import create_embedding
+from ..openai_adapter import create_embeddings
 
 logger = logging.getLogger(__name__)
 
@@ -103,6 +104,10 @@ class Ingester:
     return doc
 
   def _chunk_text(self, text, doc, db_session):
-    for c in chunk_text(text):
-      embedding = create_embedding(c)
-      db_session.add(Chunk(document_id=doc.id, text=c, embedding=embedding))
+    chunks = chunk_text(text)
+    embeddings = create_embeddings(chunks)
+    bulk_insert(db_session, Chunk, [{
+        "document_id": doc.id,
+        "text": c,
+        "embedding": embedding,
+    } for c, embedding in zip(chunks, embeddings)])
@@ -1,11 +1,15 @@
 import logging
-import json
-import numpy as np
 import re
 from datetime import date
 from sqlalchemy import text
 
-from ..openai_adapter import create_embedding, create_response
+from ..openai_adapter import create_embeddings, create_response
+from domifile.query.fusion import reciprocal_rank_fusion
+from domifile.query.mmr import mmr
+from domifile.query.vector_index import tune_vector_search
+
+# Bump when the planner prompt changes.  Also invalidates cached LLM responses.
+PLANNER_VERSION = "1"
 
 
 def create_planner_prompt(question: str) -> str:
@@ -25,82 +29,60 @@ Question:
 
 def plan_queries(question: str) -> list[str]:
   prompt = create_planner_prompt(question)
-  output_text = create_response(prompt)
+  output_text = create_response(prompt, cache_version=f"plan-{PLANNER_VERSION}")
   lines = output_text.strip().split("\n")
   queries = [l.strip("- ").strip() for l in lines if l.strip() and len(l.strip()) > 3]
   return queries[:4]
 
 
-def fetch_relevant_chunks(qvec):
+def fetch_relevant_chunks(qvecs, *, limit=12, ef_search=None, probes=None):
+  """
+    Nearest chunks by cosine distance to each of several query vectors, in one statement.
+    Returns one ranked list of rows per query vector; each row carries query_index.
+    ef_search/probes tune recall of the index.
+  """
   from domifile.db import db_transaction
   from domifile.models import Chunk
 
-  with db_transaction(Chunk) as db_session:
+  if not qvecs:
+    return []
 
-    sql = text("""
-      SELECT d.filename, d.drive_file_id, c.id, c.text, c.embedding
-      FROM chunks c
+  values = ", ".join(f"({i}, CAST(:qvec_{i} AS vector))" for i in range(len(qvecs)))
+  params = {f"qvec_{i}": qvec for i, qvec in enumerate(qvecs)}
+
+  with db_transaction(Chunk) as db_session:
+    tune_vector_search(db_session, ef_search=ef_search, probes=probes)
+
+    sql = text(f"""
+      SELECT q.query_index, d.filename, d.drive_file_id, c.id, c.text, c.embedding
+      FROM (VALUES {values}) AS q(query_index, qvec)
+      CROSS JOIN LATERAL (
+        SELECT c.id, c.document_id, c.text, c.embedding, c.embedding <=> q.qvec AS distance
+        FROM chunks c
+        ORDER BY c.embedding <=> q.qvec
+        LIMIT :limit
+      ) c
       JOIN documents d ON d.id = c.document_id
-      ORDER BY c.embedding <=> CAST(:qvec AS vector)
-      LIMIT :limit
+      ORDER BY q.query_index, c.distance
     """)
 
-    chunks = db_session.execute(sql, {"qvec": qvec, "limit": 12}).fetchall()
-    return chunks
-
-
-def vec(v):
-  if isinstance(v, str):
-    v = json.loads(v)
-  a = np.array(v, dtype=float)
-  return a / np.linalg.norm(a)  # Normalize
-
-
-def mmr(query_vec, rows, k=4, lambda_=0.7):
-  query_vec = vec(query_vec)
-  embeddings = {r.id: vec(r.embedding) for r in rows}
-
-  selected = []
-  candidates = rows[:]
-
-  while len(selected) < k and candidates:
-    best = None
-    best_score = -1e9
-
-    for r in candidates:
-      embedding = embeddings[r.id]
-      rel = np.dot(query_vec, embedding)
-
-      div = 0
-      if selected:
-        div = max(np.dot(embedding, embeddings[s.id]) for s in selected)
-
-      score = lambda_ * rel - (1 - lambda_) * div
-
-      if score > best_score:
-        best_score = score
-        best = r
-
-    selected.append(best)
-    candidates.remove(best)
-
-  return selected
+    rows = db_session.execute(sql, {**params, "limit": limit}).fetchall()
 
+  rankings = [[] for _ in qvecs]
+  for row in rows:
+    rankings[row.query_index].append(row)
+  return rankings
 
-def select_chunks(question):
-  queries = plan_queries(question)
 
-  all_chunks = []
+def select_chunks(question, **search_options):
+  queries = plan_queries(question) or [question]
 
-  for q in queries:
-    qvec = create_embedding(q)
-    chunks = fetch_relevant_chunks(qvec)
-    all_chunks.extend(chunks)
+  # The question and all planned queries in one embeddings request.
+  qvec, *query_vecs = create_embeddings([question, *queries], persistent_cache=False)
 
-  unique_chunks = {c.id: c for c in all_chunks}
-  chunks = list(unique_chunks.values())
+  rankings = fetch_relevant_chunks(query_vecs, **search_options)
+  chunks = [row for row, _ in reciprocal_rank_fusion(rankings, key=lambda row: row.id)]
 
-  qvec = create_embedding(question)
   chunks = mmr(qvec, chunks, k=4)
   return chunks
 
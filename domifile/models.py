@@ -1,7 +1,9 @@
 # domifile/models.py
 
 from datetime import datetime, date
-from sqlalchemy import (Integer, String, Text, ForeignKey, DateTime, Date, Float, Numeric, JSON)
+from sqlalchemy import (Integer, BigInteger, String, Text, ForeignKey, DateTime, Date, Float,
+                        Numeric, JSON, Index, Computed)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from pgvector.sqlalchemy import Vector
 
@@ -12,6 +14,22 @@ class Base(DeclarativeBase):
 
 MODEL_VECTOR_SIZE = 1536  # OpenAI dependency
 
+# Text search configuration of chunk text.
+TEXT_SEARCH_CONFIG = "english"
+
+# Approximate nearest neighbor index on chunk embeddings; see query/vector_index.py.
+EMBEDDING_INDEX_NAME = "ix_chunks_embedding"
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+
+
+def _full_embedding_index_wanted(ddl, target, bind, **kwargs):
+  # Compact storage modes search an index of their own, so the full one would only cost space
+  # and write time.
+  from domifile.query.vector_index import get_vector_storage
+  return get_vector_storage().mode == "full"
+
+
 # -------------------------
 # Documents
 # -------------------------
@@ -30,6 +48,9 @@ class Document(Base):
   # The Drive ID.
   drive_file_id: Mapped[str] = mapped_column(String, index=True, unique=True, nullable=False)
 
+  # The Drive ID of the containing folder, for clearing folders that Drive can no longer list.
+  drive_parent_id: Mapped[str | None] = mapped_column(String, index=True)
+
   # Cached drive file fields.
   filename: Mapped[str] = mapped_column(String)
   mime_type: Mapped[str] = mapped_column(String)
@@ -37,6 +58,11 @@ class Document(Base):
   # Used to determine text freshness
   drive_modified_time: Mapped[datetime] = mapped_column(DateTime(timezone=True))
 
+  # MD5 of the downloaded bytes (the exported text, for Google-native files).  Matches the
+  # Drive md5Checksum of binary files.  Used to skip files whose content has not changed.
+  content_hash: Mapped[str | None] = mapped_column(String)
+  file_size: Mapped[int | None] = mapped_column(BigInteger)
+
   # -------------------------
   # Support for text extraction.
   # -------------------------
@@ -47,6 +73,9 @@ class Document(Base):
   # Version of extractor module used to extract text.
   text_extractor_version: Mapped[str | None] = mapped_column(String)
 
+  # Why text extraction failed (timeout, memory limit, crash), if it did.
+  extraction_error: Mapped[str | None] = mapped_column(String)
+
   # document.chunks
   chunks: Mapped[list["Chunk"]] = relationship(back_populates="document",
                                                cascade="all, delete-orphan")
@@ -91,8 +120,11 @@ class Document(Base):
         "filename": self.filename,
         "mime_type": self.mime_type,
         "drive_modified_time": str(self.drive_modified_time),
+        "content_hash": self.content_hash,
+        "file_size": self.file_size,
         "text": self.text,
         "text_extractor_version": self.text_extractor_version,
+        "extraction_error": self.extraction_error,
         "doc_type": self.doc_type,
         "doc_type_confidence": self.doc_type_confidence,
         "doc_type_analyzer_version": self.doc_type_analyzer_version,
@@ -112,6 +144,18 @@ class Document(Base):
 
 class Chunk(Base):
   __tablename__ = "chunks"
+  __table_args__ = (Index(EMBEDDING_INDEX_NAME,
+                          "embedding",
+                          postgresql_using="hnsw",
+                          postgresql_with={
+                              "m": HNSW_M,
+                              "ef_construction": HNSW_EF_CONSTRUCTION
+                          },
+                          postgresql_ops={
+                              "embedding": "vector_cosine_ops"
+                          }).ddl_if(callable_=_full_embedding_index_wanted),
+                    Index("ix_chunks_text_search", "text_search", postgresql_using="gin"),
+                    Index("ix_chunks_coverage", "coverage_start", "coverage_end"))
 
   id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
@@ -119,14 +163,109 @@ class Chunk(Base):
 
   text: Mapped[str] = mapped_column(Text)
 
+  # Lexical index of text, maintained by the database.
+  text_search: Mapped[str] = mapped_column(
+      TSVECTOR, Computed(f"to_tsvector('{TEXT_SEARCH_CONFIG}', text)", persisted=True))
+
   embedding: Mapped[list[float]] = mapped_column(Vector(MODEL_VECTOR_SIZE))
 
+  # Copied from the document once it has been analyzed, so that searches can filter on them
+  # within the vector index scan.
+  doc_type: Mapped[str | None] = mapped_column(String, index=True)
+  document_date: Mapped[date | None] = mapped_column(Date, index=True)
   coverage_start: Mapped[date | None] = mapped_column(Date)
   coverage_end: Mapped[date | None] = mapped_column(Date)
 
+  # Page on which the chunk starts, for paginated (PDF) documents.
+  page_number: Mapped[int | None] = mapped_column(Integer)
+
+  # Estimated tokens of text, for packing answer contexts; see query/context.py.
+  token_count: Mapped[int | None] = mapped_column(Integer)
+
   document: Mapped["Document"] = relationship(back_populates="chunks")
 
 
+# -------------------------
+# Embedding and LLM response caches
+# -------------------------
+
+
+class EmbeddingCacheEntry(Base):
+  __tablename__ = "embedding_cache"
+
+  model: Mapped[str] = mapped_column(String, primary_key=True)
+
+  # SHA-256 of the whitespace-normalized text.
+  text_hash: Mapped[str] = mapped_column(String, primary_key=True)
+
+  embedding: Mapped[list[float]] = mapped_column(Vector(MODEL_VECTOR_SIZE))
+
+
+class ResponseCacheEntry(Base):
+  __tablename__ = "response_cache"
+
+  # SHA-256 of model, version and prompt.
+  key: Mapped[str] = mapped_column(String, primary_key=True)
+
+  model: Mapped[str] = mapped_column(String)
+
+  # Caller-supplied; identifies the logic that produced the prompt.
+  version: Mapped[str] = mapped_column(String, index=True)
+
+  response: Mapped[str] = mapped_column(Text)
+
+  # Past this, the entry is ignored and eventually purged; see ResponseCache.
+  expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), index=True)
+
+
+# -------------------------
+# Answer cache
+# -------------------------
+
+
+class CorpusState(Base):
+  __tablename__ = "corpus_state"
+
+  # Single row.
+  id: Mapped[int] = mapped_column(Integer, primary_key=True, default=1)
+
+  # Incremented by every ingest commit that changes documents; scopes cached answers.
+  version: Mapped[int] = mapped_column(BigInteger, default=0)
+
+  updated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+
+class AnswerCacheEntry(Base):
+  __tablename__ = "answer_cache"
+
+  id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+  # Corpus version as of the start of answering.
+  corpus_version: Mapped[int] = mapped_column(BigInteger, index=True)
+
+  question: Mapped[str] = mapped_column(Text)
+  question_embedding: Mapped[list[float]] = mapped_column(Vector(MODEL_VECTOR_SIZE))
+
+  # The result of query.answer_question.
+  answer: Mapped[dict] = mapped_column(JSON)
+
+  created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+  hit_count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class QuestionLogEntry(Base):
+  __tablename__ = "question_log"
+
+  # SHA-256 of the whitespace-normalized, lowercased question.
+  question_hash: Mapped[str] = mapped_column(String, primary_key=True)
+
+  # As last asked.
+  question: Mapped[str] = mapped_column(Text)
+
+  ask_count: Mapped[int] = mapped_column(Integer, default=0)
+  last_asked_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+
+
 # -------------------------
 # Extracted Facts (M2 core)
 # -------------------------
@@ -195,3 +334,26 @@ class DocumentRelationship(Base):
 
   relationship_type: Mapped[str] = mapped_column(String)
   # 'derived_from', 'related_to'
+
+
+# -------------------------
+# Incremental sync
+# -------------------------
+
+
+class DriveSyncState(Base):
+  __tablename__ = "drive_sync_state"
+
+  # The root of the synced hierarchy.
+  root_file_id: Mapped[str] = mapped_column(String, primary_key=True)
+
+  # Drive changes feed position as of the last sync.
+  start_page_token: Mapped[str] = mapped_column(String)
+
+  # Cached folder ID -> parent folder ID.
+  folder_parents: Mapped[dict | None] = mapped_column(JSON)
+
+  # Drive file ID -> failed attempts, of files to retry on the next sync.
+  retry_file_ids: Mapped[dict | None] = mapped_column(JSON)
+
+  synced_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
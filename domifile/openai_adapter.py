@@ -1,16 +1,35 @@
+import asyncio
 import logging
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+from .cache import embedding_cache, response_cache, text_hash
 
 logger = logging.getLogger(__name__)
 openai = OpenAI()
+async_openai = AsyncOpenAI()
 
 EMBEDDING_MODEL = "text-embedding-3-small"
 
+# Per-request limits of the embeddings endpoint.
+MAX_EMBEDDING_INPUTS_PER_REQUEST = 2048
+MAX_EMBEDDING_TOKENS_PER_REQUEST = 300_000
+MAX_EMBEDDING_TOKENS_PER_INPUT = 8191
+
 RESPONSE_MODEL = "gpt-4.1-mini"
 
 
+def estimate_tokens(text):
+  """ Conservative token estimate (English averages ~4 chars/token; assume 3). """
+  return len(text) // 3 + 1
+
+
 def create_embedding(input):
-  """ """
+  """ Embed one input.  Consults the in-process cache only; intended for query time. """
+
+  key = text_hash(input)
+  cached = embedding_cache.get_many(EMBEDDING_MODEL, [key], persistent=False)
+  if key in cached:
+    return cached[key]
 
   result = openai.embeddings.create(
       model=EMBEDDING_MODEL,
@@ -20,16 +39,184 @@ def create_embedding(input):
   data = result.data
   logger.debug(f"input={input} embeddings={len(data)}")
 
+  embedding_cache.put_many(EMBEDDING_MODEL, {key: data[0].embedding}, persistent=False)
   return data[0].embedding
 
 
-def create_response(input):
-  """ """
+def batch_embedding_inputs(inputs):
+  """
+    Partition a list of input strings into batches that respect the embeddings endpoint
+    limits.  Yields lists of (index, input) pairs, index referring to the original list.
+  """
+  batch = []
+  batch_tokens = 0
+  for index, input in enumerate(inputs):
+    tokens = estimate_tokens(input)
+    if tokens > MAX_EMBEDDING_TOKENS_PER_INPUT:
+      raise ValueError(f"Embedding input {index} is too long (~{tokens} tokens)")
+    if batch and (len(batch) >= MAX_EMBEDDING_INPUTS_PER_REQUEST
+                  or batch_tokens + tokens > MAX_EMBEDDING_TOKENS_PER_REQUEST):
+      yield batch
+      batch = []
+      batch_tokens = 0
+    batch.append((index, input))
+    batch_tokens += tokens
+  if batch:
+    yield batch
+
+
+def create_embeddings(inputs, *, persistent_cache=True):
+  """
+    Embed many inputs, packing as many as possible into each request.
+    Returns a list of embeddings in the same order as the inputs.
+
+    Inputs already embedded are taken from the cache, the database tier included unless
+    persistent_cache is False.  Duplicate inputs are embedded once.
+  """
+  keys = [text_hash(input) for input in inputs]
+  cached = embedding_cache.get_many(EMBEDDING_MODEL, list(set(keys)), persistent=persistent_cache)
+
+  # Embed the first occurrence of each uncached text.
+  to_embed = {}
+  for key, input in zip(keys, inputs):
+    if key not in cached and key not in to_embed:
+      to_embed[key] = input
+  uncached_keys = list(to_embed.keys())
+  uncached_inputs = list(to_embed.values())
+
+  fresh = {}
+  for batch in batch_embedding_inputs(uncached_inputs):
+    result = openai.embeddings.create(
+        model=EMBEDDING_MODEL,
+        input=[input for _, input in batch],
+    )
+    # Results carry the index of the input within the request; map back by index.
+    for item in result.data:
+      fresh[uncached_keys[batch[item.index][0]]] = item.embedding
+    logger.debug(f"inputs={len(batch)} embeddings={len(result.data)}")
+
+  embedding_cache.put_many(EMBEDDING_MODEL, fresh, persistent=persistent_cache)
+  logger.debug(f"embeddings: {len(inputs)} inputs, {len(fresh)} embedded, "
+               f"cache {embedding_cache.stats.snapshot()}")
+
+  return [cached.get(key) or fresh[key] for key in keys]
+
+
+def create_response(input, *, cache_version=None, persistent_cache=True, json_schema=None):
+  """
+    Run the response model at temperature 0.
+
+    Callers opt in to caching by passing a cache_version tag, which should change whenever
+    the logic behind the prompt changes.  Identical prompts with the same tag are answered
+    from the cache, including the database tier unless persistent_cache is False.
+
+    json_schema, a (name, schema) pair, constrains the output to JSON of the schema
+    (structured outputs, strict).  The cache_version should cover the schema.
+  """
+
+  if cache_version is not None:
+    key = response_cache.key_for(RESPONSE_MODEL, cache_version, input)
+    cached = response_cache.get(key, persistent=persistent_cache)
+    if cached is not None:
+      logger.debug(f"response cache hit: {cache_version}")
+      return cached
+
+  options = {}
+  if json_schema is not None:
+    name, schema = json_schema
+    options["text"] = {
+        "format": {
+            "type": "json_schema",
+            "name": name,
+            "schema": schema,
+            "strict": True
+        }
+    }
 
   result = openai.responses.create(
       model=RESPONSE_MODEL,
       temperature=0,
       input=input,
+      **options,
   )
 
+  if cache_version is not None:
+    response_cache.put(key,
+                       result.output_text,
+                       model=RESPONSE_MODEL,
+                       version=cache_version,
+                       persistent=persistent_cache)
+
   return result.output_text
+
+
+def create_response_stream(input):
+  """ Run the response model at temperature 0, yielding the output text as it is generated. """
+  stream = openai.responses.create(
+      model=RESPONSE_MODEL,
+      temperature=0,
+      input=input,
+      stream=True,
+  )
+  for event in stream:
+    if event.type == "response.output_text.delta":
+      yield event.delta
+
+
+# --------------------------------------------------------------------------------
+# Async variants, for the async query path.  They share the caches above; the database tier
+# of the response cache is consulted in a worker thread.
+
+
+async def create_embedding_async(input):
+  """ As create_embedding. """
+  key = text_hash(input)
+  cached = embedding_cache.get_many(EMBEDDING_MODEL, [key], persistent=False)
+  if key in cached:
+    return cached[key]
+
+  result = await async_openai.embeddings.create(
+      model=EMBEDDING_MODEL,
+      input=input,
+  )
+  embedding_cache.put_many(EMBEDDING_MODEL, {key: result.data[0].embedding}, persistent=False)
+  return result.data[0].embedding
+
+
+async def create_response_async(input, *, cache_version=None, persistent_cache=True):
+  """ As create_response. """
+  if cache_version is not None:
+    key = response_cache.key_for(RESPONSE_MODEL, cache_version, input)
+    cached = await asyncio.to_thread(response_cache.get, key, persistent=persistent_cache)
+    if cached is not None:
+      logger.debug(f"response cache hit: {cache_version}")
+      return cached
+
+  result = await async_openai.responses.create(
+      model=RESPONSE_MODEL,
+      temperature=0,
+      input=input,
+  )
+
+  if cache_version is not None:
+    await asyncio.to_thread(response_cache.put,
+                            key,
+                            result.output_text,
+                            model=RESPONSE_MODEL,
+                            version=cache_version,
+                            persistent=persistent_cache)
+
+  return result.output_text
+
+
+async def create_response_stream_async(input):
+  """ As create_response_stream. """
+  stream = await async_openai.responses.create(
+      model=RESPONSE_MODEL,
+      temperature=0,
+      input=input,
+      stream=True,
+  )
+  async for event in stream:
+    if event.type == "response.output_text.delta":
+      yield event.delta
@@ -1,13 +1,18 @@
 # domifile/query/__init__.py
 import json
 import logging
+from collections import namedtuple
 from datetime import date
 
 from domifile.db import db_transaction
 from domifile.models import ExtractedFact
-from domifile.openai_adapter import create_response
+from domifile.openai_adapter import create_embedding, create_response, create_response_stream
+from .answer_cache import get_answer_cache
 from .classify import classify_query
-from .rag import answer_rag
+from . import routing
+from .rag import (build_sources, create_prompt, finish_rag, format_context,
+                  search_filters_for_intent, select_chunks)
+from .routing import get_route_budgets
 from .sources import build_sources_from_documents
 from .structured import find_event
 from .hybrid import fetch_chunks_for_document
@@ -15,12 +20,106 @@ from .hybrid import fetch_chunks_for_document
 logger = logging.getLogger("query")
 
 
-def answer_question(question):
+def answer_question(question, *, use_cache=True, log_question=True, **search_options):
+  """
+    search_options (ef_search, probes) tune recall of the vector search.  Unless they are
+    given, or use_cache is false, answers come from and go to the answer cache, if configured.
+    log_question counts the question for cache warming.
+  """
   logger.debug(f"answer_question {question}")
 
-  intent = classify_query(question)
+  search_options = {key: value for key, value in search_options.items() if value is not None}
+  cache = get_answer_cache() if use_cache and not search_options else None
+  if cache is None:
+    return _answer_question(question, **search_options)
+
+  if log_question:
+    cache.log_question(question)
+  qvec = create_embedding(question)  # Kept in memory for retrieval.
+  corpus_version, answer = cache.lookup(question, qvec)
+  if answer is not None:
+    return answer
+
+  answer = _answer_question(question)
+  if _is_cacheable(answer):
+    cache.store(question, qvec, answer, corpus_version=corpus_version)
+  return answer
+
+
+def warm_answer_cache(*, count=None):
+  """ Answer the most frequently asked questions ahead of time.  Returns counts, or None. """
+  cache = get_answer_cache()
+  if cache is None:
+    return None
+  return cache.warm(lambda question: answer_question(question, log_question=False), count=count)
+
+
+def _answer_question(question, **search_options):
+  route = route_question(question, **search_options)
+  if route.result is not None:
+    return route.result
+  prompt = create_prompt(format_context(route.chunks), question)
+  return _mark_degraded(finish_rag(create_response(prompt), route.chunks), route)
+
+
+# The route taken to answer a question: the answer if it came from facts, else the chunks to
+# generate it from.  A route is degraded if classification or retrieval overran its budget.
+Route = namedtuple("Route", ["type", "intent", "result", "chunks", "degraded"])
+
+
+def _mark_degraded(result, route):
+  if route.degraded:
+    result["degraded"] = True
+  return result
+
+
+def _is_cacheable(result):
+  # An answer degraded by one slow asking would otherwise be served to every similar question.
+  return "answer" in result and not result.get("degraded")
+
+
+def route_question(question, **search_options):
+  """
+    Classify the question and answer it from facts if it calls for that, meanwhile retrieving
+    chunks, unfiltered, in case it does not.  Each stage is bounded by its time budget (see
+    routing.py); retrieval that overruns its budget leaves no chunks.  Overruns of
+    classification or retrieval mark the route degraded.  Retrieval starts over
+    with filters if classification implies any.
+  """
+  budgets = get_route_budgets()
+  qvec = create_embedding(question)  # Shared by the classifier and retrieval.
+  retrieval = routing.start(select_chunks, question, **search_options)
+
+  intent = routing.result_within(routing.start(classify_query, question, qvec), budgets.classify,
+                                 "classification")
+  degraded = intent is None
+  intent = intent or {"type": "rag"}
   logger.debug(f"classified as {json.dumps(intent)}")
 
+  if intent["type"] in ("structured", "hybrid"):
+    result = routing.result_within(routing.start(_answer_from_facts, question, intent),
+                                   getattr(budgets, intent["type"]), f"{intent['type']} answer")
+    if result is not None:
+      retrieval.cancel()
+      return Route(intent["type"], intent, result, None, degraded)
+
+  filters = search_filters_for_intent(intent)
+  if filters:
+    retrieval.cancel()
+    retrieval = routing.start(select_chunks, question, **filters, **search_options)
+  try:
+    chunks = routing.wait(retrieval, budgets.rag)
+  except routing.TimeoutError:
+    # Answer without context, which says that the documents do not tell.
+    retrieval.cancel()
+    logger.info(f"retrieval exceeded its budget of {budgets.rag}s")
+    chunks = []
+    degraded = True
+  return Route("rag", intent, None, chunks, degraded)
+
+
+def _answer_from_facts(question, intent):
+  """ The structured or hybrid answer, per intent, or None if there is none. """
   if intent["type"] == "structured":
     result = answer_structured(question, intent)
     logger.debug(f"structured result: {json.dumps(result)}")
@@ -33,7 +132,54 @@ def answer_question(question):
     if "answer" in result:
       return result
 
-  return answer_rag(question)  # fallback
+  return None
+
+
+def stream_answer(question, *, use_cache=True, log_question=True):
+  """
+    Answer a question as a sequence of (event, data) pairs, for streaming to the client:
+      * route - {"type": the route taken: "cached", "structured", "hybrid" or "rag"}
+      * sources - the candidate sources, as soon as they are known
+      * delta - {"text": the next piece of the answer}
+      * done - the result, as answer_question returns it, with sources narrowed to those cited
+    Only retrieval answers are generated incrementally; others arrive in one delta.
+  """
+  logger.debug(f"stream_answer {question}")
+
+  cache = get_answer_cache() if use_cache else None
+  if cache is not None:
+    if log_question:
+      cache.log_question(question)
+    qvec = create_embedding(question)
+    corpus_version, result = cache.lookup(question, qvec)
+    if result is not None:
+      yield from _stream_result("cached", result)
+      return
+
+  route = route_question(question)
+  if route.result is not None:
+    result = route.result
+    yield from _stream_result(route.type, result)
+  else:
+    yield "route", {"type": "rag"}
+    chunks = route.chunks
+    yield "sources", build_sources(chunks, [c.id for c in chunks])
+    parts = []
+    for delta in create_response_stream(create_prompt(format_context(chunks), question)):
+      parts.append(delta)
+      yield "delta", {"text": delta}
+    result = _mark_degraded(finish_rag("".join(parts), chunks), route)
+    yield "done", result
+
+  if cache is not None and _is_cacheable(result):
+    cache.store(question, qvec, result, corpus_version=corpus_version)
+
+
+def _stream_result(route, result):
+  yield "route", {"type": route}
+  yield "sources", result.get("sources", [])
+  yield "delta", {"text": result["answer"]}
+  yield "done", result
 
 
 def answer_structured(question, intent):
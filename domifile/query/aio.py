@@ -0,0 +1,228 @@
+# domifile/query/aio.py
+"""
+  Asynchronous query path, for the ASGI server (domifile/asgi.py).  Stages that do not depend
+  on one another run concurrently: the question is embedded, classified and searched by full
+  text at once, and retrieval proceeds speculatively during classification (see routing.py),
+  starting over with filters if the classification implies any.  The rankings are fused by
+  reciprocal rank, as in rag.fetch_candidates, whose results this matches but for the lexical
+  hits being filtered after the fact rather than within the text search.
+"""
+import asyncio
+import logging
+
+from domifile.db.aio import async_transaction, fetch_all
+from domifile.openai_adapter import create_embedding_async, create_response_stream_async
+from .answer_cache import get_answer_cache
+from .classify import classify_query_async
+from .context import pack_context
+from .fusion import reciprocal_rank_fusion
+from .matrix import get_embedding_snapshot
+from .rag import (CANDIDATE_COUNT, DEFAULT_EF_SEARCH, LOAD_CHUNKS_SQL, TOKEN_COUNT_SQL, Candidate,
+                  build_sources, chunk_filter_sql, create_prompt, finish_rag, format_context,
+                  retrieved_chunks, search_filters_for_intent)
+from . import routing
+from .routing import get_route_budgets
+from .vector_index import get_vector_storage
+
+logger = logging.getLogger(__name__)
+
+# The lexical search runs before the filters are known and is filtered afterwards, so it
+# fetches more than CANDIDATE_COUNT.
+LEXICAL_OVERFETCH = 2
+
+LEXICAL_SQL = """
+  SELECT c.id
+  FROM chunks c,
+       (SELECT replace(plainto_tsquery('{text_search_config}', :question)::text,
+                       '&', '|')::tsquery AS query) q
+  WHERE c.text_search @@ q.query
+  ORDER BY ts_rank_cd(c.text_search, q.query) DESC
+  LIMIT :limit
+"""
+
+CANDIDATES_SQL = """
+  SELECT c.id, c.document_id, c.embedding <=> CAST(:qvec AS vector) AS distance, c.embedding,
+         {token_count} AS token_count
+  FROM chunks c
+  WHERE c.id = ANY(:ids) {and_filter}
+"""
+
+
+async def answer_question_async(question, *, use_cache=True, log_question=True):
+  """ As query.answer_question, without search options. """
+  result = None
+  async for event, data in stream_answer_async(question,
+                                               use_cache=use_cache,
+                                               log_question=log_question):
+    if event == "done":
+      result = data
+  return result
+
+
+async def stream_answer_async(question, *, use_cache=True, log_question=True):
+  """ As query.stream_answer. """
+  from . import _answer_from_facts, _is_cacheable, _stream_result
+
+  logger.debug(f"stream_answer_async {question}")
+
+  qvec_task = asyncio.ensure_future(create_embedding_async(question))
+  lexical_task = asyncio.ensure_future(_lexical_ranking(question))
+  retrieval = None
+  try:
+    cache = get_answer_cache() if use_cache else None
+    if cache is not None:
+      if log_question:
+        await asyncio.to_thread(cache.log_question, question)
+      corpus_version, result = await asyncio.to_thread(cache.lookup, question, await qvec_task)
+      if result is not None:
+        for event in _stream_result("cached", result):
+          yield event
+        return
+
+    # Retrieve speculatively while classifying; see routing.py.  Shared tasks are shielded
+    # from the cancellation of their consumers.
+    budgets = get_route_budgets()
+    retrieval = asyncio.ensure_future(_retrieve_chunks(question, qvec_task, lexical_task, None))
+    try:
+      intent = await asyncio.wait_for(classify_query_async(question, asyncio.shield(qvec_task)),
+                                      budgets.classify)
+    except TimeoutError:
+      logger.info(f"classification exceeded its budget of {budgets.classify}s")
+      intent = {"type": "rag"}
+      degraded = True
+    else:
+      degraded = False
+
+    result = None
+    if intent.get("type") in ("structured", "hybrid"):
+      budget = getattr(budgets, intent["type"])
+      try:
+        # Synchronous; run in a router thread, which finishes unobserved if it overruns.
+        result = await routing.wait_async(routing.start(_answer_from_facts, question, intent),
+                                          budget)
+      except TimeoutError:
+        logger.info(f"{intent['type']} answer exceeded its budget of {budget}s")
+      except Exception:
+        logger.exception(f"{intent['type']} answer failed")
+
+    if result is not None:
+      retrieval.cancel()
+      for event in _stream_result(intent["type"], result):
+        yield event
+    else:
+      yield "route", {"type": "rag"}
+      if search_filters_for_intent(intent):
+        retrieval.cancel()
+        retrieval = asyncio.ensure_future(
+            _retrieve_chunks(question, qvec_task, lexical_task, intent))
+      try:
+        chunks = await asyncio.wait_for(retrieval, budgets.rag)
+      except TimeoutError:
+        # As query.route_question, answer without context.
+        logger.info(f"retrieval exceeded its budget of {budgets.rag}s")
+        chunks = []
+        degraded = True
+      yield "sources", build_sources(chunks, [c.id for c in chunks])
+      parts = []
+      async for delta in create_response_stream_async(
+          create_prompt(format_context(chunks), question)):
+        parts.append(delta)
+        yield "delta", {"text": delta}
+      result = finish_rag("".join(parts), chunks)
+      if degraded:
+        result["degraded"] = True
+      yield "done", result
+
+    if cache is not None and _is_cacheable(result):
+      await asyncio.to_thread(cache.store,
+                              question,
+                              await qvec_task,
+                              result,
+                              corpus_version=corpus_version)
+  finally:
+    for task in (qvec_task, lexical_task, retrieval):
+      if task is not None:
+        task.cancel()
+
+
+async def _retrieve_chunks(question, qvec_task, lexical_task, intent):
+  qvec = await asyncio.shield(qvec_task)
+  candidates = await fetch_candidates_async(qvec, asyncio.shield(lexical_task), intent)
+  return await load_chunks_async(pack_context(qvec, candidates))
+
+
+async def _lexical_ranking(question):
+  from domifile.models import TEXT_SEARCH_CONFIG
+
+  async with async_transaction() as conn:
+    rows = await fetch_all(conn, LEXICAL_SQL.format(text_search_config=TEXT_SEARCH_CONFIG), {
+        "question": question,
+        "limit": CANDIDATE_COUNT * LEXICAL_OVERFETCH
+    })
+  return [row.id for row in rows]
+
+
+async def fetch_candidates_async(qvec, lexical_task, intent, *, limit=CANDIDATE_COUNT):
+  """
+    As rag.fetch_candidates.  lexical_task is an awaitable of the unfiltered lexical ranking.
+    If the filters of intent leave nothing, they are dropped.
+  """
+  filters = search_filters_for_intent(intent)
+  where, filter_params = chunk_filter_sql(time_range=filters.get("time_range"),
+                                          category=filters.get("category"))
+  async with async_transaction() as conn:
+    candidates = await _fetch_candidates(conn, qvec, await lexical_task, where, filter_params,
+                                         limit)
+    if not candidates and where:
+      logger.debug(f"no chunks pass filters {filters}; searching unfiltered")
+      candidates = await _fetch_candidates(conn, qvec, await lexical_task, "", {}, limit)
+    return candidates
+
+
+async def _fetch_candidates(conn, qvec, lexical_ids, where, filter_params, limit):
+  storage = get_vector_storage()
+  snapshot = get_embedding_snapshot()
+  if not where and snapshot is not None and snapshot.is_available():
+    vector_ids = [int(chunk_id) for chunk_id in snapshot.search(qvec, limit)[0]]
+  else:
+    candidate_limit = storage.candidate_limit(limit)
+    await _tune_vector_search(conn,
+                              ef_search=max(candidate_limit, DEFAULT_EF_SEARCH),
+                              iterative_scan="relaxed_order" if where else None)
+    rows = await fetch_all(conn, storage.nearest_chunks_sql(f"WHERE {where}" if where else ""), {
+        "qvec": qvec,
+        "limit": limit,
+        "candidate_limit": candidate_limit,
+        **filter_params
+    })
+    vector_ids = [row.id for row in rows]
+
+  fused = [chunk_id for chunk_id, _ in reciprocal_rank_fusion([vector_ids, lexical_ids])]
+  rows = await fetch_all(
+      conn,
+      CANDIDATES_SQL.format(token_count=TOKEN_COUNT_SQL,
+                            and_filter=f"AND {where}" if where else ""), {
+                                "qvec": qvec,
+                                "ids": fused,
+                                **filter_params
+                            })
+  # Lexical hits that fail the filters drop out here.
+  by_id = {row.id: row for row in rows}
+  return [Candidate(*by_id[chunk_id]) for chunk_id in fused if chunk_id in by_id][:limit]
+
+
+async def _tune_vector_search(conn, *, ef_search, iterative_scan=None):
+  # As vector_index.tune_vector_search, for the current transaction.
+  await conn.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(int(ef_search))])
+  if iterative_scan is not None:
+    for setting in ("hnsw.iterative_scan", "ivfflat.iterative_scan"):
+      await conn.execute("SELECT set_config(%s, %s, true)", [setting, iterative_scan])
+
+
+async def load_chunks_async(candidates):
+  """ As rag.load_chunks. """
+  if not candidates:
+    return []
+  async with async_transaction() as conn:
+    rows = await fetch_all(conn, LOAD_CHUNKS_SQL, {"ids": [c.id for c in candidates]})
+  return retrieved_chunks(candidates, rows)
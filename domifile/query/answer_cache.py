@@ -0,0 +1,201 @@
+# domifile/query/answer_cache.py
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+
+from domifile.cache import CacheStats, text_hash
+from domifile.db.corpus import current_corpus_version
+from .classify import OTHER_TIME_PATTERN, RELATIVE_YEAR_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity above which a new question takes the answer to a cached one.  Rephrasings
+# of one question score around 0.9 with text-embedding-3 models; different questions about one
+# subject rarely do.
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+
+# Questions that differ only in a year, amount, unit number or time phrase ("this year", "last
+# year") score above the threshold too, so a hit must also name the same such tokens.  The
+# nearest few cached questions are considered.
+MATCH_CANDIDATES = 5
+KEY_TOKEN_PATTERN = re.compile(r"\w*\d[\w,./-]*")
+# Words of time phrases that mean the same period.
+LAST_SYNONYM_PATTERN = re.compile(r"\b(past|previous|prior)\b")
+
+# Questions answered ahead of time after each ingest: the most asked within the window.
+DEFAULT_WARM_COUNT = 20
+WARM_WINDOW = timedelta(days=90)
+
+
+class AnswerCache:
+  """
+    Answers to questions, matched by similarity of question embeddings and scoped to the corpus
+    version, so that an ingest invalidates them all.  Stored in the answer_cache table, shared
+    by all processes.
+  """
+
+  def __init__(self, *, threshold=DEFAULT_SIMILARITY_THRESHOLD, warm_count=DEFAULT_WARM_COUNT):
+    self.threshold = threshold
+    self.warm_count = warm_count
+    self.stats = CacheStats()
+
+  def lookup(self, question, qvec):
+    """
+      Returns (corpus version, cached answer or None).  The version is that to store a fresh
+      answer under: read before answering, an ingest committing meanwhile leaves the answer
+      already stale.  A cached answer is served only if its question is similar enough and
+      names the same key tokens (see key_tokens).
+    """
+    from domifile.db import db_transaction
+    from domifile.models import AnswerCacheEntry
+
+    with db_transaction(AnswerCacheEntry) as db_session:
+      version = current_corpus_version(db_session)
+      rows = db_session.execute(
+          text("""
+        SELECT id, question, answer,
+               1 - (question_embedding <=> CAST(:qvec AS vector)) AS similarity
+        FROM answer_cache
+        WHERE corpus_version = :version
+        ORDER BY question_embedding <=> CAST(:qvec AS vector)
+        LIMIT :limit
+      """), {
+              "qvec": qvec,
+              "version": version,
+              "limit": MATCH_CANDIDATES
+          }).all()
+      keys = key_tokens(question)
+      row = next((row for row in rows
+                  if row.similarity >= self.threshold and key_tokens(row.question) == keys), None)
+      self.stats.count("db", int(row is not None), int(row is None))
+      if row is None:
+        return version, None
+      db_session.execute(text("UPDATE answer_cache SET hit_count = hit_count + 1 WHERE id = :id"),
+                         {"id": row.id})
+      logger.debug(f"answer cache hit {row.id} (similarity {row.similarity:.3f})")
+      return version, row.answer
+
+  def store(self, question, qvec, answer, *, corpus_version):
+    from domifile.db import db_transaction
+    from domifile.models import AnswerCacheEntry
+
+    with db_transaction(AnswerCacheEntry) as db_session:
+      db_session.add(
+          AnswerCacheEntry(corpus_version=corpus_version,
+                           question=question,
+                           question_embedding=qvec,
+                           answer=answer,
+                           created_at=datetime.now(timezone.utc),
+                           hit_count=0))
+
+  @staticmethod
+  def log_question(question):
+    """ Count an asking of question, for warming. """
+    from domifile.db import db_transaction
+    from domifile.models import QuestionLogEntry
+
+    with db_transaction(QuestionLogEntry) as db_session:
+      db_session.execute(
+          text("""
+        INSERT INTO question_log (question_hash, question, ask_count, last_asked_at)
+        VALUES (:question_hash, :question, 1, now())
+        ON CONFLICT (question_hash) DO UPDATE
+        SET question = excluded.question,
+            ask_count = question_log.ask_count + 1,
+            last_asked_at = excluded.last_asked_at
+      """), {
+              "question_hash": text_hash(question.lower()),
+              "question": question
+          })
+
+  @staticmethod
+  def frequent_questions(limit, *, window=WARM_WINDOW):
+    """ The questions most asked within the window, most asked first. """
+    from domifile.db import db_transaction
+    from domifile.models import QuestionLogEntry
+
+    with db_transaction(QuestionLogEntry) as db_session:
+      return db_session.execute(
+          text("""
+        SELECT question FROM question_log
+        WHERE last_asked_at >= :since
+        ORDER BY ask_count DESC, last_asked_at DESC
+        LIMIT :limit
+      """), {
+              "since": datetime.now(timezone.utc) - window,
+              "limit": limit
+          }).scalars().all()
+
+  @staticmethod
+  def purge_stale():
+    """ Delete answers of past corpus versions.  Returns the count deleted. """
+    from domifile.db import db_transaction
+    from domifile.models import AnswerCacheEntry
+
+    with db_transaction(AnswerCacheEntry) as db_session:
+      return db_session.execute(
+          text("""
+        DELETE FROM answer_cache
+        WHERE corpus_version < (SELECT coalesce(max(version), 0) FROM corpus_state)
+      """)).rowcount
+
+  def warm(self, answer, *, count=None):
+    """
+      Answer the most frequent questions, through answer(question), which is to store them.
+      Questions that fail are logged and skipped.  Returns counts.
+    """
+    purged = self.purge_stale()
+    questions = self.frequent_questions(self.warm_count if count is None else count)
+    failed = 0
+    for question in questions:
+      try:
+        answer(question)
+      except Exception:
+        failed += 1
+        logger.exception(f"answer cache warming failed for {question!r}")
+    stats = {"questions": len(questions), "failed": failed, "purged": purged}
+    logger.info(f"answer cache warmed: {stats}")
+    return stats
+
+
+def key_tokens(question):
+  """
+    The tokens of question that contain digits (years, amounts, unit numbers), and its time
+    phrases, as the classifier recognizes them, normalized.
+  """
+  tokens = {
+      token.rstrip(".,").replace(",", "").lower()
+      for token in KEY_TOKEN_PATTERN.findall(question)
+  }
+  for pattern in (RELATIVE_YEAR_PATTERN, OTHER_TIME_PATTERN):
+    for match in pattern.finditer(question):
+      tokens.add(LAST_SYNONYM_PATTERN.sub("last", " ".join(match.group(0).lower().split())))
+  return frozenset(tokens)
+
+
+# --------------------------------------------------------------------------------
+# The configured cache, if any.
+
+_answer_cache = None
+
+
+def configure_answer_cache(config):
+  """
+    Per config.ANSWER_CACHE (on unless "0"), ANSWER_CACHE_SIMILARITY and
+    ANSWER_CACHE_WARM_COUNT.
+  """
+  global _answer_cache
+  if str(getattr(config, "ANSWER_CACHE", "1")) == "0":
+    _answer_cache = None
+    return
+  threshold = getattr(config, "ANSWER_CACHE_SIMILARITY", None)
+  warm_count = getattr(config, "ANSWER_CACHE_WARM_COUNT", None)
+  _answer_cache = AnswerCache(
+      threshold=DEFAULT_SIMILARITY_THRESHOLD if threshold is None else float(threshold),
+      warm_count=DEFAULT_WARM_COUNT if warm_count is None else int(warm_count))
+
+
+def get_answer_cache():
+  """ The configured cache, or None if answers are not cached. """
+  return _answer_cache
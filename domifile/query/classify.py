@@ -1,11 +1,229 @@
 # domifile/query/classify.py
 import json
+import logging
+import re
+import threading
+import time
 from datetime import date
 
-from domifile.openai_adapter import create_response
+import numpy as np
 
+from domifile.openai_adapter import (create_embedding, create_embeddings, create_response,
+                                     create_response_async)
+from .intent_examples import BENCHMARK, PROTOTYPES
+from .mmr import as_vector, normalized_matrix
 
-def classify_query(question):
+logger = logging.getLogger(__name__)
+
+# Bump when the prompt changes.  Also invalidates cached LLM responses.
+CLASSIFIER_VERSION = "2"
+
+INTENT_TYPES = ("structured", "hybrid", "rag")
+
+# Prototypes of each label whose similarities to a question are averaged into its score.
+PROTOTYPE_NEIGHBORS = 3
+
+# Lead of the best type's score over the runner-up's below which the LLM classifies instead.
+DEFAULT_CONFIDENCE_MARGIN = 0.03
+
+# Time phrases resolved locally; other temporal phrasing is left to the LLM.
+YEAR_PATTERN = re.compile(r"\b(in|during|for|of|since)\s+(19|20)(\d\d)\b", re.IGNORECASE)
+RELATIVE_YEAR_PATTERN = re.compile(r"\b(this|last|past|previous|prior)\s+year\b", re.IGNORECASE)
+OTHER_TIME_PATTERN = re.compile(
+    r"\b(since|ago|between|recent(ly)?|yesterday|today|"
+    r"(this|last|past|previous|prior|next)\s+(season|winter|spring|summer|fall|autumn|"
+    r"month|week|quarter|\d+\s+\w+)|"
+    r"jan(uary)?|feb(ruary)?|march|april|june|july|aug(ust)?|sept?(ember)?|oct(ober)?|"
+    r"nov(ember)?|dec(ember)?|(19|20)\d\d)\b", re.IGNORECASE)
+
+
+def classify_query(question, qvec=None):
+  """
+    Intent of a question (see classify_query_with_llm), by the local classifier if configured
+    and confident, else by the LLM.  qvec is the question's embedding, if already at hand.
+  """
+  classifier = get_intent_classifier()
+  if classifier is not None:
+    try:
+      intent, confident = classifier.classify(question, qvec)
+    except Exception:
+      logger.exception("local intent classification failed")
+    else:
+      if confident:
+        return intent
+      logger.debug(f"local intent not confident ({intent}); asking the LLM")
+  return classify_query_with_llm(question)
+
+
+class PrototypeClassifier:
+  """
+    Local intent classifier.  A question's embedding is compared to those of labeled prototype
+    questions; each type scores the mean similarity of its PROTOTYPE_NEIGHBORS nearest
+    prototypes, and fact_type is taken likewise among prototypes of the winning type.  Time
+    ranges are resolved from explicit years and "this/last year" only.
+
+    The result is confident when the best type leads by at least margin and the question has
+    no temporal phrasing left unresolved.  category is left null: it narrows the search, and
+    only the LLM names it reliably.
+  """
+
+  def __init__(self, examples=PROTOTYPES, *, margin=DEFAULT_CONFIDENCE_MARGIN):
+    self.examples = list(examples)
+    self.margin = margin
+    self._lock = threading.Lock()
+    self._matrix = None
+
+  def load(self):
+    """ Embed the prototypes now rather than on first use. """
+    self._prototypes()
+
+  def _prototypes(self):
+    # Embedded on first use; the embeddings are cached in the database across restarts.
+    with self._lock:
+      if self._matrix is None:
+        questions = [question for question, _, _ in self.examples]
+        self._matrix = normalized_matrix(create_embeddings(questions))
+        self._types = np.array([t for _, t, _ in self.examples])
+        self._fact_types = np.array([f or "" for _, _, f in self.examples])
+      return self._matrix, self._types, self._fact_types
+
+  def classify(self, question, qvec=None):
+    """ Returns (intent, confident). """
+    matrix, types, fact_types = self._prototypes()
+    query = as_vector(qvec if qvec is not None else create_embedding(question))
+    similarities = matrix @ (query / (np.linalg.norm(query) or 1))
+
+    scores = sorted(((_label_score(similarities, types == t), t) for t in INTENT_TYPES),
+                    reverse=True)
+    (best_score, intent_type), (runner_up, _) = scores[0], scores[1]
+
+    fact_type = None
+    if intent_type != "rag":
+      mask = (types == intent_type) & (fact_types != "")
+      fact_type = max(set(fact_types[mask]),
+                      key=lambda f: _label_score(similarities, mask & (fact_types == f)))
+
+    time_range, time_resolved = resolve_time_range(question)
+    intent = {
+        "type": intent_type,
+        "fact_type": fact_type,
+        "category": None,
+        "time_range": time_range,
+    }
+    return intent, time_resolved and best_score - runner_up >= self.margin
+
+
+def _label_score(similarities, mask):
+  top = np.sort(similarities[mask])[-PROTOTYPE_NEIGHBORS:]
+  return float(top.mean()) if len(top) else -1.0
+
+
+def resolve_time_range(question, today=None):
+  """
+    (time_range, resolved).  time_range covers explicit years ("in 2024", "since 2023") and
+    "this/last year"; resolved is false if other temporal phrasing remains.
+  """
+  today = today or date.today()
+  time_range = None
+  remaining = question
+
+  match = YEAR_PATTERN.search(question)
+  if match:
+    year = int(match.group(2) + match.group(3))
+    if match.group(1).lower() == "since":
+      time_range = {"start": f"{year}-01-01", "end": None}
+    else:
+      time_range = {"start": f"{year}-01-01", "end": f"{year}-12-31"}
+    remaining = remaining.replace(match.group(0), " ")
+  else:
+    match = RELATIVE_YEAR_PATTERN.search(question)
+    if match:
+      if match.group(1).lower() == "this":
+        time_range = {"start": f"{today.year}-01-01", "end": today.isoformat()}
+      else:
+        time_range = {"start": f"{today.year - 1}-01-01", "end": f"{today.year - 1}-12-31"}
+      remaining = remaining.replace(match.group(0), " ")
+
+  return time_range, OTHER_TIME_PATTERN.search(remaining) is None
+
+
+def benchmark_classifier(examples=BENCHMARK, *, classifier=None, with_llm=False):
+  """
+    Routing accuracy of the local classifier on labeled (question, type, fact_type) examples:
+    overall, and on those it is confident about, which it would route without the LLM.  With
+    with_llm, unconfident examples go to the LLM, as in classify_query, and the accuracy of the
+    combination is reported too.  Latency is of local classification, embeddings excluded.
+  """
+  classifier = classifier or get_intent_classifier() or PrototypeClassifier()
+  examples = list(examples)
+  qvecs = create_embeddings([question for question, _, _ in examples])
+  classifier.load()
+
+  results = []
+  latencies = []
+  for (question, expected_type, expected_fact_type), qvec in zip(examples, qvecs):
+    started = time.perf_counter()
+    intent, confident = classifier.classify(question, qvec)
+    latencies.append((time.perf_counter() - started) * 1000)
+    routed = intent
+    if with_llm and not confident:
+      routed = classify_query_with_llm(question)
+    results.append({
+        "question": question,
+        "expected": expected_type,
+        "local": intent["type"],
+        "confident": confident,
+        "routed": routed.get("type"),
+        "fact_type_correct": intent["fact_type"] == expected_fact_type,
+    })
+
+  confident = [r for r in results if r["confident"]]
+  report = {
+      "examples": len(results),
+      "local_accuracy": _accuracy(results, "local"),
+      "coverage": len(confident) / max(len(results), 1),
+      "confident_accuracy": _accuracy(confident, "local"),
+      "fact_type_accuracy": sum(r["fact_type_correct"] for r in results) / max(len(results), 1),
+      "latency_ms_mean": sum(latencies) / max(len(latencies), 1),
+      "misrouted": [r for r in results if r["local"] != r["expected"]],
+  }
+  if with_llm:
+    report["routed_accuracy"] = _accuracy(results, "routed")
+  return report
+
+
+def _accuracy(results, field):
+  if not results:
+    return None
+  return sum(r[field] == r["expected"] for r in results) / len(results)
+
+
+# --------------------------------------------------------------------------------
+# The configured local classifier, if any.
+
+_classifier = None
+
+
+def configure_intent_classifier(config):
+  """
+    Per config.INTENT_CLASSIFIER ("local", the default, or "llm") and
+    INTENT_CONFIDENCE_MARGIN.
+  """
+  global _classifier
+  if (getattr(config, "INTENT_CLASSIFIER", None) or "local") == "llm":
+    _classifier = None
+    return
+  margin = getattr(config, "INTENT_CONFIDENCE_MARGIN", None)
+  _classifier = PrototypeClassifier(
+      margin=DEFAULT_CONFIDENCE_MARGIN if margin is None else float(margin))
+
+
+def get_intent_classifier():
+  """ The configured local classifier, or None if the LLM classifies every question. """
+  return _classifier
+
+
+def classify_query_with_llm(question):
   """
     {
       "type": "structured | hybrid | rag",
@@ -17,6 +235,28 @@ def classify_query(question):
       }
     }
   """
+  raw = create_response(classification_prompt(question),
+                        cache_version=f"classify-{CLASSIFIER_VERSION}")
+  return parse_classification(raw)
+
+
+async def classify_query_async(question, qvec_task):
+  """ As classify_query.  qvec_task is an awaitable of the question's embedding. """
+  classifier = get_intent_classifier()
+  if classifier is not None:
+    try:
+      intent, confident = classifier.classify(question, await qvec_task)
+    except Exception:
+      logger.exception("local intent classification failed")
+    else:
+      if confident:
+        return intent
+  raw = await create_response_async(classification_prompt(question),
+                                    cache_version=f"classify-{CLASSIFIER_VERSION}")
+  return parse_classification(raw)
+
+
+def classification_prompt(question):
   today = date.today().isoformat()
 
   prompt = f"""
@@ -27,6 +267,7 @@ Return STRICT JSON with fields:
 - type: one of ["structured" | "hybrid" | "rag"]
 - fact_type: one of ["transaction", "amount", "service_date"] or null
 - category: e.g. "insurance", "landscaping", or null
+- time_range: {{ "start": "YYYY-MM-DD" | null, "end": "YYYY-MM-DD" | null }} or null
 
 To choose type:
 - If the query is asking for a currency amount or a date, the type is "structured". 
@@ -55,12 +296,18 @@ If unsure, set fact_type=null (do NOT invent new values).
 Category:
 - If there is mention of a specific vendor or service, set the category correspondingly.
 
+Time range:
+- If the query is limited to a period ("in 2025", "last winter", "since March"), set the
+  time_range to the dates it covers, relative to today's date, {today}.  Otherwise null.
+
 Query is:
 {question}
 """
 
-  raw = create_response(prompt)
+  return prompt
+
 
+def parse_classification(raw):
   try:
     return json.loads(raw)
   except Exception:
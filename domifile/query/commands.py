@@ -6,14 +6,210 @@ from flask.cli import with_appcontext
 
 def install_query_commands(app):
 
-  from . import answer_question
+  from . import answer_question, warm_answer_cache
+  from . import answer_cache
+  from . import classify
+  from . import matrix
+  from . import vector_index
+  from domifile.models import HNSW_M, HNSW_EF_CONSTRUCTION
 
   @click.command("answer-question")
   @click.argument("question")
+  @click.option("--ef-search", type=int, help="HNSW candidate list size (recall).")
+  @click.option("--probes", type=int, help="IVFFlat lists to scan (recall).")
+  @click.option("--no-cache", is_flag=True, help="Neither use nor fill the answer cache.")
   @with_appcontext
-  def answer_the_question(question):
+  def answer_the_question(question, ef_search, probes, no_cache):
     """ Answer a question based on knowledge base. """
-    result = answer_question(question)
+    search_options = {
+        key: value
+        for key, value in (("ef_search", ef_search), ("probes", probes)) if value is not None
+    }
+    result = answer_question(question, use_cache=not no_cache, **search_options)
     print(json.dumps(result, indent=3))
 
   app.cli.add_command(answer_the_question)
+
+  @click.group("answer-cache")
+  def answer_cache_group():
+    """ Manage the cache of answers to frequently asked questions. """
+
+  @answer_cache_group.command("warm")
+  @click.option("--count", type=int, help="Questions to answer (default: as configured).")
+  @with_appcontext
+  def warm_cache(count):
+    """ Answer the most frequently asked questions ahead of time. """
+    stats = warm_answer_cache(count=count)
+    if stats is None:
+      raise click.ClickException("The answer cache is disabled (ANSWER_CACHE=0)")
+    print(json.dumps(stats, indent=3))
+
+  @answer_cache_group.command("purge")
+  @with_appcontext
+  def purge_cache():
+    """ Delete answers cached under past corpus versions. """
+    click.echo(f"{answer_cache.AnswerCache.purge_stale()} answers deleted.")
+
+  @answer_cache_group.command("questions")
+  @click.option("--count", type=int, default=20)
+  @with_appcontext
+  def list_questions(count):
+    """ List the most frequently asked questions. """
+    for question in answer_cache.AnswerCache.frequent_questions(count):
+      click.echo(question)
+
+  app.cli.add_command(answer_cache_group)
+
+  @click.group("intent")
+  def intent_group():
+    """ Classify questions for routing. """
+
+  @intent_group.command("classify")
+  @click.argument("question")
+  @click.option("--llm", is_flag=True, help="Use the LLM only.")
+  @with_appcontext
+  def classify_question(question, llm):
+    """ Show the intent of a question, and whether the local classifier is confident. """
+    if llm:
+      print(json.dumps(classify.classify_query_with_llm(question), indent=3))
+      return
+    classifier = classify.get_intent_classifier() or classify.PrototypeClassifier()
+    intent, confident = classifier.classify(question)
+    print(json.dumps({"intent": intent, "confident": confident}, indent=3))
+
+  @intent_group.command("benchmark")
+  @click.option("--examples",
+                type=click.File(),
+                help="JSON list of [question, type, fact_type] (default: the built-in set).")
+  @click.option("--with-llm", is_flag=True, help="Route unconfident questions to the LLM.")
+  @with_appcontext
+  def benchmark_intent(examples, with_llm):
+    """ Measure routing accuracy of the local classifier on labeled questions. """
+    examples = json.load(examples) if examples else classify.BENCHMARK
+    print(json.dumps(classify.benchmark_classifier(examples, with_llm=with_llm), indent=3))
+
+  app.cli.add_command(intent_group)
+
+  @click.group("vector-index")
+  def vector_index_group():
+    """ Manage the approximate nearest neighbor index on chunk embeddings. """
+
+  def storage_options(f):
+    f = click.option("--dimensions",
+                     type=int,
+                     help="Dimensions indexed (truncated storage; default 512).")(f)
+    f = click.option("--storage",
+                     type=click.Choice(vector_index.STORAGE_MODES),
+                     help="Vector representation indexed (default: as configured).")(f)
+    return f
+
+  def storage_for(storage, dimensions):
+    if storage is None:
+      return vector_index.get_vector_storage()
+    return vector_index.VectorStorage(storage, dimensions=dimensions)
+
+  def build_options(f):
+    f = click.option("--maintenance-work-mem", help="Memory for the build, e.g. 2GB.")(f)
+    f = click.option("--lists", type=int, help="IVFFlat lists (default: by row count).")(f)
+    f = click.option("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)(f)
+    f = click.option("--m", "m", type=int, default=HNSW_M)(f)
+    return f
+
+  @vector_index_group.command("create")
+  @click.option("--method", type=click.Choice(vector_index.METHODS), default="hnsw")
+  @click.option("--concurrently", is_flag=True, help="Build without blocking writes.")
+  @storage_options
+  @build_options
+  @with_appcontext
+  def create_index(method, concurrently, storage, dimensions, m, ef_construction, lists,
+                   maintenance_work_mem):
+    """ Create the index, unless it exists. """
+    ddl = vector_index.create_embedding_index(method=method,
+                                              storage=storage_for(storage, dimensions),
+                                              m=m,
+                                              ef_construction=ef_construction,
+                                              lists=lists,
+                                              concurrently=concurrently,
+                                              maintenance_work_mem=maintenance_work_mem)
+    click.echo(ddl)
+
+  @vector_index_group.command("rebuild")
+  @click.option("--method",
+                type=click.Choice(vector_index.METHODS),
+                help="Replace the index with one of this method and parameters.")
+  @storage_options
+  @build_options
+  @with_appcontext
+  def rebuild_index(method, storage, dimensions, m, ef_construction, lists, maintenance_work_mem):
+    """ Rebuild the index concurrently, optionally changing its method or parameters. """
+    statements = vector_index.rebuild_embedding_index(method=method,
+                                                      storage=storage_for(storage, dimensions),
+                                                      m=m,
+                                                      ef_construction=ef_construction,
+                                                      lists=lists,
+                                                      maintenance_work_mem=maintenance_work_mem)
+    for ddl in statements:
+      click.echo(ddl)
+
+  @vector_index_group.command("inspect")
+  @storage_options
+  @with_appcontext
+  def inspect_index(storage, dimensions):
+    """ Show the index definition, validity, size and usage. """
+    info = vector_index.inspect_embedding_index(storage_for(storage, dimensions))
+    if info is None:
+      click.echo("No embedding index.")
+      return
+    print(json.dumps(info, indent=3, default=str))
+
+  @vector_index_group.command("benchmark")
+  @click.option("--storage",
+                "modes",
+                type=click.Choice(vector_index.STORAGE_MODES),
+                multiple=True,
+                help="Storage mode to measure (repeatable; default: all).")
+  @click.option("--dimensions", type=int, help="Dimensions of truncated storage.")
+  @click.option("--queries", type=int, default=50, help="Sampled query vectors.")
+  @click.option("--k", type=int, default=10, help="Results per query.")
+  @click.option("--ef-search", type=int, help="HNSW candidate list size.")
+  @with_appcontext
+  def benchmark_index(modes, dimensions, queries, k, ef_search):
+    """ Compare recall, latency and index size of storage modes against exact search. """
+    storages = [
+        vector_index.VectorStorage(mode, dimensions=dimensions if mode == "truncated" else None)
+        for mode in (modes or vector_index.STORAGE_MODES)
+    ]
+    results = vector_index.benchmark_vector_storage(storages,
+                                                    queries=queries,
+                                                    k=k,
+                                                    ef_search=ef_search)
+    print(json.dumps(results, indent=3))
+
+  app.cli.add_command(vector_index_group)
+
+  @click.group("embedding-snapshot")
+  def embedding_snapshot_group():
+    """ Manage the memory-mapped embedding snapshot for in-process search. """
+
+  @embedding_snapshot_group.command("refresh")
+  @click.option("--full", is_flag=True, help="Rebuild from scratch rather than incrementally.")
+  @with_appcontext
+  def refresh_snapshot(full):
+    """ Bring the snapshot up to date with the chunks table. """
+    stats = matrix.refresh_embedding_snapshot(full=full)
+    if stats is None:
+      raise click.ClickException("EMBEDDING_SNAPSHOT_DIR is not configured")
+    print(json.dumps(stats, indent=3))
+
+  @embedding_snapshot_group.command("inspect")
+  @with_appcontext
+  def inspect_snapshot():
+    """ Show the snapshot's generation, size and dtype. """
+    snapshot = matrix.get_embedding_snapshot()
+    info = snapshot.info() if snapshot else None
+    if info is None:
+      click.echo("No embedding snapshot.")
+      return
+    print(json.dumps(info, indent=3))
+
+  app.cli.add_command(embedding_snapshot_group)
@@ -0,0 +1,78 @@
+# domifile/query/context.py
+import numpy as np
+
+from .mmr import mmr_indices, normalized_matrix
+
+# Tokens of chunk text in the context of an answer, bounding the prompt.
+DEFAULT_CONTEXT_TOKEN_BUDGET = 1200
+MAX_CONTEXT_CHUNKS = 16
+
+# Adaptive k.  Candidates ranked by similarity to the question are relevant down to the first
+# drop of more than RELEVANCE_GAP from one to the next, and no further than RELEVANCE_WINDOW
+# below the best.
+RELEVANCE_GAP = 0.05
+RELEVANCE_WINDOW = 0.15
+
+_token_budget = DEFAULT_CONTEXT_TOKEN_BUDGET
+
+
+def configure_context(config):
+  """ Per config.CONTEXT_TOKEN_BUDGET. """
+  global _token_budget
+  budget = getattr(config, "CONTEXT_TOKEN_BUDGET", None)
+  _token_budget = DEFAULT_CONTEXT_TOKEN_BUDGET if budget is None else int(budget)
+
+
+def get_context_token_budget():
+  return _token_budget
+
+
+def relevant_count(similarities):
+  """ The number of candidates, best first, that are relevant; see RELEVANCE_GAP. """
+  ranked = np.sort(np.asarray(similarities, dtype=np.float32))[::-1]
+  k = min(len(ranked), 1)
+  while (k < len(ranked) and ranked[0] - ranked[k] <= RELEVANCE_WINDOW
+         and ranked[k - 1] - ranked[k] <= RELEVANCE_GAP):
+    k += 1
+  return k
+
+
+def pack_context(qvec, candidates, *, token_budget=None, max_chunks=MAX_CONTEXT_CHUNKS):
+  """
+    Choose candidates (having distance, embedding and token_count attributes, best ranked
+    first) for the context of an answer.  The relevant ones (see relevant_count), and always
+    the best ranked, which may be a full-text match, are ordered by maximal marginal relevance
+    and taken while their tokens fit the budget.  The first is taken regardless.
+  """
+  if not candidates:
+    return []
+  token_budget = get_context_token_budget() if token_budget is None else token_budget
+
+  similarities = np.array([1 - c.distance for c in candidates], dtype=np.float32)
+  k = min(relevant_count(similarities), max_chunks)
+  keep = set(np.argsort(-similarities, kind="stable")[:k].tolist()) | {0}
+  relevant = [c for i, c in enumerate(candidates) if i in keep]
+
+  matrix = normalized_matrix([c.embedding for c in relevant])
+  packed = []
+  tokens = 0
+  for i in mmr_indices(qvec, matrix, k=len(relevant)):
+    candidate = relevant[i]
+    if packed and tokens + candidate.token_count > token_budget:
+      continue  # A smaller one may yet fit.
+    packed.append(candidate)
+    tokens += candidate.token_count
+  return packed
+
+
+def pack_in_order(chunks, *, token_budget=None):
+  """ Leading chunks (having a token_count attribute) that fit the budget; at least one. """
+  token_budget = get_context_token_budget() if token_budget is None else token_budget
+  packed = []
+  tokens = 0
+  for chunk in chunks:
+    if packed and tokens + chunk.token_count > token_budget:
+      break
+    packed.append(chunk)
+    tokens += chunk.token_count
+  return packed
@@ -0,0 +1,23 @@
+# domifile/query/fusion.py
+from collections import defaultdict
+
+# Damping constant of reciprocal rank fusion; 60 is the customary value.
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings, *, k=RRF_K, key=lambda item: item):
+  """
+    Fuse several ranked lists into one.  Each item scores the sum over the lists that contain it
+    of 1 / (k + rank), rank counting from 1.  Items are identified by key(item); the first
+    occurrence of each is kept.  Returns (item, score) pairs, best first.
+  """
+  scores = defaultdict(float)
+  items = {}
+  for ranking in rankings:
+    for rank, item in enumerate(ranking, start=1):
+      item_key = key(item)
+      scores[item_key] += 1.0 / (k + rank)
+      items.setdefault(item_key, item)
+  # sorted is stable, so ties keep first-seen order.
+  return [(items[item_key], score)
+          for item_key, score in sorted(scores.items(), key=lambda kv: -kv[1])]
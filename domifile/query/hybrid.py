@@ -1,14 +1,20 @@
 # domifile/query/hybrid.py
+from sqlalchemy import text
+
+from .context import pack_in_order
+from .rag import TOKEN_COUNT_SQL
 
 
 def fetch_chunks_for_document(document_id, limit=8):
+  """ Leading chunks of a document, as many of limit as fit the context token budget. """
   from domifile.db import db_transaction
   from domifile.models import Chunk
 
   with db_transaction(Chunk) as db_session:
 
-    sql = text("""
-      SELECT d.filename, d.drive_file_id, c.id, c.text, c.embedding
+    sql = text(f"""
+      SELECT d.filename, d.drive_file_id, c.id, c.text, c.embedding,
+             {TOKEN_COUNT_SQL} AS token_count
       FROM chunks c
       JOIN documents d ON d.id = c.document_id
       WHERE c.document_id = :document_id
@@ -16,7 +22,8 @@ def fetch_chunks_for_document(document_id, limit=8):
       LIMIT :limit
     """)
 
-    return db_session.execute(sql, {
-        "document_id": document_id,
-        "limit": limit,
-    }).fetchall()
+    return pack_in_order(
+        db_session.execute(sql, {
+            "document_id": document_id,
+            "limit": limit,
+        }).fetchall())
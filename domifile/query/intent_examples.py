@@ -0,0 +1,79 @@
+# domifile/query/intent_examples.py
+"""
+  Labeled questions for the local intent classifier: (question, type, fact_type).
+
+  PROTOTYPES train the classifier.  BENCHMARK is held out, for measuring routing accuracy; add
+  to it questions that were misrouted in practice.  Labels follow the classify_query prompt.
+"""
+
+PROTOTYPES = [
+    # structured: a currency amount or a date.
+    ("How much did we pay for insurance in 2025?", "structured", "transaction"),
+    ("What was the total spent on snow removal last winter?", "structured", "transaction"),
+    ("How much have we paid the landscaper this year?", "structured", "transaction"),
+    ("What did the roof repair cost?", "structured", "transaction"),
+    ("How much was the last water bill?", "structured", "transaction"),
+    ("What is the total of all invoices from the plumber?", "structured", "transaction"),
+    ("When was the irrigation system last serviced?", "structured", "service_date"),
+    ("When did the septic tank get pumped?", "structured", "service_date"),
+    ("When was the last fire alarm inspection?", "structured", "service_date"),
+    ("What date was the elevator inspected?", "structured", "service_date"),
+    ("When did the exterminator last visit?", "structured", "service_date"),
+    ("What is the insurance deductible?", "structured", "amount"),
+    ("What is the monthly condo fee for unit 4?", "structured", "amount"),
+    ("How much is in the reserve fund?", "structured", "amount"),
+    ("What is the policy's liability limit?", "structured", "amount"),
+
+    # hybrid: data plus an explanation or context.
+    ("When was the septic system last serviced and what was done?", "hybrid", "service_date"),
+    ("How much did we pay for snow removal last season, and was it more than the prior year?",
+     "hybrid", "transaction"),
+    ("When was the boiler last inspected and were any problems found?", "hybrid", "service_date"),
+    ("What did the painting contract cost and what did it cover?", "hybrid", "transaction"),
+    ("How much was the insurance premium and why did it go up?", "hybrid", "transaction"),
+    ("When did the gutters get cleaned and who did it?", "hybrid", "service_date"),
+    ("What was the last tree trimming bill and which trees were cut?", "hybrid", "transaction"),
+    ("When was the parking lot sealed, and what did the contractor recommend?", "hybrid",
+     "service_date"),
+
+    # rag: anything else.
+    ("Who occupied unit 6B in 2024?", "rag", None),
+    ("How much coverage does our insurance policy provide in the event of a fire?", "rag", None),
+    ("Who does our landscaping?", "rag", None),
+    ("What are the rules for pets in the building?", "rag", None),
+    ("Can owners rent their units on short-term rental sites?", "rag", None),
+    ("What did the board decide about replacing the windows?", "rag", None),
+    ("Who is the contact at the management company?", "rag", None),
+    ("What does the master deed say about exterior repairs?", "rag", None),
+    ("Is there a warranty on the new roof?", "rag", None),
+    ("What is the procedure for reporting a leak?", "rag", None),
+    ("Which vendor plows the driveway?", "rag", None),
+    ("Summarize the last annual meeting minutes.", "rag", None),
+    ("Are satellite dishes allowed on balconies?", "rag", None),
+]
+
+BENCHMARK = [
+    ("How much did the HVAC maintenance cost in 2024?", "structured", "transaction"),
+    ("What was our electricity bill total for last year?", "structured", "transaction"),
+    ("How much did we spend on pool maintenance?", "structured", "transaction"),
+    ("When was the chimney last swept?", "structured", "service_date"),
+    ("When was the backflow preventer tested?", "structured", "service_date"),
+    ("On what date were the fire extinguishers inspected?", "structured", "service_date"),
+    ("What is the flood insurance deductible?", "structured", "amount"),
+    ("What is the special assessment per unit?", "structured", "amount"),
+    ("When was the well water tested and what were the results?", "hybrid", "service_date"),
+    ("How much did the driveway repaving cost and what warranty came with it?", "hybrid",
+     "transaction"),
+    ("When did the electrician last come and what did they fix?", "hybrid", "service_date"),
+    ("What did we pay for the new boiler and why was it replaced?", "hybrid", "transaction"),
+    ("Who is our insurance agent?", "rag", None),
+    ("What are the quiet hours?", "rag", None),
+    ("Who handles snow removal?", "rag", None),
+    ("landscaping vendor?", "rag", None),
+    ("Can I install a fence in my yard?", "rag", None),
+    ("What does the insurance policy exclude?", "rag", None),
+    ("Who lived in unit 2 before the current owners?", "rag", None),
+    ("What did the engineer's report say about the foundation?", "rag", None),
+    ("How do I get a parking permit?", "rag", None),
+    ("Which units have had water damage?", "rag", None),
+]
@@ -0,0 +1,271 @@
+# domifile/query/matrix.py
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DTYPES = ("float32", "float16")
+
+# Rows scored per block when the matrix is float16, bounding the float32 working copy.
+SCORE_BLOCK_ROWS = 65536
+
+# Embeddings read from the database per query during a refresh.
+REFRESH_BATCH_SIZE = 5000
+
+# Times a reader tries to map the generation named by meta.json before giving up.
+MAP_ATTEMPTS = 3
+
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+
+
+class EmbeddingSnapshot:
+  """
+    Brute-force vector search over a memory-mapped snapshot of all chunk embeddings.
+
+    The snapshot is a directory of .npy files: chunk ids in ascending order, and a matrix of
+    the corresponding unit-length embeddings, as float32 or float16.  Files are mapped
+    read-only, so that all server worker processes share one copy through the page cache.
+
+    A refresh writes a new generation of files and then switches meta.json to it.  Readers
+    notice the switch on their next search and map the new files; mappings of the old ones
+    remain valid until dropped.
+  """
+
+  def __init__(self, directory, *, dtype="float32"):
+    if dtype not in SNAPSHOT_DTYPES:
+      raise ValueError(f"Unsupported snapshot dtype: {dtype}")
+    self.directory = directory
+    self.dtype = dtype
+    self._lock = threading.Lock()
+    self._meta_mtime = None
+    self._meta = None
+    self._ids = None
+    self._matrix = None
+
+  # --------------------------------------------------------------------------------
+  # Reading
+
+  def is_available(self):
+    return self._current() is not None
+
+  def search(self, qvec, k):
+    """ The k chunk ids most similar to qvec, best first, with their cosine similarities. """
+    current = self._current()
+    if current is None:
+      raise RuntimeError(f"No embedding snapshot in {self.directory}")
+    ids, matrix = current
+    n = len(ids)
+    if n == 0 or k <= 0:
+      return np.empty(0, dtype=ids.dtype), np.empty(0, dtype=np.float32)
+
+    query = np.asarray(qvec, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1)
+    if matrix.dtype == np.float32:
+      scores = matrix @ query
+    else:
+      scores = np.empty(n, dtype=np.float32)
+      for start in range(0, n, SCORE_BLOCK_ROWS):
+        block = matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+        scores[start:start + len(block)] = block @ query
+
+    k = min(k, n)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return ids[top], scores[top]
+
+  def embeddings_for(self, chunk_ids):
+    """ Dict of chunk id to embedding (float32) for those of chunk_ids in the snapshot. """
+    current = self._current()
+    if current is None:
+      return {}
+    ids, matrix = current
+    chunk_ids = np.asarray(list(chunk_ids), dtype=ids.dtype)
+    positions = np.searchsorted(ids, chunk_ids)
+    found = {}
+    for chunk_id, position in zip(chunk_ids.tolist(), positions.tolist()):
+      if position < len(ids) and ids[position] == chunk_id:
+        found[chunk_id] = np.asarray(matrix[position], dtype=np.float32)
+    return found
+
+  def info(self):
+    current = self._current()
+    if current is None:
+      return None
+    return {**self._meta, "directory": self.directory}
+
+  def _read_meta(self):
+    try:
+      with open(os.path.join(self.directory, META_FILE)) as f:
+        return json.load(f)
+    except FileNotFoundError:
+      return None
+
+  def _current(self):
+    meta_path = os.path.join(self.directory, META_FILE)
+    # Refreshes delete all but the latest two generations, so a meta.json read just before two
+    # refreshes may name files that are gone; it is read again.
+    for _ in range(MAP_ATTEMPTS):
+      try:
+        mtime = os.stat(meta_path).st_mtime_ns
+      except FileNotFoundError:
+        return None
+      with self._lock:
+        if mtime != self._meta_mtime:
+          try:
+            self._map(self._read_meta(), mtime)
+          except FileNotFoundError:
+            continue
+        return self._ids, self._matrix
+    logger.warning(f"embedding snapshot in {self.directory} changed too fast to map")
+    return (self._ids, self._matrix) if self._ids is not None else None
+
+  def _map(self, meta, mtime):
+    if meta is None:
+      raise FileNotFoundError(META_FILE)
+    ids = np.load(os.path.join(self.directory, meta["ids_file"]), mmap_mode="r")
+    matrix = np.load(os.path.join(self.directory, meta["matrix_file"]), mmap_mode="r")
+    self._ids, self._matrix, self._meta, self._meta_mtime = ids, matrix, meta, mtime
+    logger.debug(f"mapped embedding snapshot generation {meta['generation']}")
+
+  # --------------------------------------------------------------------------------
+  # Writing
+
+  def refresh(self, *, full=False):
+    """
+      Bring the snapshot up to date with the chunks table: drop the rows of deleted chunks and
+      append the embeddings of new ones.  Only new embeddings are read from the database,
+      unless full is true or the snapshot's dtype differs.  Returns counts.
+    """
+    os.makedirs(self.directory, exist_ok=True)
+    with open(os.path.join(self.directory, LOCK_FILE), "w") as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)  # One refresh at a time, across processes.
+
+      current = None if full else self._current()
+      if current is not None and (self._meta["dtype"] != self.dtype or not len(current[0])):
+        current = None
+      old_ids, old_matrix = current if current is not None else (np.empty(0, np.int64), None)
+      previous_meta = self._read_meta()
+      generation = previous_meta["generation"] + 1 if previous_meta else 1
+
+      chunk_ids = _fetch_chunk_ids()
+      keep = np.isin(old_ids, chunk_ids)
+      new_ids = np.setdiff1d(chunk_ids, old_ids, assume_unique=True)
+
+      parts_ids = [np.asarray(old_ids[keep], dtype=np.int64)]
+      parts_matrix = [np.asarray(old_matrix[keep])] if old_matrix is not None else []
+      for start in range(0, len(new_ids), REFRESH_BATCH_SIZE):
+        batch_ids, batch_matrix = _fetch_embeddings(new_ids[start:start + REFRESH_BATCH_SIZE])
+        parts_ids.append(batch_ids)
+        parts_matrix.append(_normalize(batch_matrix).astype(self.dtype))
+
+      ids = np.concatenate(parts_ids)
+      if parts_matrix:
+        matrix = np.concatenate(parts_matrix).astype(self.dtype, copy=False)
+      else:
+        matrix = np.empty((0, 0), dtype=self.dtype)
+      order = np.argsort(ids, kind="stable")
+      ids, matrix = ids[order], matrix[order]
+
+      stats = {
+          "generation": generation,
+          "added": int(len(new_ids)),
+          "removed": int(len(old_ids) - keep.sum()),
+          "total": int(len(ids)),
+      }
+      self._write_generation(generation, ids, matrix)
+      logger.info(f"embedding snapshot refreshed: {stats}")
+      return stats
+
+  def _write_generation(self, generation, ids, matrix):
+    ids_file = f"ids-{generation}.npy"
+    matrix_file = f"embeddings-{generation}.npy"
+    _save_atomically(os.path.join(self.directory, ids_file), ids)
+    _save_atomically(os.path.join(self.directory, matrix_file), matrix)
+
+    meta = {
+        "generation": generation,
+        "dtype": self.dtype,
+        "count": int(len(ids)),
+        "max_chunk_id": int(ids[-1]) if len(ids) else None,
+        "ids_file": ids_file,
+        "matrix_file": matrix_file,
+    }
+    meta_path = os.path.join(self.directory, META_FILE)
+    with open(meta_path + ".tmp", "w") as f:
+      json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    # Keep the previous generation for readers that have just read the old meta.json;
+    # processes mapping older ones keep them until they remap.
+    for name in os.listdir(self.directory):
+      match = re.fullmatch(r"(?:ids|embeddings)-(\d+)\.npy", name)
+      if match and int(match.group(1)) < generation - 1:
+        os.remove(os.path.join(self.directory, name))
+
+
+def _save_atomically(path, array):
+  with open(path + ".tmp", "wb") as f:
+    np.save(f, array)
+  os.replace(path + ".tmp", path)
+
+
+def _normalize(matrix):
+  norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+  norms[norms == 0] = 1
+  return matrix / norms
+
+
+def _fetch_chunk_ids():
+  from sqlalchemy import select
+  from domifile.db import db_transaction
+  from domifile.models import Chunk
+
+  with db_transaction(Chunk) as db_session:
+    return np.fromiter(db_session.execute(select(Chunk.id).order_by(Chunk.id)).scalars(),
+                       dtype=np.int64)
+
+
+def _fetch_embeddings(chunk_ids):
+  from sqlalchemy import select
+  from domifile.db import db_transaction
+  from domifile.models import Chunk
+
+  with db_transaction(Chunk) as db_session:
+    rows = db_session.execute(
+        select(Chunk.id, Chunk.embedding).where(Chunk.id.in_(chunk_ids.tolist()))).all()
+  ids = np.array([row.id for row in rows], dtype=np.int64)
+  matrix = np.array([np.asarray(row.embedding, dtype=np.float32) for row in rows],
+                    dtype=np.float32)
+  return ids, matrix.reshape(len(rows), -1)
+
+
+# --------------------------------------------------------------------------------
+# The configured snapshot, if any.
+
+_snapshot = None
+
+
+def configure_embedding_snapshot(config):
+  """ Enable in-process search if config.EMBEDDING_SNAPSHOT_DIR is set. """
+  global _snapshot
+  directory = getattr(config, "EMBEDDING_SNAPSHOT_DIR", None)
+  dtype = getattr(config, "EMBEDDING_SNAPSHOT_DTYPE", "float32")
+  _snapshot = EmbeddingSnapshot(directory, dtype=dtype) if directory else None
+
+
+def get_embedding_snapshot():
+  """ The configured snapshot, or None if in-process search is disabled. """
+  return _snapshot
+
+
+def refresh_embedding_snapshot(*, full=False):
+  """ Refresh the configured snapshot, if any.  Returns counts, or None. """
+  if _snapshot is None:
+    return None
+  return _snapshot.refresh(full=full)
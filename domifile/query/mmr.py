@@ -0,0 +1,57 @@
+# domifile/query/mmr.py
+import json
+import numpy as np
+
+
+def as_vector(v):
+  """ Embedding as a float32 array.  Accepts pgvector text, a sequence or an array. """
+  if isinstance(v, str):
+    v = json.loads(v)
+  return np.asarray(v, dtype=np.float32)
+
+
+def normalized_matrix(embeddings):
+  """ Stack embeddings into one matrix of unit-length rows. """
+  matrix = np.vstack([as_vector(e) for e in embeddings])
+  norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+  norms[norms == 0] = 1
+  return matrix / norms
+
+
+def mmr_indices(query_vec, matrix, k=4, lambda_=0.7):
+  """
+    Maximal marginal relevance over a matrix of unit-length candidate rows.  Returns the indices
+    of up to k rows in order of selection.  Each step scores candidates by
+      lambda_ * similarity to the query - (1 - lambda_) * max similarity to those selected
+    with the pairwise similarities computed up front in one product.
+  """
+  n = matrix.shape[0]
+  k = min(k, n)
+  if k <= 0:
+    return []
+
+  query = as_vector(query_vec)
+  query = query / (np.linalg.norm(query) or 1)
+  relevance = matrix @ query
+  similarity = matrix @ matrix.T
+
+  max_similarity = np.zeros(n, dtype=np.float32)  # No diversity penalty until a pick
+  available = np.ones(n, dtype=bool)
+  selected = []
+  for _ in range(k):
+    scores = lambda_ * relevance - (1 - lambda_) * max_similarity
+    scores[~available] = -np.inf
+    best = int(np.argmax(scores))
+    selected.append(best)
+    available[best] = False
+    max_similarity = similarity[best] if len(selected) == 1 else np.maximum(
+        max_similarity, similarity[best])
+  return selected
+
+
+def mmr(query_vec, rows, k=4, lambda_=0.7):
+  """ Select up to k of rows (having an embedding attribute) by maximal marginal relevance. """
+  if not rows:
+    return []
+  matrix = normalized_matrix([r.embedding for r in rows])
+  return [rows[i] for i in mmr_indices(query_vec, matrix, k=k, lambda_=lambda_)]
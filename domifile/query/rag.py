@@ -1,91 +1,330 @@
 # domifile/query/rag.py
 import logging
-import json
-import numpy as np
 import re
+from collections import namedtuple
 from datetime import date
 from sqlalchemy import text
 
+from ..ingest.doctypes import doc_types_in_category
 from ..openai_adapter import create_embedding, create_response
+from .context import pack_context
+from .fusion import RRF_K
+from .matrix import get_embedding_snapshot
+from .vector_index import get_vector_storage, tune_vector_search
+
+logger = logging.getLogger(__name__)
+
+# Candidates fetched by each of the vector and lexical searches.  Candidates are ids, vectors
+# and token counts only; text is loaded for the chunks packed into the context (see context.py).
+CANDIDATE_COUNT = 48
+
+# Token count of a chunk (alias c), estimated from its text if it predates the column.
+TOKEN_COUNT_SQL = "COALESCE(c.token_count, length(c.text) / 3 + 1)"
+
+# pgvector's default hnsw.ef_search; an HNSW scan returns at most this many rows.
+DEFAULT_EF_SEARCH = 40
+
+
+def chunk_filter_sql(*, time_range=None, doc_types=None, category=None):
+  """
+    SQL conditions on chunks (alias c) and their parameters, restricting a search to chunks:
+      * whose coverage overlaps time_range, or whose document date falls in it; time_range is a
+        dict of ISO date strings "start" and "end", either of which may be null.  Undated
+        chunks are kept, so as not to lose out to any dated match.
+      * whose doc_type is one of doc_types, or of category (see
+        ingest.doctypes.doc_types_in_category)
+    An unknown category does not filter.  Returns ("", {}) if nothing is to be filtered.
+  """
+  conditions = []
+  params = {}
+
+  start = _parse_date(time_range.get("start")) if time_range else None
+  end = _parse_date(time_range.get("end")) if time_range else None
+  if start or end:
+    conditions.append("""(
+      (c.coverage_start <= :range_end
+        AND COALESCE(c.coverage_end, c.coverage_start) >= :range_start)
+      OR c.document_date BETWEEN :range_start AND :range_end
+      OR (c.coverage_start IS NULL AND c.document_date IS NULL)
+    )""")
+    params["range_start"] = start or date.min
+    params["range_end"] = end or date.max
+
+  doc_types = list(doc_types or [])
+  if category:
+    doc_types.extend(t for t in doc_types_in_category(category) if t not in doc_types)
+  if doc_types:
+    conditions.append("c.doc_type = ANY(:doc_types)")
+    params["doc_types"] = doc_types
+
+  return " AND ".join(conditions), params
+
+
+def search_filters_for_intent(intent):
+  """ Search filters implied by a classify_query intent. """
+  if not intent:
+    return {}
+  filters = {}
+  if intent.get("time_range"):
+    filters["time_range"] = intent["time_range"]
+  if intent.get("category"):
+    filters["category"] = intent["category"]
+  return filters
+
+
+def _parse_date(value):
+  try:
+    return date.fromisoformat(value) if value else None
+  except (TypeError, ValueError):
+    return None
+
+
+# A candidate for the context of an answer: what ranking, MMR and packing need, without text.
+Candidate = namedtuple("Candidate", ["id", "document_id", "distance", "embedding", "token_count"])
+
+# A selected chunk, with its text and the document it cites.
+RetrievedChunk = namedtuple("RetrievedChunk",
+                            ["filename", "drive_file_id", "id", "text", "embedding"])
+
+# Chunks fused by reciprocal rank from a vector ranking (the vector_hits CTE, supplied) and a
+# full-text ranking of the question.  The lexical query matches any of the question's terms
+# (plainto_tsquery ANDs them), so that exact tokens such as unit or invoice numbers find their
+# chunks.
+HYBRID_SQL = """
+  WITH vector_hits AS (
+    {vector_hits}
+  ),
+  lexical_query AS (
+    SELECT replace(plainto_tsquery('{text_search_config}', :question)::text,
+                   '&', '|')::tsquery AS query
+  ),
+  lexical_hits AS (
+    SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+    FROM (
+      SELECT c.id, ts_rank_cd(c.text_search, q.query) AS score
+      FROM chunks c, lexical_query q
+      WHERE c.text_search @@ q.query {and_filter}
+      ORDER BY score DESC
+      LIMIT :limit
+    ) l
+  ),
+  fused AS (
+    SELECT id, sum(1.0 / (:rrf_k + rank)) AS score
+    FROM (SELECT * FROM vector_hits UNION ALL SELECT * FROM lexical_hits) hits
+    GROUP BY id
+  )
+  SELECT c.id, c.document_id, {distance} AS distance, {embedding} AS embedding,
+         {token_count} AS token_count
+  FROM fused f
+  JOIN chunks c ON c.id = f.id
+  ORDER BY f.score DESC
+  LIMIT :limit
+"""
+
+
+def fetch_candidates(qvec,
+                     question=None,
+                     *,
+                     limit=CANDIDATE_COUNT,
+                     ef_search=None,
+                     probes=None,
+                     time_range=None,
+                     doc_types=None,
+                     category=None):
+  """
+    Candidate chunks for a query vector and, if given, the question text, best first.  With a
+    question, the nearest chunks by cosine distance and the best full-text matches are fused by
+    reciprocal rank, in one statement.  ef_search/probes tune recall of the vector index.  With
+    compact vector storage, the index yields extra candidates that are re-scored on full
+    embeddings.
+
+    time_range, doc_types and category restrict the search (see chunk_filter_sql).  Filters
+    are applied within the index scans, which iterate until enough chunks pass them.
+
+    If an embedding snapshot is configured, unfiltered vector search runs in process instead.
+
+    Candidates carry no text; see load_chunks.
+  """
+  from domifile.db import db_transaction
+  from domifile.models import Chunk, TEXT_SEARCH_CONFIG
 
+  storage = get_vector_storage()
+  candidate_limit = storage.candidate_limit(limit)
+  if ef_search is None and candidate_limit > DEFAULT_EF_SEARCH:
+    ef_search = candidate_limit
 
-def fetch_relevant_chunks(qvec):
+  with db_transaction(Chunk) as db_session:
+    where, filter_params = chunk_filter_sql(time_range=time_range,
+                                            doc_types=doc_types,
+                                            category=category)
+
+    snapshot = get_embedding_snapshot()
+    if not where and snapshot is not None and snapshot.is_available():
+      return _fetch_candidates_with_snapshot(db_session, snapshot, qvec, question, limit)
+
+    tune_vector_search(db_session,
+                       ef_search=ef_search,
+                       probes=probes,
+                       iterative_scan="relaxed_order" if where else None)
+    where_sql = f"WHERE {where}" if where else ""
+
+    if question is None:
+      # Relaxed iterative scans may return rows slightly out of order; sort them again.
+      sql = text(f"""
+        WITH vector_hits AS MATERIALIZED (
+          {storage.nearest_chunks_sql(where_sql)}
+        )
+        SELECT c.id, c.document_id, v.distance, c.embedding, {TOKEN_COUNT_SQL}
+        FROM vector_hits v
+        JOIN chunks c ON c.id = v.id
+        ORDER BY v.distance
+      """)
+      rows = db_session.execute(sql, {
+          "qvec": qvec,
+          "limit": limit,
+          "candidate_limit": candidate_limit,
+          **filter_params
+      }).fetchall()
+      return [Candidate(*row) for row in rows]
+
+    vector_hits = f"""
+      SELECT id, row_number() OVER (ORDER BY distance) AS rank
+      FROM ({storage.nearest_chunks_sql(where_sql)}) v
+    """
+    sql = text(
+        HYBRID_SQL.format(vector_hits=vector_hits,
+                          text_search_config=TEXT_SEARCH_CONFIG,
+                          and_filter=f"AND {where}" if where else "",
+                          distance="c.embedding <=> CAST(:qvec AS vector)",
+                          embedding="c.embedding",
+                          token_count=TOKEN_COUNT_SQL))
+
+    rows = db_session.execute(
+        sql, {
+            "qvec": qvec,
+            "question": question,
+            "limit": limit,
+            "candidate_limit": candidate_limit,
+            "rrf_k": RRF_K,
+            **filter_params,
+        }).fetchall()
+    return [Candidate(*row) for row in rows]
+
+
+def _fetch_candidates_with_snapshot(db_session, snapshot, qvec, question, limit):
+  """
+    Vector ranking from the in-process snapshot; any lexical ranking from the database.
+    Embeddings and distances of vector hits come from the snapshot rather than over the wire.
+  """
+  from domifile.models import TEXT_SEARCH_CONFIG
+
+  ids, similarities = snapshot.search(qvec, limit)
+  vector_ids = [int(chunk_id) for chunk_id in ids]
+  distances = {chunk_id: 1 - float(s) for chunk_id, s in zip(vector_ids, similarities)}
+
+  if question is None:
+    sql = text(f"""
+      SELECT c.id, c.document_id, NULL AS distance, NULL AS embedding,
+             {TOKEN_COUNT_SQL} AS token_count
+      FROM unnest(CAST(:vector_ids AS integer[])) WITH ORDINALITY AS v(id, rank)
+      JOIN chunks c ON c.id = v.id
+      ORDER BY v.rank
+    """)
+    rows = db_session.execute(sql, {"vector_ids": vector_ids}).fetchall()
+  else:
+    vector_hits = """
+      SELECT id, rank FROM unnest(CAST(:vector_ids AS integer[])) WITH ORDINALITY AS v(id, rank)
+    """
+    # Only lexical hits missing from the vector hits need their embeddings shipped.
+    sql = text(
+        HYBRID_SQL.format(
+            vector_hits=vector_hits,
+            text_search_config=TEXT_SEARCH_CONFIG,
+            and_filter="",
+            distance=("CASE WHEN c.id = ANY(:vector_ids) THEN NULL "
+                      "ELSE c.embedding <=> CAST(:qvec AS vector) END"),
+            embedding="CASE WHEN c.id = ANY(:vector_ids) THEN NULL ELSE c.embedding END",
+            token_count=TOKEN_COUNT_SQL))
+    rows = db_session.execute(
+        sql, {
+            "vector_ids": vector_ids,
+            "qvec": qvec,
+            "question": question,
+            "limit": limit,
+            "rrf_k": RRF_K,
+        }).fetchall()
+
+  embeddings = snapshot.embeddings_for(row.id for row in rows if row.embedding is None)
+  candidates = []
+  for row in rows:
+    embedding = row.embedding if row.embedding is not None else embeddings.get(row.id)
+    if embedding is not None:
+      distance = row.distance if row.distance is not None else distances.get(row.id)
+      candidates.append(Candidate(row.id, row.document_id, distance, embedding, row.token_count))
+  return candidates
+
+
+def load_chunks(candidates):
+  """ Text and document of candidates, in one query.  Returns RetrievedChunks, in order. """
   from domifile.db import db_transaction
   from domifile.models import Chunk
 
+  if not candidates:
+    return []
   with db_transaction(Chunk) as db_session:
+    rows = db_session.execute(text(LOAD_CHUNKS_SQL), {
+        "ids": [c.id for c in candidates]
+    }).fetchall()
+  return retrieved_chunks(candidates, rows)
+
+
+LOAD_CHUNKS_SQL = """
+  SELECT c.id, c.text, d.filename, d.drive_file_id
+  FROM chunks c
+  JOIN documents d ON d.id = c.document_id
+  WHERE c.id = ANY(:ids)
+"""
+
+
+def retrieved_chunks(candidates, rows):
+  """ RetrievedChunks of candidates, in order, given rows of LOAD_CHUNKS_SQL. """
+  by_id = {row.id: row for row in rows}
+  # Chunks deleted since they were found are dropped.
+  return [
+      RetrievedChunk(by_id[c.id].filename, by_id[c.id].drive_file_id, c.id, by_id[c.id].text,
+                     c.embedding) for c in candidates if c.id in by_id
+  ]
+
+
+def select_chunks(question, **search_options):
+  """
+    Chunks for the context of an answer: candidates packed into the context token budget (see
+    context.pack_context), then loaded.  If search filters (time_range, doc_types, category)
+    leave no candidates, the search is repeated without them.
+  """
+  qvec = create_embedding(question)
+  candidates = fetch_candidates(qvec, question, **search_options)
 
-    sql = text("""
-      SELECT d.filename, d.drive_file_id, c.id, c.text, c.embedding
-      FROM chunks c
-      JOIN documents d ON d.id = c.document_id
-      ORDER BY c.embedding <=> CAST(:qvec AS vector)
-      LIMIT :limit
-    """)
-
-    chunks = db_session.execute(sql, {"qvec": qvec, "limit": 12}).fetchall()
-    return chunks
-
-
-def vec(v):
-  if isinstance(v, str):
-    v = json.loads(v)
-  a = np.array(v, dtype=float)
-  return a / np.linalg.norm(a)  # Normalize
-
-
-def mmr(query_vec, rows, k=4, lambda_=0.7):
-  query_vec = vec(query_vec)
-  embeddings = {r.id: vec(r.embedding) for r in rows}
-
-  selected = []
-  candidates = rows[:]
-
-  while len(selected) < k and candidates:
-    best = None
-    best_score = -1e9
-
-    for r in candidates:
-      embedding = embeddings[r.id]
-      rel = np.dot(query_vec, embedding)
-
-      div = 0
-      if selected:
-        div = max(np.dot(embedding, embeddings[s.id]) for s in selected)
-
-      score = lambda_ * rel - (1 - lambda_) * div
-
-      if score > best_score:
-        best_score = score
-        best = r
-
-    selected.append(best)
-    candidates.remove(best)
-
-  return selected
-
-
-def select_chunks(question):
-  all_chunks = []
+  filters = {key for key in ("time_range", "doc_types", "category") if search_options.get(key)}
+  if not candidates and filters:
+    logger.debug(f"no chunks pass filters {filters}; searching unfiltered")
+    unfiltered = {key: value for key, value in search_options.items() if key not in filters}
+    candidates = fetch_candidates(qvec, question, **unfiltered)
 
-  qvec = create_embedding(question)
-  chunks = fetch_relevant_chunks(qvec)
-  all_chunks.extend(chunks)
+  candidates = list({c.id: c for c in candidates}.values())
+  return load_chunks(pack_context(qvec, candidates))
 
-  unique_chunks = {c.id: c for c in all_chunks}
-  chunks = list(unique_chunks.values())
 
-  chunks = mmr(qvec, chunks, k=4)
-  return chunks
+def create_context(question, **search_options):
+  chunks = select_chunks(question, **search_options)
+  return format_context(chunks), chunks
 
 
-def create_context(question):
-  chunks = select_chunks(question)
+def format_context(chunks):
   formatted_chunks = [f"""[{c.id}]
       {c.text}
       """ for c in chunks]
-  context = "\n\n-----\n\n".join(formatted_chunks)
-  return context, chunks
+  return "\n\n-----\n\n".join(formatted_chunks)
 
 
 def create_prompt(context, question):
@@ -141,10 +380,24 @@ def build_sources(chunks, cited_ids):
   } for cid in cited_ids if cid in by_id]
 
 
-def answer_rag(question):
-  context, chunks = create_context(question)
-  prompt = create_prompt(context, question)
-  answer = create_response(prompt)
+def answer_rag(question, intent=None, **search_options):
+  """
+    Answer by retrieval.  The search is narrowed by the time range and category of intent, if
+    given; search_options are passed through to fetch_candidates.
+  """
+  prompt, chunks = prepare_rag(question, intent, **search_options)
+  return finish_rag(create_response(prompt), chunks)
+
+
+def prepare_rag(question, intent=None, **search_options):
+  """ First half of answer_rag: (prompt, selected chunks). """
+  search_options = {**search_filters_for_intent(intent), **search_options}
+  context, chunks = create_context(question, **search_options)
+  return create_prompt(context, question), chunks
+
+
+def finish_rag(answer, chunks):
+  """ Second half of answer_rag: the result, with the chunks cited by answer as sources. """
   answer = normalize_citations(answer)
   cited_ids = extract_cited_ids(answer)
   sources = build_sources(chunks, cited_ids)
@@ -0,0 +1,99 @@
+# domifile/query/routing.py
+"""
+  Time budgets of the stages of answering, for the speculative router (query.route_question and
+  its async counterpart in query/aio.py).  Retrieval starts alongside classification, on the
+  bet that the answer is by retrieval, as most are.  A stage that overruns its budget is given
+  up on: classification is taken to say "rag", a structured or hybrid answer to be missing, and
+  retrieval to have found nothing.  Budgets run from when a stage starts, not from when it is
+  queued for a thread, so a busy pool delays answers rather than failing them.
+"""
+import asyncio
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Seconds.  None is unlimited.
+RouteBudgets = namedtuple("RouteBudgets", ["classify", "structured", "hybrid", "rag"])
+
+DEFAULT_ROUTE_BUDGETS = RouteBudgets(classify=3.0, structured=2.0, hybrid=10.0, rag=15.0)
+
+# Threads running the stages of answers.  Each answer uses up to four at once: classification,
+# a fact answer, and speculative and filtered retrieval.
+ROUTER_THREADS = 32
+
+_budgets = DEFAULT_ROUTE_BUDGETS
+_executor = ThreadPoolExecutor(max_workers=ROUTER_THREADS, thread_name_prefix="router")
+
+
+def configure_route_budgets(config):
+  """ Per config.ROUTE_BUDGET_CLASSIFY, _STRUCTURED, _HYBRID and _RAG, in seconds. """
+  global _budgets
+  budgets = {}
+  for stage in RouteBudgets._fields:
+    value = getattr(config, f"ROUTE_BUDGET_{stage.upper()}", None)
+    budgets[stage] = getattr(DEFAULT_ROUTE_BUDGETS, stage) if value is None else float(value)
+  _budgets = RouteBudgets(**budgets)
+
+
+def get_route_budgets():
+  return _budgets
+
+
+def start(fn, *args, **kwargs):
+  """
+    Run fn in a router thread.  Returns its future, whose started attribute is a future of the
+    time.monotonic() at which fn started, or of None if the future was cancelled first.
+  """
+  started = Future()
+
+  def run():
+    started.set_result(time.monotonic())
+    return fn(*args, **kwargs)
+
+  def done(future):
+    if future.cancelled():
+      started.set_result(None)
+
+  future = _executor.submit(run)
+  future.started = started
+  future.add_done_callback(done)
+  return future
+
+
+def wait(future, budget):
+  """
+    The result of a future from start, allowing it budget seconds from when it started.  Raises
+    TimeoutError if it overruns.
+  """
+  started_at = future.started.result()
+  return future.result(timeout=_remaining(started_at, budget))
+
+
+async def wait_async(future, budget):
+  """ As wait, awaiting rather than blocking. """
+  started_at = await asyncio.wrap_future(future.started)
+  return await asyncio.wait_for(asyncio.wrap_future(future), _remaining(started_at, budget))
+
+
+def result_within(future, budget, stage):
+  """
+    The result of a future from start, or None if it is not done within budget seconds of
+    starting or fails.  A thread cannot be interrupted; one that overruns finishes unobserved.
+  """
+  try:
+    return wait(future, budget)
+  except TimeoutError:
+    future.cancel()
+    logger.info(f"{stage} exceeded its budget of {budget}s")
+  except Exception:
+    logger.exception(f"{stage} failed")
+  return None
+
+
+def _remaining(started_at, budget):
+  if budget is None or started_at is None:
+    return None
+  return max(0.0, started_at + budget - time.monotonic())
@@ -0,0 +1,186 @@
+# query/tests/test_answer_cache.py
+
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import domifile.query as query
+from domifile.query import answer_cache
+
+
+class FakeAnswerCache:
+
+  def __init__(self, cached=None):
+    self.cached = cached
+    self.logged = []
+    self.stored = []
+
+  def log_question(self, question):
+    self.logged.append(question)
+
+  def lookup(self, question, qvec):
+    return 7, self.cached
+
+  def store(self, question, qvec, answer, *, corpus_version):
+    self.stored.append((question, answer, corpus_version))
+
+
+@pytest.fixture
+def answered(monkeypatch):
+  answered = []
+
+  def fake_answer(question, **search_options):
+    answered.append((question, search_options))
+    return {"answer": f"about {question}", "sources": []}
+
+  monkeypatch.setattr(query, "_answer_question", fake_answer)
+  monkeypatch.setattr(query, "create_embedding", lambda text: [0.1, 0.2])
+  return answered
+
+
+def test_miss_is_answered_and_stored_under_version_read_first(monkeypatch, answered):
+  cache = FakeAnswerCache()
+  monkeypatch.setattr(query, "get_answer_cache", lambda: cache)
+  result = query.answer_question("who does landscaping")
+  assert result["answer"] == "about who does landscaping"
+  assert cache.logged == ["who does landscaping"]
+  assert cache.stored == [("who does landscaping", result, 7)]
+
+
+def test_hit_skips_answering(monkeypatch, answered):
+  cache = FakeAnswerCache(cached={"answer": "Green Acres", "sources": []})
+  monkeypatch.setattr(query, "get_answer_cache", lambda: cache)
+  assert query.answer_question("landscaping vendor?")["answer"] == "Green Acres"
+  assert answered == []
+  assert cache.stored == []
+
+
+def test_search_options_bypass_cache(monkeypatch, answered):
+  cache = FakeAnswerCache(cached={"answer": "cached"})
+  monkeypatch.setattr(query, "get_answer_cache", lambda: cache)
+  assert query.answer_question("q", ef_search=100)["answer"] == "about q"
+  assert answered == [("q", {"ef_search": 100})]
+  assert cache.logged == []
+
+
+def test_unanswered_is_not_stored(monkeypatch):
+  cache = FakeAnswerCache()
+  monkeypatch.setattr(query, "get_answer_cache", lambda: cache)
+  monkeypatch.setattr(query, "create_embedding", lambda text: [0.1])
+  monkeypatch.setattr(query, "_answer_question", lambda question: {})
+  assert query.answer_question("q") == {}
+  assert cache.stored == []
+
+
+def test_degraded_answer_is_not_cached(monkeypatch):
+  from domifile.query import routing
+  from domifile.query.routing import RouteBudgets
+
+  done = threading.Event()
+
+  def slow_retrieval(question, **options):
+    done.wait(2)
+    return ["chunk"]
+
+  cache = FakeAnswerCache()
+  monkeypatch.setattr(routing, "_budgets",
+                      RouteBudgets(classify=1.0, structured=1.0, hybrid=1.0, rag=0.05))
+  monkeypatch.setattr(query, "get_answer_cache", lambda: cache)
+  monkeypatch.setattr(query, "create_embedding", lambda text: [0.1, 0.2])
+  monkeypatch.setattr(query, "classify_query", lambda question, qvec: {"type": "rag"})
+  monkeypatch.setattr(query, "select_chunks", slow_retrieval)
+  monkeypatch.setattr(query, "create_response", lambda prompt: "Not stated in the documents.")
+
+  result = query.answer_question("who plows?")
+  done.set()
+  assert result["degraded"] is True
+  assert cache.stored == []
+
+
+def cosine(a, b):
+  return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+class FakeSession:
+  """ The answer_cache table, ranked by cosine similarity as pgvector does. """
+
+  def __init__(self, entries):
+    self.entries = entries
+
+  def execute(self, statement, params):
+    if "hit_count" in str(statement):
+      return None
+    qvec = np.asarray(params["qvec"])
+    rows = [
+        SimpleNamespace(id=i,
+                        question=question,
+                        answer=answer,
+                        similarity=cosine(embedding, qvec))
+        for i, (question, embedding, answer) in enumerate(self.entries)
+    ]
+    rows.sort(key=lambda row: -row.similarity)
+    return SimpleNamespace(all=lambda: rows[:params["limit"]])
+
+
+@pytest.fixture
+def embedded():
+  """ Embeddings of rephrasings and near-duplicates: one direction, perturbed slightly. """
+  rng = np.random.default_rng(0)
+  subjects = {}
+
+  def embed(subject):
+    base = subjects.setdefault(subject, rng.normal(size=256))
+    return base + rng.normal(scale=0.15, size=256)
+
+  return embed
+
+
+def lookup(monkeypatch, entries, question, qvec):
+
+  @contextmanager
+  def db_transaction(model):
+    yield FakeSession(entries)
+
+  monkeypatch.setattr("domifile.db.db_transaction", db_transaction)
+  monkeypatch.setattr(answer_cache, "current_corpus_version", lambda db_session: 7)
+  return answer_cache.AnswerCache().lookup(question, qvec)[1]
+
+
+@pytest.mark.parametrize("cached_question, question, hit", [
+    ("How much were the insurance payments in 2024?", "What did we pay for insurance in 2024",
+     True),
+    ("How much were the insurance payments in 2024?",
+     "How much were the insurance payments in 2025?", False),
+    ("When was the dishwasher in unit 6B replaced?",
+     "When was the dishwasher in unit 6C replaced?", False),
+    ("Which invoices were over $1,200?", "Which invoices were over $1200?", True),
+    ("What insurance did I pay this year?", "What insurance did I pay last year?", False),
+    ("What insurance did I pay last year?", "What insurance did we pay in the past year?", True),
+    ("Who plowed in January?", "Who plowed in February?", False),
+])
+def test_hit_requires_same_key_tokens(monkeypatch, embedded, cached_question, question, hit):
+  qvec = embedded("subject")
+  entries = [(cached_question, embedded("subject"), "cached")]
+  assert cosine(entries[0][1], qvec) > answer_cache.DEFAULT_SIMILARITY_THRESHOLD
+  assert lookup(monkeypatch, entries, question, qvec) == ("cached" if hit else None)
+
+
+def test_hit_may_be_second_nearest(monkeypatch, embedded):
+  qvec = embedded("subject")
+  entries = [
+      ("Insurance payments in 2025?", embedded("subject"), "2025"),
+      ("Insurance payments in 2024?", embedded("subject"), "2024"),
+  ]
+  assert lookup(monkeypatch, entries, "insurance payments in 2024", qvec) == "2024"
+
+
+def test_key_tokens():
+  tokens = answer_cache.key_tokens("Paid $1,200.50 for unit 6B in 2024.")
+  assert tokens == {"1200.50", "6b", "2024"}
+  assert answer_cache.key_tokens("Who plows the driveway?") == frozenset()
+  assert answer_cache.key_tokens("Paid last  Year, since March?") == {
+      "last year", "since", "march"
+  }
@@ -0,0 +1,155 @@
+# query/tests/test_async_answer.py
+
+import asyncio
+
+from domifile.db.aio import to_pyformat
+from domifile.query import aio
+from domifile.query.rag import Candidate, RetrievedChunk
+
+
+def test_stages_run_concurrently_and_stream(monkeypatch):
+  started = []
+
+  async def embed(question):
+    started.append("embed")
+    await asyncio.sleep(0.01)
+    return [1.0, 0.0]
+
+  async def lexical(question):
+    started.append("lexical")
+    return [12]
+
+  async def classify(question, qvec_task):
+    started.append("classify")
+    return {"type": "rag"}
+
+  async def fetch_candidates(qvec, lexical_task, intent):
+    assert await lexical_task == [12]
+    return [Candidate(11, 1, 0.1, [1.0, 0.0], 50), Candidate(12, 2, 0.4, [0.0, 1.0], 50)]
+
+  async def load_chunks(candidates):
+    return [RetrievedChunk("f.pdf", "d", c.id, "text", c.embedding) for c in candidates]
+
+  async def response_stream(prompt):
+    for delta in ["Yes ", "[11]."]:
+      yield delta
+
+  monkeypatch.setattr(aio, "get_answer_cache", lambda: None)
+  monkeypatch.setattr(aio, "create_embedding_async", embed)
+  monkeypatch.setattr(aio, "_lexical_ranking", lexical)
+  monkeypatch.setattr(aio, "classify_query_async", classify)
+  monkeypatch.setattr(aio, "fetch_candidates_async", fetch_candidates)
+  monkeypatch.setattr(aio, "load_chunks_async", load_chunks)
+  monkeypatch.setattr(aio, "create_response_stream_async", response_stream)
+
+  async def collect():
+    return [event async for event in aio.stream_answer_async("q")]
+
+  events = asyncio.run(collect())
+
+  # Classification does not wait for the embedding or the lexical search to finish.
+  assert set(started) == {"embed", "lexical", "classify"}
+  assert [name for name, _ in events] == ["route", "sources", "delta", "delta", "done"]
+  assert events[-1][1]["answer"] == "Yes [11]."
+  assert events[-1][1]["citations"] == [11]
+
+
+def test_to_pyformat_rewrites_parameters_only():
+  assert to_pyformat("SELECT :question::text, c.id FROM chunks c WHERE c.id = ANY(:ids)") == (
+      "SELECT %(question)s::text, c.id FROM chunks c WHERE c.id = ANY(%(ids)s)")
+  assert to_pyformat("SELECT 'a%' LIKE :pattern") == "SELECT 'a%%' LIKE %(pattern)s"
+
+
+def test_fact_answer_cancels_speculative_retrieval(monkeypatch):
+  import domifile.query as query
+
+  cancelled = []
+
+  async def embed(question):
+    return [1.0, 0.0]
+
+  async def lexical(question):
+    return []
+
+  async def classify(question, qvec_task):
+    return {"type": "structured"}
+
+  async def fetch_candidates(qvec, lexical_task, intent):
+    try:
+      await asyncio.sleep(10)
+    except asyncio.CancelledError:
+      cancelled.append(True)
+      raise
+
+  monkeypatch.setattr(aio, "get_answer_cache", lambda: None)
+  monkeypatch.setattr(aio, "create_embedding_async", embed)
+  monkeypatch.setattr(aio, "_lexical_ranking", lexical)
+  monkeypatch.setattr(aio, "classify_query_async", classify)
+  monkeypatch.setattr(aio, "fetch_candidates_async", fetch_candidates)
+  monkeypatch.setattr(query, "_answer_from_facts", lambda question, intent: {"answer": "$120"})
+
+  async def collect():
+    events = [event async for event in aio.stream_answer_async("q")]
+    await asyncio.sleep(0)  # Let the cancellation land.
+    return events
+
+  events = asyncio.run(collect())
+  assert events[0] == ("route", {"type": "structured"})
+  assert events[-1] == ("done", {"answer": "$120"})
+  assert cancelled == [True]
+
+
+def test_slow_retrieval_answers_without_context_uncached(monkeypatch):
+  from domifile.query import routing
+  from domifile.query.routing import RouteBudgets
+
+  prompts = []
+
+  async def embed(question):
+    return [1.0, 0.0]
+
+  async def lexical(question):
+    return []
+
+  async def classify(question, qvec_task):
+    return {"type": "rag"}
+
+  async def fetch_candidates(qvec, lexical_task, intent):
+    await asyncio.sleep(10)
+
+  async def response_stream(prompt):
+    prompts.append(prompt)
+    yield "Not stated in the documents."
+
+  class Cache:
+    stored = []
+
+    def log_question(self, question):
+      pass
+
+    def lookup(self, question, qvec):
+      return 3, None
+
+    def store(self, question, qvec, result, *, corpus_version):
+      self.stored.append(result)
+
+  cache = Cache()
+  monkeypatch.setattr(routing, "_budgets",
+                      RouteBudgets(classify=1.0, structured=1.0, hybrid=1.0, rag=0.05))
+  monkeypatch.setattr(aio, "get_answer_cache", lambda: cache)
+  monkeypatch.setattr(aio, "create_embedding_async", embed)
+  monkeypatch.setattr(aio, "_lexical_ranking", lexical)
+  monkeypatch.setattr(aio, "classify_query_async", classify)
+  monkeypatch.setattr(aio, "fetch_candidates_async", fetch_candidates)
+  monkeypatch.setattr(aio, "create_response_stream_async", response_stream)
+
+  async def collect():
+    return [event async for event in aio.stream_answer_async("q")]
+
+  events = asyncio.run(collect())
+  assert ("sources", []) in events
+  assert events[-1][1]["answer"] == "Not stated in the documents."
+  assert events[-1][1]["degraded"] is True
+  assert len(prompts) == 1
+  # Not served to later askers.
+  assert cache.stored == []
@@ -0,0 +1,84 @@
+# query/tests/test_classify.py
+
+from datetime import date
+
+import pytest
+
+from domifile.query import classify
+
+WORDS = ["pay", "cost", "when", "serviced", "inspected", "who", "rules", "and", "what", "work"]
+
+
+def fake_embedding(text):
+  # Bag of words over a tiny vocabulary, enough to separate the toy prototypes.
+  tokens = text.lower().replace("?", "").split()
+  return [float(tokens.count(word)) for word in WORDS] + [0.01]
+
+
+EXAMPLES = [
+    ("How much did we pay", "structured", "transaction"),
+    ("What did it cost", "structured", "transaction"),
+    ("When was it serviced", "structured", "service_date"),
+    ("When was it inspected", "structured", "service_date"),
+    ("When was it serviced and what work", "hybrid", "service_date"),
+    ("When inspected and what work", "hybrid", "service_date"),
+    ("Who does it", "rag", None),
+    ("What are the rules", "rag", None),
+]
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+  monkeypatch.setattr(classify, "create_embeddings",
+                      lambda texts: [fake_embedding(t) for t in texts])
+  monkeypatch.setattr(classify, "create_embedding", fake_embedding)
+  return classify.PrototypeClassifier(EXAMPLES, margin=0.05)
+
+
+def test_routes_by_nearest_prototypes(classifier):
+  intent, confident = classifier.classify("What did we pay in 2024?")
+  assert confident
+  assert intent == {
+      "type": "structured",
+      "fact_type": "transaction",
+      "category": None,
+      "time_range": {
+          "start": "2024-01-01",
+          "end": "2024-12-31"
+      },
+  }
+  assert classifier.classify("Who plows the snow?")[0]["type"] == "rag"
+
+
+def test_unresolved_time_phrase_is_not_confident(classifier):
+  intent, confident = classifier.classify("What did we pay last winter?")
+  assert intent["type"] == "structured"
+  assert not confident
+
+
+def test_falls_back_to_llm_when_not_confident(monkeypatch, classifier):
+  monkeypatch.setattr(classify, "_classifier", classifier)
+  monkeypatch.setattr(classify, "classify_query_with_llm", lambda question: {"type": "llm"})
+  assert classify.classify_query("Who does it")["type"] == "rag"
+  assert classify.classify_query("pay serviced since March")["type"] == "llm"
+
+
+def test_resolve_time_range():
+  today = date(2026, 5, 1)
+  assert classify.resolve_time_range("paid since 2023?", today) == ({
+      "start": "2023-01-01",
+      "end": None
+  }, True)
+  assert classify.resolve_time_range("total this year", today) == ({
+      "start": "2026-01-01",
+      "end": "2026-05-01"
+  }, True)
+  assert classify.resolve_time_range("When was it last serviced?", today) == (None, True)
+  assert classify.resolve_time_range("What did we pay in March?", today) == (None, False)
+
+
+def test_benchmark_reports_accuracy(classifier):
+  report = classify.benchmark_classifier(EXAMPLES, classifier=classifier)
+  assert report["examples"] == len(EXAMPLES)
+  assert report["local_accuracy"] == 1.0
+  assert report["misrouted"] == []
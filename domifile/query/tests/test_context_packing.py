@@ -0,0 +1,40 @@
+# query/tests/test_context_packing.py
+
+from domifile.query.context import pack_context, pack_in_order, relevant_count
+from domifile.query.rag import Candidate
+
+
+def test_relevant_count_stops_at_gap_or_window():
+  assert relevant_count([0.9, 0.88, 0.86, 0.6, 0.58]) == 3
+  assert relevant_count([0.9, 0.87, 0.84, 0.81, 0.78, 0.75, 0.72]) == 6
+  assert relevant_count([0.5]) == 1
+  assert relevant_count([]) == 0
+
+
+def test_pack_context_fits_token_budget():
+  candidates = [
+      Candidate(1, 1, 0.10, [1.0, 0.0, 0.0], 500),
+      Candidate(2, 1, 0.11, [0.0, 1.0, 0.0], 600),
+      Candidate(3, 2, 0.12, [0.0, 0.0, 1.0], 300),
+      Candidate(4, 2, 0.60, [0.7, 0.7, 0.0], 10),
+  ]
+  packed = pack_context([1.0, 0.5, 0.5], candidates, token_budget=1000)
+  # 2 does not fit after 1; 3 does.  4 is past the relevance gap.
+  assert [c.id for c in packed] == [1, 3]
+
+
+def test_pack_context_keeps_best_ranked_lexical_hit():
+  candidates = [
+      Candidate(7, 1, 0.70, [0.0, 1.0], 900),
+      Candidate(8, 2, 0.10, [1.0, 0.0], 900),
+  ]
+  packed = pack_context([1.0, 0.0], candidates, token_budget=100)
+  # Either alone overruns the budget; only the first by MMR is taken.
+  assert [c.id for c in packed] == [8]
+  assert {c.id for c in pack_context([1.0, 0.0], candidates, token_budget=2000)} == {7, 8}
+
+
+def test_pack_in_order_takes_at_least_one():
+  chunks = [Candidate(i, 1, None, None, 400) for i in range(4)]
+  assert len(pack_in_order(chunks, token_budget=1000)) == 2
+  assert len(pack_in_order(chunks, token_budget=10)) == 1
@@ -0,0 +1,20 @@
+# query/tests/test_fusion.py
+
+from domifile.query.fusion import reciprocal_rank_fusion
+
+
+def test_items_in_several_rankings_rise():
+  fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"], ["c", "b"]], k=1)
+  assert [item for item, _ in fused] == ["c", "b", "a", "d"]
+  assert fused[0][1] == 1 / 4 + 1 / 2 + 1 / 2
+
+
+def test_key_identifies_items_and_first_occurrence_is_kept():
+  rankings = [[(1, "first")], [(2, "x"), (1, "second")]]
+  fused = reciprocal_rank_fusion(rankings, key=lambda item: item[0])
+  assert [item for item, _ in fused] == [(1, "first"), (2, "x")]
+
+
+def test_empty():
+  assert reciprocal_rank_fusion([]) == []
+  assert reciprocal_rank_fusion([[], []]) == []
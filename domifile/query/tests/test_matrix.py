@@ -0,0 +1,85 @@
+# query/tests/test_matrix.py
+
+import numpy as np
+import pytest
+
+from domifile.query import matrix
+from domifile.query.matrix import EmbeddingSnapshot
+
+
+@pytest.fixture
+def chunks(monkeypatch):
+  """ A fake chunks table: dict of id to embedding. """
+  table = {}
+  fetched = []
+
+  def fetch_chunk_ids():
+    return np.array(sorted(table), dtype=np.int64)
+
+  def fetch_embeddings(chunk_ids):
+    fetched.extend(chunk_ids.tolist())
+    ids = np.array(chunk_ids, dtype=np.int64)
+    return ids, np.array([table[i] for i in ids.tolist()], dtype=np.float32)
+
+  monkeypatch.setattr(matrix, "_fetch_chunk_ids", fetch_chunk_ids)
+  monkeypatch.setattr(matrix, "_fetch_embeddings", fetch_embeddings)
+  return table, fetched
+
+
+def test_search_ranks_by_cosine_similarity(tmp_path, chunks):
+  table, _ = chunks
+  table.update({1: [1, 0, 0], 2: [0, 2, 0], 3: [1, 1, 0], 4: [0, 0, 5]})
+  snapshot = EmbeddingSnapshot(str(tmp_path))
+  snapshot.refresh()
+
+  ids, scores = snapshot.search([0, 1, 0], 3)
+  assert ids.tolist() == [2, 3, 1]
+  assert scores[0] == pytest.approx(1.0)
+  assert scores[1] == pytest.approx(np.sqrt(0.5))
+
+
+def test_refresh_is_incremental(tmp_path, chunks):
+  table, fetched = chunks
+  table.update({1: [1, 0], 2: [0, 1]})
+  snapshot = EmbeddingSnapshot(str(tmp_path), dtype="float16")
+  assert snapshot.refresh() == {"generation": 1, "added": 2, "removed": 0, "total": 2}
+
+  del table[1]
+  table[3] = [1, 1]
+  fetched.clear()
+  assert snapshot.refresh() == {"generation": 2, "added": 1, "removed": 1, "total": 2}
+  assert fetched == [3]
+
+  # Another process sees the new generation on its next search.
+  reader = EmbeddingSnapshot(str(tmp_path), dtype="float16")
+  assert reader.search([1, 0], 2)[0].tolist() == [3, 2]
+  assert sorted(reader.embeddings_for([2, 3, 99])) == [2, 3]
+  assert reader.info()["dtype"] == "float16"
+
+
+def test_unavailable_until_refreshed(tmp_path):
+  snapshot = EmbeddingSnapshot(str(tmp_path / "none"))
+  assert not snapshot.is_available()
+  assert snapshot.embeddings_for([1]) == {}
+
+
+def test_reader_rereads_meta_of_deleted_generation(tmp_path, chunks):
+  table, _ = chunks
+  table.update({1: [1, 0], 2: [0, 1]})
+  snapshot = EmbeddingSnapshot(str(tmp_path))
+  snapshot.refresh()
+  stale_meta = snapshot._read_meta()
+
+  # Two refreshes later, the generation the reader read of is gone.
+  table[3] = [1, 1]
+  snapshot.refresh()
+  del table[1]
+  snapshot.refresh()
+  assert not (tmp_path / stale_meta["ids_file"]).exists()
+
+  reader = EmbeddingSnapshot(str(tmp_path))
+  metas = [stale_meta]
+  read_meta = reader._read_meta
+  reader._read_meta = lambda: metas.pop() if metas else read_meta()
+  assert reader.search([1, 0], 3)[0].tolist() == [3, 2]
+  assert reader.info()["generation"] == 3
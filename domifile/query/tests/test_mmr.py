@@ -0,0 +1,52 @@
+# query/tests/test_mmr.py
+
+from collections import namedtuple
+
+import numpy as np
+
+from domifile.query.mmr import mmr, mmr_indices, normalized_matrix
+
+Row = namedtuple("Row", ["id", "embedding"])
+
+
+def reference_mmr(query_vec, vectors, k, lambda_):
+  """ Straightforward MMR, as formerly implemented with per-pair dot products. """
+  query_vec = query_vec / np.linalg.norm(query_vec)
+  vectors = [v / np.linalg.norm(v) for v in vectors]
+  selected = []
+  candidates = list(range(len(vectors)))
+  while len(selected) < k and candidates:
+    best, best_score = None, -1e9
+    for i in candidates:
+      div = max((np.dot(vectors[i], vectors[s]) for s in selected), default=0)
+      score = lambda_ * np.dot(query_vec, vectors[i]) - (1 - lambda_) * div
+      if score > best_score:
+        best, best_score = i, score
+    selected.append(best)
+    candidates.remove(best)
+  return selected
+
+
+def test_matches_reference():
+  rng = np.random.default_rng(7)
+  query_vec = rng.normal(size=32)
+  vectors = rng.normal(size=(200, 32))
+  for lambda_ in (0.3, 0.7, 1.0):
+    expected = reference_mmr(query_vec, list(vectors), 10, lambda_)
+    assert mmr_indices(query_vec, normalized_matrix(vectors), k=10, lambda_=lambda_) == expected
+
+
+def test_prefers_diverse_rows():
+  rows = [
+      Row(1, [1.0, 0.0, 0.0]),
+      Row(2, [0.99, 0.01, 0.0]),  # Near duplicate of 1
+      Row(3, [0.7, 0.0, 0.7]),
+  ]
+  selected = mmr([1.0, 0.0, 0.1], rows, k=2, lambda_=0.5)
+  assert [r.id for r in selected] == [1, 3]
+
+
+def test_accepts_pgvector_text_and_small_pools():
+  rows = [Row(1, "[1,0]"), Row(2, "[0,1]")]
+  assert [r.id for r in mmr([0, 1], rows, k=4)] == [2, 1]
+  assert mmr([0, 1], [], k=4) == []
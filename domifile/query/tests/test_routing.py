@@ -0,0 +1,127 @@
+# query/tests/test_routing.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import domifile.query as query
+from domifile.query import routing
+from domifile.query.routing import RouteBudgets
+
+
+@pytest.fixture
+def budgets(monkeypatch):
+  monkeypatch.setattr(routing, "_budgets",
+                      RouteBudgets(classify=0.2, structured=0.2, hybrid=0.2, rag=2.0))
+  monkeypatch.setattr(query, "create_embedding", lambda text: [1.0])
+
+
+def test_fact_answer_wins_over_retrieval(monkeypatch, budgets):
+  retrieval_may_finish = threading.Event()
+
+  def slow_retrieval(question, **options):
+    retrieval_may_finish.wait(2)
+    return ["chunk"]
+
+  monkeypatch.setattr(query, "select_chunks", slow_retrieval)
+  monkeypatch.setattr(query, "classify_query", lambda question, qvec: {"type": "structured"})
+  monkeypatch.setattr(query, "_answer_from_facts", lambda question, intent: {"answer": "$120"})
+
+  route = query.route_question("How much was the water bill?")
+  retrieval_may_finish.set()
+  assert route.type == "structured"
+  assert route.result == {"answer": "$120"}
+
+
+def test_missing_fact_answer_falls_back_to_speculative_retrieval(monkeypatch, budgets):
+  retrievals = []
+
+  def retrieval(question, **options):
+    retrievals.append(options)
+    return ["chunk"]
+
+  monkeypatch.setattr(query, "select_chunks", retrieval)
+  monkeypatch.setattr(query, "classify_query", lambda question, qvec: {"type": "hybrid"})
+  monkeypatch.setattr(query, "_answer_from_facts", lambda question, intent: None)
+
+  route = query.route_question("When was the roof fixed and why?")
+  assert route.type == "rag"
+  assert route.chunks == ["chunk"]
+  assert retrievals == [{}]
+
+
+def test_slow_classification_is_taken_as_rag(monkeypatch, budgets):
+  done = threading.Event()
+
+  def slow_classify(question, qvec):
+    done.wait(2)
+    return {"type": "structured"}
+
+  monkeypatch.setattr(query, "select_chunks", lambda question, **options: ["chunk"])
+  monkeypatch.setattr(query, "classify_query", slow_classify)
+
+  route = query.route_question("Who plows?")
+  done.set()
+  assert route.type == "rag"
+  assert route.intent == {"type": "rag"}
+
+
+def test_filters_restart_retrieval(monkeypatch, budgets):
+  retrievals = []
+
+  def retrieval(question, **options):
+    retrievals.append(options)
+    return ["chunk"]
+
+  time_range = {"start": "2024-01-01", "end": "2024-12-31"}
+  monkeypatch.setattr(query, "select_chunks", retrieval)
+  monkeypatch.setattr(query, "classify_query", lambda question, qvec: {
+      "type": "rag",
+      "time_range": time_range
+  })
+
+  route = query.route_question("Who mowed in 2024?")
+  assert route.chunks == ["chunk"]
+  assert {"time_range": time_range} in retrievals
+
+
+def test_configure_route_budgets(monkeypatch):
+
+  class Config:
+    ROUTE_BUDGET_STRUCTURED = "0.5"
+
+  monkeypatch.setattr(routing, "_budgets", routing.DEFAULT_ROUTE_BUDGETS)
+  routing.configure_route_budgets(Config())
+  assert routing.get_route_budgets().structured == 0.5
+  assert routing.get_route_budgets().rag == routing.DEFAULT_ROUTE_BUDGETS.rag
+
+
+def test_slow_retrieval_leaves_no_chunks(monkeypatch, budgets):
+  monkeypatch.setattr(routing, "_budgets",
+                      RouteBudgets(classify=0.2, structured=0.2, hybrid=0.2, rag=0.1))
+  done = threading.Event()
+
+  def slow_retrieval(question, **options):
+    done.wait(2)
+    return ["chunk"]
+
+  monkeypatch.setattr(query, "select_chunks", slow_retrieval)
+  monkeypatch.setattr(query, "classify_query", lambda question, qvec: {"type": "rag"})
+
+  route = query.route_question("Who plows?")
+  done.set()
+  assert route.type == "rag"
+  assert route.chunks == []
+
+
+def test_budget_excludes_time_queued(monkeypatch):
+  monkeypatch.setattr(routing, "_executor", ThreadPoolExecutor(max_workers=1))
+  busy = routing.start(time.sleep, 0.3)
+  queued = routing.start(lambda: "done")
+  assert routing.wait(queued, 0.1) == "done"
+  assert busy.done()
+
+  with pytest.raises(routing.TimeoutError):
+    routing.wait(routing.start(time.sleep, 0.3), 0.05)
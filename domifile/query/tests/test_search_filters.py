@@ -0,0 +1,59 @@
+# query/tests/test_search_filters.py
+
+from datetime import date
+
+from domifile.ingest.doctypes import doc_types_in_category
+from domifile.query.rag import chunk_filter_sql, search_filters_for_intent
+
+
+def test_no_filters():
+  assert chunk_filter_sql() == ("", {})
+  assert chunk_filter_sql(time_range={"start": None, "end": None}) == ("", {})
+
+
+def test_open_ended_time_range():
+  where, params = chunk_filter_sql(time_range={"start": "2025-01-01"})
+  assert "c.coverage_start <= :range_end" in where
+  assert "c.document_date BETWEEN :range_start AND :range_end" in where
+  assert params == {"range_start": date(2025, 1, 1), "range_end": date.max}
+
+
+def test_category_expands_to_doc_types():
+  where, params = chunk_filter_sql(doc_types=["invoice"], category="insurance")
+  assert where == "c.doc_type = ANY(:doc_types)"
+  assert params == {"doc_types": ["invoice", "receipt", "vendor_insurance", "insurance_policy"]}
+
+
+def test_category_matches_doc_type_names_and_category_values():
+  assert doc_types_in_category("utilities") == ["invoice", "receipt", "utility_bill"]
+  assert doc_types_in_category("Snow removal") == ["proposal", "vendor_contract"]
+  assert doc_types_in_category("other") == []
+
+
+def test_time_range_keeps_undated_chunks():
+  where, _ = chunk_filter_sql(time_range={"start": "2025-01-01", "end": "2025-12-31"})
+  assert "OR (c.coverage_start IS NULL AND c.document_date IS NULL)" in where
+
+
+def test_unknown_category_does_not_filter():
+  assert chunk_filter_sql(category="unheard of") == ("", {})
+
+
+def test_filters_for_intent():
+  intent = {
+      "type": "rag",
+      "category": "insurance",
+      "time_range": {
+          "start": "2025-01-01",
+          "end": "2025-12-31"
+      },
+  }
+  assert search_filters_for_intent(intent) == {
+      "category": "insurance",
+      "time_range": {
+          "start": "2025-01-01",
+          "end": "2025-12-31"
+      },
+  }
+  assert search_filters_for_intent({"type": "rag", "category": None}) == {}
+  assert search_filters_for_intent(None) == {}
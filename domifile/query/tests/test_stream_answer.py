@@ -0,0 +1,47 @@
+# query/tests/test_stream_answer.py
+
+import domifile.query as query
+from domifile.query.rag import RetrievedChunk
+
+
+def test_rag_answer_streams_sources_then_deltas(monkeypatch):
+  chunks = [
+      RetrievedChunk("mowing.pdf", "d1", 11, "Green Acres mows weekly.", [1.0]),
+      RetrievedChunk("plowing.pdf", "d2", 12, "Snow Co plows.", [0.0]),
+  ]
+  monkeypatch.setattr(query, "get_answer_cache", lambda: None)
+  monkeypatch.setattr(query, "create_embedding", lambda text: [1.0])
+  monkeypatch.setattr(query, "classify_query", lambda question, qvec: {"type": "rag"})
+  monkeypatch.setattr(query, "select_chunks", lambda question: chunks)
+  monkeypatch.setattr(query, "create_response_stream",
+                      lambda prompt: iter(["Green Acres ", "does it ", "[ 11 ]."]))
+
+  events = list(query.stream_answer("who mows?"))
+
+  assert [name for name, _ in events] == ["route", "sources", "delta", "delta", "delta", "done"]
+  assert events[0][1] == {"type": "rag"}
+  assert [source["id"] for source in events[1][1]] == [11, 12]
+  done = events[-1][1]
+  assert done["answer"] == "Green Acres does it [11]."
+  assert done["citations"] == [11]
+  assert [source["label"] for source in done["sources"]] == ["mowing.pdf"]
+
+
+def test_cached_answer_streams_at_once(monkeypatch):
+
+  class Cache:
+    stored = []
+
+    def log_question(self, question):
+      pass
+
+    def lookup(self, question, qvec):
+      return 3, {"answer": "Green Acres [11].", "sources": [{"id": 11}], "citations": [11]}
+
+  monkeypatch.setattr(query, "get_answer_cache", lambda: Cache())
+  monkeypatch.setattr(query, "create_embedding", lambda text: [1.0])
+
+  events = list(query.stream_answer("landscaping vendor?"))
+  assert [name for name, _ in events] == ["route", "sources", "delta", "done"]
+  assert events[0][1] == {"type": "cached"}
+  assert events[2][1] == {"text": "Green Acres [11]."}
@@ -0,0 +1,42 @@
+# query/tests/test_two_phase_retrieval.py
+
+import numpy as np
+
+from domifile.query import rag
+from domifile.query.context import get_context_token_budget
+
+
+def test_only_selected_candidates_are_loaded(monkeypatch):
+  rng = np.random.default_rng(0)
+  candidates = [rag.Candidate(i, 1, 0.5, rng.normal(size=8), 100) for i in range(40)]
+  loaded = []
+
+  monkeypatch.setattr(rag, "create_embedding", lambda text: rng.normal(size=8))
+  monkeypatch.setattr(rag, "fetch_candidates", lambda qvec, question, **options: candidates)
+
+  def fake_load_chunks(selected):
+    loaded.append([c.id for c in selected])
+    return [rag.RetrievedChunk("f.pdf", "drive-id", c.id, "text", c.embedding) for c in selected]
+
+  monkeypatch.setattr(rag, "load_chunks", fake_load_chunks)
+
+  chunks = rag.select_chunks("question")
+  assert len(loaded) == 1
+  assert 0 < len(loaded[0]) < len(candidates)
+  assert len(loaded[0]) * 100 <= get_context_token_budget()
+  assert [c.id for c in chunks] == loaded[0]
+
+
+def test_filters_relaxed_when_no_candidates(monkeypatch):
+  calls = []
+
+  def fake_fetch(qvec, question, **options):
+    calls.append(options)
+    return [] if "category" in options else [rag.Candidate(1, 1, 0.1, [1.0, 0.0], 50)]
+
+  monkeypatch.setattr(rag, "create_embedding", lambda text: [1.0, 0.0])
+  monkeypatch.setattr(rag, "fetch_candidates", fake_fetch)
+  monkeypatch.setattr(rag, "load_chunks", lambda selected: list(selected))
+
+  assert [c.id for c in rag.select_chunks("q", category="finance", ef_search=80)] == [1]
+  assert calls == [{"category": "finance", "ef_search": 80}, {"ef_search": 80}]
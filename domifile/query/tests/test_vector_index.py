@@ -0,0 +1,93 @@
+# query/tests/test_vector_index.py
+
+import pytest
+from sqlalchemy import create_mock_engine
+
+from domifile.models import Base, Chunk
+from domifile.query import vector_index
+from domifile.query.vector_index import VectorStorage, embedding_index_ddl, ivfflat_lists_for
+
+
+def test_hnsw_ddl():
+  assert embedding_index_ddl(m=24, ef_construction=100) == (
+      "CREATE INDEX IF NOT EXISTS ix_chunks_embedding ON chunks "
+      "USING hnsw (embedding vector_cosine_ops) WITH (m = 24, ef_construction = 100)")
+
+
+def test_ivfflat_ddl_concurrently():
+  assert embedding_index_ddl(
+      method="ivfflat", lists=100, name="ix_new",
+      concurrently=True) == ("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_new ON chunks "
+                             "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)")
+
+
+def test_ivfflat_requires_lists():
+  with pytest.raises(ValueError):
+    embedding_index_ddl(method="ivfflat")
+
+
+def test_ivfflat_lists_for():
+  assert ivfflat_lists_for(500) == 10
+  assert ivfflat_lists_for(200_000) == 200
+  assert ivfflat_lists_for(4_000_000) == 2000
+
+
+def test_truncated_storage_ddl():
+  storage = VectorStorage("truncated", dimensions=256)
+  assert embedding_index_ddl(storage=storage) == (
+      "CREATE INDEX IF NOT EXISTS ix_chunks_embedding_truncated256 ON chunks "
+      "USING hnsw ((subvector(embedding, 1, 256)::halfvec(256)) halfvec_cosine_ops) "
+      "WITH (m = 16, ef_construction = 64)")
+
+
+def test_binary_storage_ddl():
+  ddl = embedding_index_ddl(storage=VectorStorage("binary"))
+  assert "ix_chunks_embedding_binary" in ddl
+  assert "(binary_quantize(embedding)::bit(1536)) bit_hamming_ops" in ddl
+
+
+def test_full_storage_does_not_rescore():
+  storage = VectorStorage()
+  assert storage.candidate_limit(10) == 10
+  assert ":candidate_limit" not in storage.nearest_chunks_sql()
+
+
+def test_compact_storage_rescores_candidates():
+  storage = VectorStorage("half")
+  sql = storage.nearest_chunks_sql("WHERE c.doc_type = 'memo'")
+  assert storage.candidate_limit(10) == 20
+  # Candidates come from the halfvec index; the final order is by exact distance.
+  assert "ORDER BY c.embedding::halfvec(1536) <=> CAST(:qvec AS vector)::halfvec(1536)" in sql
+  assert "LIMIT :candidate_limit" in sql
+  assert sql.rstrip().endswith("ORDER BY distance\n      LIMIT :limit")
+
+
+def test_storage_rejects_bad_dimensions():
+  with pytest.raises(ValueError):
+    VectorStorage("truncated", dimensions=4096)
+
+
+def test_binary_storage_casts_both_sides():
+  storage = VectorStorage("binary", dimensions=256)
+  assert storage.distance_sql() == ("binary_quantize(c.embedding)::bit(256) <~> "
+                                    "binary_quantize(CAST(:qvec AS vector))::bit(256)")
+  assert f"ORDER BY {storage.distance_sql()}" in storage.nearest_chunks_sql()
+
+
+def create_chunks_ddl():
+  statements = []
+
+  def executor(statement, *args, **kwargs):
+    statements.append(str(statement.compile(dialect=engine.dialect)))
+
+  engine = create_mock_engine("postgresql+psycopg://", executor)
+  Base.metadata.create_all(engine, tables=[Chunk.__table__], checkfirst=False)
+  return "\n".join(statements)
+
+
+@pytest.mark.parametrize("mode, full_index", [("full", True), ("half", False), ("binary", False)])
+def test_full_index_only_under_full_storage(monkeypatch, mode, full_index):
+  monkeypatch.setattr(vector_index, "_storage", VectorStorage(mode))
+  ddl = create_chunks_ddl()
+  assert "CREATE TABLE chunks" in ddl
+  assert ("CREATE INDEX ix_chunks_embedding " in ddl) == full_index
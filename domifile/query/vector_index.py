@@ -0,0 +1,368 @@
+# domifile/query/vector_index.py
+import json
+import logging
+import math
+import statistics
+import time
+from sqlalchemy import text
+
+from domifile.models import (EMBEDDING_INDEX_NAME, HNSW_M, HNSW_EF_CONSTRUCTION,
+                             MODEL_VECTOR_SIZE)
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("hnsw", "ivfflat")
+ITERATIVE_SCAN_MODES = ("off", "strict_order", "relaxed_order")
+
+STORAGE_MODES = ("full", "half", "truncated", "binary")
+DEFAULT_TRUNCATED_DIMENSIONS = 512
+
+
+class VectorStorage:
+  """
+    Representation of chunk embeddings in the vector index:
+      * full - the stored vectors (4 bytes/dimension)
+      * half - half precision (2 bytes/dimension)
+      * truncated - the leading dimensions only, half precision; text-embedding-3 embeddings
+        are trained so that their leading dimensions remain meaningful
+      * binary - one bit per dimension, compared by Hamming distance
+    Compact indexes are expression indexes over the full column, which is kept.  Searches over
+    them fetch rescore_factor times the candidates wanted and re-score those exactly.  Under a
+    compact mode, init-db does not create the full index (see models.Chunk); one created
+    before switching modes may be dropped.
+  """
+
+  # Candidates per result fetched from compact indexes for re-scoring.
+  RESCORE_FACTORS = {"full": 1, "half": 2, "truncated": 4, "binary": 10}
+
+  def __init__(self, mode="full", *, dimensions=None, rescore_factor=None):
+    if mode not in STORAGE_MODES:
+      raise ValueError(f"Unknown vector storage mode: {mode}")
+    self.mode = mode
+    self.dimensions = int(
+        dimensions
+        or (DEFAULT_TRUNCATED_DIMENSIONS if mode == "truncated" else MODEL_VECTOR_SIZE))
+    if not 0 < self.dimensions <= MODEL_VECTOR_SIZE:
+      raise ValueError(f"Dimensions must be in 1..{MODEL_VECTOR_SIZE}")
+    self.rescore_factor = rescore_factor or self.RESCORE_FACTORS[mode]
+
+  def __repr__(self):
+    return f"VectorStorage({self.mode!r}, dimensions={self.dimensions})"
+
+  @property
+  def rescores(self):
+    return self.mode != "full"
+
+  @property
+  def index_name(self):
+    if self.mode == "full":
+      return EMBEDDING_INDEX_NAME
+    if self.mode == "truncated":
+      return f"{EMBEDDING_INDEX_NAME}_truncated{self.dimensions}"
+    return f"{EMBEDDING_INDEX_NAME}_{self.mode}"
+
+  def index_column(self):
+    """ Indexed expression and operator class. """
+    n = self.dimensions
+    if self.mode == "full":
+      return "embedding", "vector_cosine_ops"
+    if self.mode == "half":
+      return f"(embedding::halfvec({n}))", "halfvec_cosine_ops"
+    if self.mode == "truncated":
+      return f"(subvector(embedding, 1, {n})::halfvec({n}))", "halfvec_cosine_ops"
+    return f"(binary_quantize(embedding)::bit({n}))", "bit_hamming_ops"
+
+  def distance_sql(self, qvec_param=":qvec"):
+    """ Distance expression between chunk c and the query, matching the index expression. """
+    n = self.dimensions
+    qvec = f"CAST({qvec_param} AS vector)"
+    if self.mode == "full":
+      return f"c.embedding <=> {qvec}"
+    if self.mode == "half":
+      return f"c.embedding::halfvec({n}) <=> {qvec}::halfvec({n})"
+    if self.mode == "truncated":
+      return (f"subvector(c.embedding, 1, {n})::halfvec({n}) "
+              f"<=> subvector({qvec}, 1, {n})::halfvec({n})")
+    return f"binary_quantize(c.embedding)::bit({n}) <~> binary_quantize({qvec})::bit({n})"
+
+  def nearest_chunks_sql(self, where_sql=""):
+    """
+      SELECT of (id, distance) of the :limit chunks nearest :qvec, nearest first, distance
+      being exact cosine distance.  For compact storage, :candidate_limit chunks are taken from
+      the compact index and re-scored.
+    """
+    if not self.rescores:
+      return f"""
+        SELECT c.id, c.embedding <=> CAST(:qvec AS vector) AS distance
+        FROM chunks c
+        {where_sql}
+        ORDER BY distance
+        LIMIT :limit
+      """
+    return f"""
+      SELECT c.id, c.embedding <=> CAST(:qvec AS vector) AS distance
+      FROM (
+        SELECT c.id, c.embedding
+        FROM chunks c
+        {where_sql}
+        ORDER BY {self.distance_sql()}
+        LIMIT :candidate_limit
+      ) c
+      ORDER BY distance
+      LIMIT :limit
+    """
+
+  def candidate_limit(self, limit):
+    return limit * self.rescore_factor
+
+
+_storage = VectorStorage()
+
+
+def configure_vector_storage(config):
+  """ Select the index searched, per config.VECTOR_STORAGE and VECTOR_STORAGE_DIMENSIONS. """
+  global _storage
+  _storage = VectorStorage(getattr(config, "VECTOR_STORAGE", None) or "full",
+                           dimensions=getattr(config, "VECTOR_STORAGE_DIMENSIONS", None))
+
+
+def get_vector_storage():
+  return _storage
+
+
+def ivfflat_lists_for(row_count):
+  """ pgvector's rule of thumb: rows / 1000 up to a million rows, sqrt(rows) beyond. """
+  if row_count <= 1_000_000:
+    return max(row_count // 1000, 10)
+  return int(math.sqrt(row_count))
+
+
+def embedding_index_ddl(*,
+                        method="hnsw",
+                        storage=None,
+                        name=None,
+                        m=HNSW_M,
+                        ef_construction=HNSW_EF_CONSTRUCTION,
+                        lists=None,
+                        concurrently=False):
+  """ CREATE INDEX statement for a chunk embedding index. """
+  storage = storage or VectorStorage()
+  if method == "hnsw":
+    params = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+  elif method == "ivfflat":
+    if not lists:
+      raise ValueError("ivfflat requires lists")
+    params = f"lists = {int(lists)}"
+  else:
+    raise ValueError(f"Unknown index method: {method}")
+  column, opclass = storage.index_column()
+  return (f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+          f"{name or storage.index_name} "
+          f"ON chunks USING {method} ({column} {opclass}) WITH ({params})")
+
+
+def tune_vector_search(db_session, *, ef_search=None, probes=None, iterative_scan=None):
+  """
+    Set per-query recall of the embedding index for the current transaction.  ef_search
+    applies to HNSW (size of the candidate list; default 40), probes to IVFFlat (number of
+    lists scanned; default 1).  Higher values trade latency for recall.
+
+    iterative_scan ("strict_order" or "relaxed_order"; pgvector 0.8+) makes a filtered index
+    scan keep going until enough rows pass the filter, instead of filtering a fixed number of
+    candidates after the fact.
+  """
+  if ef_search is not None:
+    db_session.execute(text("SELECT set_config('hnsw.ef_search', :value, true)"),
+                       {"value": str(int(ef_search))})
+  if probes is not None:
+    db_session.execute(text("SELECT set_config('ivfflat.probes', :value, true)"),
+                       {"value": str(int(probes))})
+  if iterative_scan is not None:
+    if iterative_scan not in ITERATIVE_SCAN_MODES:
+      raise ValueError(f"Unknown iterative scan mode: {iterative_scan}")
+    for setting in ("hnsw.iterative_scan", "ivfflat.iterative_scan"):
+      db_session.execute(text("SELECT set_config(:setting, :value, true)"), {
+          "setting": setting,
+          "value": iterative_scan
+      })
+
+
+def _autocommit_connection():
+  # Concurrent index builds cannot run inside a transaction block.
+  from domifile.db import DatabaseRegistry
+  from domifile.models import Chunk
+
+  engine = DatabaseRegistry.instance().session_for(Chunk).get_bind()
+  return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def _set_build_memory(conn, maintenance_work_mem):
+  # An HNSW build is much faster when the graph fits in maintenance_work_mem.
+  if maintenance_work_mem:
+    conn.execute(text("SELECT set_config('maintenance_work_mem', :value, false)"),
+                 {"value": maintenance_work_mem})
+
+
+def _resolve_lists(conn, method, lists):
+  if method == "ivfflat" and not lists:
+    row_count = conn.execute(text("SELECT count(*) FROM chunks")).scalar()
+    lists = ivfflat_lists_for(row_count)
+  return lists
+
+
+def create_embedding_index(*,
+                           method="hnsw",
+                           storage=None,
+                           m=HNSW_M,
+                           ef_construction=HNSW_EF_CONSTRUCTION,
+                           lists=None,
+                           concurrently=False,
+                           maintenance_work_mem=None):
+  """ Create a chunk embedding index, unless it exists.  Returns the statement run. """
+  with _autocommit_connection() as conn:
+    _set_build_memory(conn, maintenance_work_mem)
+    ddl = embedding_index_ddl(method=method,
+                              storage=storage,
+                              m=m,
+                              ef_construction=ef_construction,
+                              lists=_resolve_lists(conn, method, lists),
+                              concurrently=concurrently)
+    logger.info(ddl)
+    conn.execute(text(ddl))
+    return ddl
+
+
+def rebuild_embedding_index(*,
+                            method=None,
+                            storage=None,
+                            m=HNSW_M,
+                            ef_construction=HNSW_EF_CONSTRUCTION,
+                            lists=None,
+                            maintenance_work_mem=None):
+  """
+    Rebuild a chunk embedding index without blocking writes.  Without a method, the index
+    is reindexed as is.  With one, a replacement index is built alongside the current one,
+    which is then dropped, so that searches keep an index throughout.
+  """
+  storage = storage or VectorStorage()
+  with _autocommit_connection() as conn:
+    _set_build_memory(conn, maintenance_work_mem)
+    if method is None:
+      ddl = f"REINDEX INDEX CONCURRENTLY {storage.index_name}"
+      logger.info(ddl)
+      conn.execute(text(ddl))
+      return [ddl]
+
+    new_name = f"{storage.index_name}_new"
+    statements = [
+        f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}",  # Left over from a failed rebuild
+        embedding_index_ddl(method=method,
+                            storage=storage,
+                            name=new_name,
+                            m=m,
+                            ef_construction=ef_construction,
+                            lists=_resolve_lists(conn, method, lists),
+                            concurrently=True),
+        f"DROP INDEX CONCURRENTLY IF EXISTS {storage.index_name}",
+        f"ALTER INDEX {new_name} RENAME TO {storage.index_name}",
+    ]
+    for ddl in statements:
+      logger.info(ddl)
+      conn.execute(text(ddl))
+    return statements
+
+
+def inspect_embedding_index(storage=None):
+  """ Describe a chunk embedding index, or return None if it does not exist. """
+  storage = storage or VectorStorage()
+  with _autocommit_connection() as conn:
+    row = conn.execute(
+        text("""
+      SELECT i.indexrelid::regclass::text AS name,
+             pg_get_indexdef(i.indexrelid) AS definition,
+             am.amname AS method,
+             i.indisvalid AS valid,
+             pg_relation_size(i.indexrelid) AS size_bytes,
+             pg_size_pretty(pg_relation_size(i.indexrelid)) AS size,
+             s.idx_scan AS scans,
+             (SELECT count(*) FROM chunks) AS chunks
+      FROM pg_index i
+      JOIN pg_class c ON c.oid = i.indexrelid
+      JOIN pg_am am ON am.oid = c.relam
+      LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = i.indexrelid
+      WHERE c.relname = :name
+    """), {
+            "name": storage.index_name
+        }).mappings().first()
+    if row is None:
+      return None
+    settings = conn.execute(
+        text("""
+      SELECT current_setting('hnsw.ef_search', true) AS ef_search,
+             current_setting('ivfflat.probes', true) AS probes
+    """)).mappings().first()
+    return {**row, **settings}
+
+
+def benchmark_vector_storage(storages, *, queries=50, k=10, ef_search=None):
+  """
+    Measure each storage mode against exact search.  Query vectors are the embeddings of a
+    random sample of chunks.  Returns, per mode, recall@k, latency (mean and p95, ms) and the
+    size of its index (None if it has not been created, in which case the search is a scan).
+  """
+  from domifile.db import db_transaction
+  from domifile.models import Chunk
+
+  with db_transaction(Chunk) as db_session:
+    sample = db_session.execute(
+        text("SELECT embedding::text FROM chunks ORDER BY random() LIMIT :queries"), {
+            "queries": queries
+        }).scalars().all()
+    qvecs = [json.loads(v) for v in sample]
+
+    # Ground truth: exact search, with index scans disabled.
+    db_session.execute(text("SELECT set_config('enable_indexscan', 'off', true)"))
+    exact_sql = text(VectorStorage().nearest_chunks_sql())
+    truth = [
+        set(db_session.execute(exact_sql, {
+            "qvec": qvec,
+            "limit": k
+        }).scalars()) for qvec in qvecs
+    ]
+
+  results = []
+  for storage in storages:
+    sql = text(storage.nearest_chunks_sql())
+    candidate_limit = storage.candidate_limit(k)
+    latencies = []
+    hits = 0
+    with db_transaction(Chunk) as db_session:
+      tune_vector_search(db_session, ef_search=ef_search or max(candidate_limit, 40))
+      for qvec, expected in zip(qvecs, truth):
+        started = time.perf_counter()
+        found = db_session.execute(sql, {
+            "qvec": qvec,
+            "limit": k,
+            "candidate_limit": candidate_limit
+        }).scalars().all()
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(expected.intersection(found))
+    index = inspect_embedding_index(storage)
+    results.append({
+        "storage": storage.mode,
+        "dimensions": storage.dimensions,
+        "rescore_factor": storage.rescore_factor,
+        "recall": hits / max(sum(len(t) for t in truth), 1),
+        "latency_ms_mean": statistics.fmean(latencies) if latencies else None,
+        "latency_ms_p95": _percentile(latencies, 95),
+        "index": index["name"] if index else None,
+        "index_size_bytes": index["size_bytes"] if index else None,
+    })
+  return results
+
+
+def _percentile(values, percent):
+  if not values:
+    return None
+  values = sorted(values)
+  return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
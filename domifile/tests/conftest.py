@@ -0,0 +1,5 @@
+# tests/conftest.py
+import os
+
+# The OpenAI client is constructed on import; tests never call it.
+os.environ.setdefault("OPENAI_API_KEY", "test")
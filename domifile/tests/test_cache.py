@@ -0,0 +1,88 @@
+# tests/test_cache.py
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from domifile.cache import (RESPONSE_DB_PURGE_INTERVAL, EmbeddingCache, LRUCache, ResponseCache,
+                            text_hash)
+
+
+def test_lru_evicts_least_recently_used():
+  cache = LRUCache(2)
+  cache.put("a", 1)
+  cache.put("b", 2)
+  assert cache.get("a") == 1
+  cache.put("c", 3)
+  assert cache.get("b") is None
+  assert cache.get("a") == 1
+  assert cache.get("c") == 3
+
+
+def test_lru_expires_entries(monkeypatch):
+  now = [100.0]
+  monkeypatch.setattr("domifile.cache.time.monotonic", lambda: now[0])
+  cache = LRUCache(10, ttl=5)
+  cache.put("a", 1)
+  now[0] += 4
+  assert cache.get("a") == 1
+  now[0] += 2
+  assert cache.get("a") is None
+  assert len(cache) == 0
+
+
+def test_text_hash_ignores_whitespace():
+  assert text_hash("Invoice  total\n$100 ") == text_hash("Invoice total $100")
+  assert text_hash("Invoice total $100") != text_hash("invoice total $100")
+
+
+def test_embedding_cache_counts_hits_and_misses():
+  cache = EmbeddingCache()
+  cache.put_many("m", {"k1": [1.0]}, persistent=False)
+  assert cache.get_many("m", ["k1", "k2"], persistent=False) == {"k1": [1.0]}
+  assert cache.get_many("other", ["k1"], persistent=False) == {}
+  assert cache.stats.snapshot() == {"memory_hits": 1, "memory_misses": 2}
+
+
+def test_response_cache_keys_by_version():
+  cache = ResponseCache()
+  key = cache.key_for("m", "v1", "prompt")
+  cache.put(key, "answer", model="m", version="v1", persistent=False)
+  assert cache.get(key, persistent=False) == "answer"
+  assert cache.get(cache.key_for("m", "v2", "prompt"), persistent=False) is None
+  assert cache.stats.snapshot() == {"memory_hits": 1, "memory_misses": 1}
+
+
+def test_response_cache_ignores_expired_db_entries(monkeypatch):
+  now = datetime.now(timezone.utc)
+  entries = {
+      "live": SimpleNamespace(response="a", expires_at=now + timedelta(hours=1)),
+      "expired": SimpleNamespace(response="b", expires_at=now - timedelta(seconds=1)),
+      "unbounded": SimpleNamespace(response="c", expires_at=None),
+  }
+
+  @contextmanager
+  def db_transaction(model):
+    yield SimpleNamespace(get=lambda model, key: entries.get(key))
+
+  monkeypatch.setattr("domifile.db.db_transaction", db_transaction)
+  cache = ResponseCache()
+  assert cache.get("live", persistent=True) == "a"
+  assert cache.get("expired", persistent=True) is None
+  assert cache.get("unbounded", persistent=True) == "c"
+
+
+def test_response_cache_purges_expired_periodically(monkeypatch):
+  now = [1000.0]
+  purges = []
+  monkeypatch.setattr("domifile.cache.time.monotonic", lambda: now[0])
+  monkeypatch.setattr(ResponseCache, "_db_put", lambda self, *args, **kwargs: None)
+  monkeypatch.setattr(ResponseCache, "purge_expired", staticmethod(lambda: purges.append(now[0])))
+
+  cache = ResponseCache()
+  for _ in range(3):
+    cache.put("k", "r", model="m", version="v", persistent=True)
+  now[0] += RESPONSE_DB_PURGE_INTERVAL
+  cache.put("k", "r", model="m", version="v", persistent=True)
+  cache.put("k", "r", model="m", version="v", persistent=False)
+  assert purges == [1000.0, 1000.0 + RESPONSE_DB_PURGE_INTERVAL]
@@ -0,0 +1,51 @@
+# tests/test_openai_adapter.py
+
+from types import SimpleNamespace
+
+import pytest
+
+from domifile import openai_adapter
+from domifile.cache import EmbeddingCache
+from domifile.openai_adapter import batch_embedding_inputs, create_embeddings
+
+
+def batch_sizes(inputs):
+  return [len(batch) for batch in batch_embedding_inputs(inputs)]
+
+
+def test_batches_respect_input_count_limit(monkeypatch):
+  monkeypatch.setattr(openai_adapter, "MAX_EMBEDDING_INPUTS_PER_REQUEST", 2048)
+  assert batch_sizes(["x"] * 5000) == [2048, 2048, 904]
+
+
+def test_batches_respect_request_token_limit(monkeypatch):
+  monkeypatch.setattr(openai_adapter, "MAX_EMBEDDING_TOKENS_PER_REQUEST", 100)
+  # Each input estimates to 30 tokens.
+  assert batch_sizes(["x" * 87] * 7) == [3, 3, 1]
+
+
+def test_overlong_input_is_rejected():
+  too_long = "x" * (openai_adapter.MAX_EMBEDDING_TOKENS_PER_INPUT * 3)
+  with pytest.raises(ValueError, match="input 1"):
+    list(batch_embedding_inputs(["ok", too_long]))
+
+
+def test_embeddings_keep_input_order_across_batches(monkeypatch):
+  requests = []
+
+  def create(model, input):
+    requests.append(list(input))
+    # The endpoint may return items in any order; each carries its index.
+    data = [SimpleNamespace(index=i, embedding=[float(text[1:])]) for i, text in enumerate(input)]
+    return SimpleNamespace(data=data[::-1])
+
+  monkeypatch.setattr(openai_adapter, "openai",
+                      SimpleNamespace(embeddings=SimpleNamespace(create=create)))
+  monkeypatch.setattr(openai_adapter, "embedding_cache", EmbeddingCache())
+  monkeypatch.setattr(openai_adapter, "MAX_EMBEDDING_INPUTS_PER_REQUEST", 3)
+
+  inputs = [f"t{n}" for n in range(8)] + ["t2"]
+  embeddings = create_embeddings(inputs, persistent_cache=False)
+
+  assert [len(request) for request in requests] == [3, 3, 2]
+  assert embeddings == [[float(n)] for n in range(8)] + [[2.0]]